@@ -59,6 +59,16 @@ unsigned long tiempoUltimoEnvioDatos = 0;
 bool solicitarLecturaRfidActiva = false;
 bool uidEnviadoDesdeUltimaSolicitud = false;
 
+// Protocolo binario (se activa si Python envía COMANDO:PROTOCOLO_BINARIO tras ARDUINO_LISTO)
+// Trama: 0xA5 | tipo | longitud | carga | CRC-8 (ver v1.3/protocolo_serial.py)
+const byte BYTE_SINCRONISMO = 0xA5;
+const byte TIPO_TRAMA_DATOS = 0x01;
+const byte LARGO_MAX_UID = 10;
+const byte LARGO_CARGA_DATOS = 6 + LARGO_MAX_UID;
+bool modoBinario = false;
+byte uidBytes[LARGO_MAX_UID];
+byte largoUid = 0;
+
 // Para parpadeo de LED Rojo comandado por Python
 bool ledRojoParpadeando = false;
 int contadorParpadeosLedRojo = 0;
@@ -174,7 +184,11 @@ String leerUidRfid() {
   }
 
   String uidStr = "";
+  largoUid = min(rfid.uid.size, LARGO_MAX_UID);
   for (byte i = 0; i < rfid.uid.size; i++) {
+    if (i < largoUid) {
+      uidBytes[i] = rfid.uid.uidByte[i];
+    }
     if (rfid.uid.uidByte[i] < 0x10) {
       uidStr += "0";
     }
@@ -200,6 +214,11 @@ void enviarDatosAPython() {
     }
   }
   
+  if (modoBinario) {
+    enviarTramaDatos(distSp1, distSp2, rfidUid != "NADA");
+    return;
+  }
+
   String paqueteDatos = "DATOS;";
   paqueteDatos += "SP1:" + String(distSp1, 1) + ";";
   paqueteDatos += "SP2:" + String(distSp2, 1) + ";";
@@ -211,6 +230,40 @@ void enviarDatosAPython() {
   Serial.println(paqueteDatos);
 }
 
+byte crc8(const byte* datos, byte largo) {
+  byte crc = 0;
+  for (byte i = 0; i < largo; i++) {
+    crc ^= datos[i];
+    for (byte b = 0; b < 8; b++) {
+      crc = (crc & 0x80) ? (byte)((crc << 1) ^ 0x07) : (byte)(crc << 1);
+    }
+  }
+  return crc;
+}
+
+void escribirUint16(byte* destino, float distancia) {
+  unsigned int decimas = (unsigned int)min(distancia * 10.0 + 0.5, 65535.0);
+  destino[0] = decimas & 0xFF;        // little-endian
+  destino[1] = (decimas >> 8) & 0xFF;
+}
+
+void enviarTramaDatos(float distSp1, float distSp2, bool hayUid) {
+  byte trama[3 + LARGO_CARGA_DATOS + 1] = {0};
+  trama[0] = BYTE_SINCRONISMO;
+  trama[1] = TIPO_TRAMA_DATOS;
+  trama[2] = LARGO_CARGA_DATOS;
+  byte* carga = trama + 3;
+  escribirUint16(carga, distSp1);
+  escribirUint16(carga + 2, distSp2);
+  carga[4] = (estadoInterruptorS1 ? 1 : 0) | (estadoInterruptorS2 ? 2 : 0) | (estadoInterruptorEmergencia ? 4 : 0);
+  carga[5] = hayUid ? largoUid : 0;
+  for (byte i = 0; i < carga[5]; i++) {
+    carga[6 + i] = uidBytes[i];
+  }
+  trama[3 + LARGO_CARGA_DATOS] = crc8(trama + 1, 2 + LARGO_CARGA_DATOS);
+  Serial.write(trama, sizeof(trama));
+}
+
 void manejarComandosPython() {
   if (Serial.available() > 0) {
     String comandoCompleto = Serial.readStringUntil('\n');
@@ -253,6 +306,10 @@ void manejarComandosPython() {
         solicitarLecturaRfidActiva = true;
         uidEnviadoDesdeUltimaSolicitud = false; 
       }
+      else if (comando == "PROTOCOLO_BINARIO") {
+        Serial.println("PROTOCOLO_BINARIO_OK"); // Último mensaje antes de pasar a tramas binarias
+        modoBinario = true;
+      }
     }
   }
 }
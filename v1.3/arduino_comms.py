@@ -5,6 +5,7 @@ import threading
 from tkinter import messagebox # Para mostrar errores de conexión si app_gui está disponible
 
 import constants # Importar el módulo de constantes
+import protocolo_serial
 
 # --- Variables Globales del Módulo ---
 # Estas variables mantendrán el estado de la conexión y los datos del hardware.
@@ -24,6 +25,9 @@ datos_hardware = {
     "ultimo_rfid_procesado_para_acceso": "NADA" # Usado por la máquina de estados
 }
 
+protocolo_arduino = "texto" # "texto" o "binario", negociado al conectar
+parser_datos_arduino = protocolo_serial.ParserTexto() # Parser del protocolo negociado
+
 hilo_listener_arduino = None # Referencia al objeto Thread del listener
 hilo_listener_arduino_activo = False # Flag para controlar el bucle del listener
 
@@ -36,6 +40,12 @@ ui_queue = None # <-- Cola para enviar actualizaciones a la GUI
 
 # --- Constantes del Módulo (ahora desde constants.py) ---
 # VELOCIDAD_ARDUINO y TIMEOUT_SERIAL se obtienen de constants.py
+# Las lecturas son bloqueantes con TIMEOUT_SERIAL: el hilo duerme hasta que llega el primer byte
+# (sin sondear in_waiting ni dormir entre intentos) y luego recoge de una vez lo ya recibido
+# en buffer_lectura_serial, reservado una sola vez.
+TAMANO_BUFFER_LECTURA_SERIAL = 4096
+buffer_lectura_serial = bytearray(TAMANO_BUFFER_LECTURA_SERIAL)
+vista_lectura_serial = memoryview(buffer_lectura_serial)
 
 def asignar_cola_ui(q):
     """Inyecta la cola de comunicación con la GUI."""
@@ -68,33 +78,16 @@ def conectar_a_arduino(puerto_seleccionado_str):
     try:
         print(f"Intentando conectar a Arduino en {puerto_seleccionado_str}...")
         arduino_serial = serial.Serial(puerto_seleccionado_str, constants.VELOCIDAD_ARDUINO, timeout=constants.TIMEOUT_SERIAL)
-        time.sleep(2) # Esperar a que Arduino se reinicie y esté listo
         
-        # Enviar un byte de "ping" o esperar "ARDUINO_LISTO"
-        # arduino_serial.write(b'P') # Ejemplo de ping si Arduino lo espera
-        timeout_inicio = time.time()
-        arduino_listo_recibido = False
-        buffer_entrada = ""
-
-        while time.time() - timeout_inicio < 5: # Timeout de 5 segundos para ARDUINO_LISTO
-            if arduino_serial.in_waiting > 0:
-                try:
-                    byte_leido = arduino_serial.read(1)
-                    char_leido = byte_leido.decode('utf-8', errors='ignore')
-                    buffer_entrada += char_leido
-                    if "ARDUINO_LISTO" in buffer_entrada:
-                        arduino_listo_recibido = True
-                        break
-                    if '\n' in buffer_entrada: # Limpiar buffer si no es ARDUINO_LISTO
-                        buffer_entrada = buffer_entrada.split('\n', 1)[-1] 
-                except Exception as e_decode:
-                    print(f"Error decodificando respuesta inicial de Arduino: {e_decode}")
-                    buffer_entrada = "" # Limpiar buffer en error
-            time.sleep(0.05)
+        # Esperar "ARDUINO_LISTO": el Arduino se reinicia al abrir el puerto y lo envía al
+        # terminar setup(), así que no hace falta una pausa fija antes de leer.
+        resto_tras_listo = esperar_linea_arduino("ARDUINO_LISTO", constants.TIMEOUT_ARDUINO_LISTO_S)
+        arduino_listo_recibido = resto_tras_listo is not None
 
         if arduino_listo_recibido:
+            negociar_protocolo_arduino(resto_tras_listo)
             arduino_conectado = True
-            print(f"Arduino conectado y LISTO en {puerto_seleccionado_str}.")
+            print(f"Arduino conectado y LISTO en {puerto_seleccionado_str} (protocolo {protocolo_arduino}).")
             return True
         else:
             print(f"Error: No se recibió 'ARDUINO_LISTO' de Arduino en {puerto_seleccionado_str} dentro del timeout.")
@@ -115,6 +108,80 @@ def conectar_a_arduino(puerto_seleccionado_str):
         arduino_conectado = False
         return False
 
+def leer_bloque_arduino():
+    """
+    Espera (como mucho el timeout del puerto) a que haya datos y copia en vista_lectura_serial
+    todo lo ya recibido. Devuelve el número de bytes leídos (0 si venció el timeout).
+    """
+    n = min(max(1, arduino_serial.in_waiting), TAMANO_BUFFER_LECTURA_SERIAL)
+    return arduino_serial.readinto(vista_lectura_serial[:n]) or 0
+
+def esperar_linea_arduino(texto, limite_s, pendiente=b""):
+    """
+    Lee bloques hasta recibir una línea que contenga 'texto' o agotar 'limite_s' segundos.
+    Devuelve los bytes recibidos después de esa línea (pueden ser ya datos o tramas) o None.
+    'pendiente' son bytes leídos antes que aún no se han revisado.
+    """
+    buffer_entrada = bytearray(pendiente)
+    esperado = texto.encode('utf-8')
+    limite = time.time() + limite_s
+    while True:
+        fin_linea = buffer_entrada.find(b'\n')
+        while fin_linea >= 0:
+            if esperado in buffer_entrada[:fin_linea]:
+                return bytes(buffer_entrada[fin_linea + 1:])
+            del buffer_entrada[:fin_linea + 1] # Descartar líneas que no son la esperada
+            fin_linea = buffer_entrada.find(b'\n')
+        if time.time() >= limite:
+            return None
+        n = leer_bloque_arduino()
+        if len(buffer_entrada) + n > TAMANO_BUFFER_LECTURA_SERIAL:
+            buffer_entrada.clear() # Basura sin saltos de línea (p. ej. velocidad incorrecta)
+        buffer_entrada += vista_lectura_serial[:n]
+
+def negociar_protocolo_arduino(pendiente=b""):
+    """
+    Tras ARDUINO_LISTO pide las tramas binarias de protocolo_serial.py. Un firmware que no
+    las conoce ignora el comando y no responde: se sigue con el protocolo de texto.
+    'pendiente' son los bytes leídos tras ARDUINO_LISTO.
+    """
+    global protocolo_arduino, parser_datos_arduino
+    protocolo_arduino, parser_datos_arduino = "texto", protocolo_serial.ParserTexto()
+    if not constants.USAR_PROTOCOLO_BINARIO_ARDUINO:
+        aplicar_lecturas_arduino(parser_datos_arduino.alimentar(pendiente))
+        return
+    arduino_serial.write(f"COMANDO:{protocolo_serial.COMANDO_PROTOCOLO_BINARIO}\n".encode('utf-8'))
+    timeout_original = arduino_serial.timeout
+    arduino_serial.timeout = constants.TIMEOUT_NEGOCIACION_PROTOCOLO_S
+    try:
+        # Mientras tanto pueden llegar líneas DATOS de texto; se descartan.
+        resto = esperar_linea_arduino(protocolo_serial.RESPUESTA_PROTOCOLO_BINARIO, constants.TIMEOUT_NEGOCIACION_PROTOCOLO_S, pendiente)
+    finally:
+        arduino_serial.timeout = timeout_original
+    if resto is None:
+        print("Arduino sin soporte de tramas binarias; se usa el protocolo de texto.")
+        return
+    protocolo_arduino, parser_datos_arduino = "binario", protocolo_serial.ParserBinario()
+    # Lo leído tras la respuesta ya son tramas binarias
+    aplicar_lecturas_arduino(parser_datos_arduino.alimentar(resto))
+
+def aplicar_lecturas_arduino(lecturas):
+    """Vuelca en datos_hardware las lecturas (sp1, sp2, s1, s2, e, uid) de los parsers y avisa a la GUI."""
+    for sp1, sp2, s1, s2, e, uid in lecturas:
+        with lock_datos_hardware:
+            datos_hardware["sp1_distancia"] = sp1
+            datos_hardware["sp2_distancia"] = sp2
+            datos_hardware["s1_estado"] = s1
+            datos_hardware["s2_estado"] = s2
+            datos_hardware["e_estado"] = e
+            # La lógica de la máquina de estados maneja "NADA".
+            datos_hardware["rfid_uid"] = uid
+            if ui_queue:
+                ui_queue.put({
+                    "type": "hw_update",
+                    "data": datos_hardware.copy()
+                })
+
 def enviar_comando_a_arduino(comando_str):
     """Envía un comando formateado a Arduino si está conectado."""
     global arduino_conectado, arduino_serial
@@ -139,7 +206,6 @@ def escuchar_datos_arduino():
     global arduino_conectado, hilo_listener_arduino_activo, datos_hardware, lock_datos_hardware, arduino_serial
     
     print("Hilo listener de Arduino iniciado.")
-    buffer_parcial = "" # Para manejar líneas incompletas
 
     while hilo_listener_arduino_activo:
         if not arduino_conectado or not arduino_serial or not arduino_serial.is_open:
@@ -148,56 +214,21 @@ def escuchar_datos_arduino():
             continue # Volver al inicio del bucle while
 
         try:
-            if arduino_serial.in_waiting > 0:
-                # Leer todos los bytes disponibles para evitar llenar el buffer de entrada
-                bytes_recibidos = arduino_serial.read(arduino_serial.in_waiting)
-                lineas_recibidas_str = bytes_recibidos.decode('utf-8', errors='replace')
-                
-                # Procesar el buffer parcial más los nuevos datos
-                datos_completos = buffer_parcial + lineas_recibidas_str
-                lineas_a_procesar = datos_completos.split('\n')
-
-                # El último elemento podría ser una línea incompleta, guardarla para el próximo ciclo
-                buffer_parcial = lineas_a_procesar.pop() if not datos_completos.endswith('\n') else ""
-                
-                for linea_str in lineas_a_procesar:
-                    linea_str = linea_str.strip() # Quitar \r si existe
-                    if linea_str and linea_str.startswith("DATOS;"):
-                        # print(f"ARD->PY (Línea procesada): {linea_str}") # Debug
-                        partes = linea_str.split(';')
-                        if len(partes) == 7: 
-                            with lock_datos_hardware:
-                                try:
-                                    datos_hardware["sp1_distancia"] = float(partes[1].split(':')[1])
-                                    datos_hardware["sp2_distancia"] = float(partes[2].split(':')[1])
-                                    datos_hardware["s1_estado"] = int(partes[3].split(':')[1]) 
-                                    datos_hardware["s2_estado"] = int(partes[4].split(':')[1]) 
-                                    datos_hardware["e_estado"] = int(partes[5].split(':')[1])   
-                                    # Solo actualizar rfid_uid si es diferente de NADA,
-                                    # o si queremos que NADA limpie el valor anterior.
-                                    # La lógica actual de la máquina de estados maneja "NADA".
-                                    datos_hardware["rfid_uid"] = partes[6].split(':')[1] 
-
-                                    # ¡NUEVO! Poner los datos en la cola para la GUI
-                                    if ui_queue:
-                                        ui_queue.put({
-                                            "type": "hw_update",
-                                            "data": datos_hardware.copy()
-                                        })
-
-                                except (ValueError, IndexError) as e: 
-                                    print(f"Error de parseo en datos de Arduino: {e} -> Línea: {linea_str}")
-                        # else:
-                            # print(f"Paquete de datos malformado (no 7 partes): {linea_str}")
-                    # elif linea_str: # Otros mensajes de Arduino (ej: INFO)
-                        # print(f"ARD->PY (Otro): {linea_str}")
-            else:
-                time.sleep(0.01) # Pequeña pausa si no hay datos para no consumir 100% CPU
+            # Bloquea hasta que llegan datos (o vence TIMEOUT_SERIAL para revisar el flag del bucle)
+            n = leer_bloque_arduino()
+            if n:
+                # Texto o binario según lo negociado en conectar_a_arduino(); el parser copia o
+                # decodifica el bloque y guarda la línea o trama incompleta para el siguiente.
+                aplicar_lecturas_arduino(parser_datos_arduino.alimentar(vista_lectura_serial[:n]))
 
         except serial.SerialException as se:
+            if not hilo_listener_arduino_activo:
+                break # Puerto cerrado por una desconexión manual mientras se leía
             print(f"Error SerialException en listener: {se}. Marcando como desconectado.")
             desconectar_arduino_emergencia()
         except IOError as ioe: # Podría ocurrir si el puerto se cierra abruptamente
+             if not hilo_listener_arduino_activo:
+                 break
              print(f"Error IOError en listener: {ioe}. Marcando como desconectado.")
              desconectar_arduino_emergencia()
         except Exception as e: 
@@ -0,0 +1,91 @@
+import argparse
+import time
+import cv2
+import numpy as np
+
+import backends_faciales
+import seguimiento_facial
+
+# ==============================================================================
+# BENCHMARK: BACKENDS DE DETECCIÓN/ENCODING FACIAL SOBRE UN VIDEO GRABADO
+# ==============================================================================
+# Reproduce el mismo clip con cada backend (backends_faciales.py) y mide por frame:
+#   - tiempo de detectar() y de codificar() (p50/p99),
+#   - rostros detectados por frame,
+#   - coincidencia con el primer backend (fracción de sus rostros que el otro también
+#     detecta con IoU >= --iou), para ver si un detector más rápido pierde rostros.
+# Los frames se reducen con --escala como en la FSM (FACTOR_REDUCCION_FRAME_FACIAL).
+#
+# Uso:  python benchmark_backends_faciales.py --video pasillo.mp4 --backends dlib yunet --escala 0.5
+
+
+def leer_frames(ruta_video, escala, max_frames):
+    captura = cv2.VideoCapture(ruta_video)
+    if not captura.isOpened():
+        raise SystemExit(f"No se pudo abrir el video '{ruta_video}'.")
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = captura.read()
+        if not ret:
+            break
+        reducido = cv2.resize(frame, (0, 0), fx=escala, fy=escala) if escala != 1.0 else frame
+        frames.append(np.ascontiguousarray(cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB)))
+    captura.release()
+    return frames
+
+def medir_backend(backend, frames):
+    tiempos_deteccion, tiempos_encoding, ubicaciones_por_frame = [], [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        ubicaciones = backend.detectar(frame)
+        t1 = time.perf_counter()
+        backend.codificar(frame, ubicaciones)
+        t2 = time.perf_counter()
+        tiempos_deteccion.append((t1 - t0) * 1000)
+        tiempos_encoding.append((t2 - t1) * 1000)
+        ubicaciones_por_frame.append(ubicaciones)
+    return np.array(tiempos_deteccion), np.array(tiempos_encoding), ubicaciones_por_frame
+
+def coincidencia(referencia, otras, iou_minimo):
+    total = sum(len(u) for u in referencia)
+    if total == 0:
+        return None
+    encontrados = sum(1 for ref, otr in zip(referencia, otras) for caja in ref if seguimiento_facial.solapa_con_alguna(caja, otr, iou_minimo))
+    return encontrados / total
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara backends faciales sobre un video grabado.")
+    parser.add_argument("--video", required=True, help="Clip grabado con la cámara de la puerta.")
+    parser.add_argument("--backends", nargs="+", default=list(backends_faciales.BACKENDS_FACIALES), help="Backends a comparar (el primero es la referencia).")
+    parser.add_argument("--escala", type=float, default=0.5, help="Reducción aplicada a cada frame antes de detectar.")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--iou", type=float, default=0.3, help="IoU mínimo para considerar que dos detecciones son el mismo rostro.")
+    args = parser.parse_args()
+
+    frames = leer_frames(args.video, args.escala, args.max_frames)
+    if not frames:
+        raise SystemExit("El video no tiene frames.")
+    print(f"{len(frames)} frames de {frames[0].shape[1]}x{frames[0].shape[0]} px")
+
+    referencia = None
+    for nombre in args.backends:
+        backend = backends_faciales.crear_backend_facial(nombre)
+        if backend.nombre != nombre:
+            print(f"  {nombre:<8} no disponible (se omitió)")
+            continue
+        backend.detectar(frames[0]) # Calentamiento (carga de modelos)
+        deteccion_ms, encoding_ms, ubicaciones = medir_backend(backend, frames)
+        total_ms = deteccion_ms + encoding_ms
+        rostros = np.mean([len(u) for u in ubicaciones])
+        texto_coincidencia = ""
+        if referencia is None:
+            referencia = ubicaciones
+        else:
+            fraccion = coincidencia(referencia, ubicaciones, args.iou)
+            texto_coincidencia = f"  coincidencia con '{args.backends[0]}'={fraccion:.3f}" if fraccion is not None else ""
+        print(f"  {nombre:<8} detectar p50={np.percentile(deteccion_ms, 50):7.1f} p99={np.percentile(deteccion_ms, 99):7.1f} ms  "
+              f"codificar p50={np.percentile(encoding_ms, 50):6.1f} ms  total={np.mean(total_ms):7.1f} ms/frame "
+              f"({1000.0 / max(np.mean(total_ms), 1e-6):5.1f} fps)  rostros/frame={rostros:.2f}{texto_coincidencia}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+
+import db_manager
+
+# ==============================================================================
+# BENCHMARK: BLOB PICKLE (FORMATO ANTIGUO) FRENTE AL FORMATO BINARIO FLOAT32
+# ==============================================================================
+# Crea una BD temporal con N usuarios cuyos encodings están guardados con pickle.dumps
+# (float64), mide la carga masiva y el tamaño del archivo, migra con
+# db_manager.inicializar_bd() y repite las mediciones con el formato binario.
+#
+# Uso:  python benchmark_formato_encodings.py --usuarios 1000 10000 100000
+
+DIMENSION_ENCODING = 128
+
+
+def crear_bd_formato_antiguo(ruta, num_usuarios, rng):
+    db_manager.NOMBRE_BD = ruta
+    db_manager.inicializar_bd()
+    encodings = rng.normal(0.0, 0.1, size=(num_usuarios, DIMENSION_ENCODING))
+    conn = sqlite3.connect(ruta)
+    conn.executemany("""
+        INSERT INTO usuarios (nombre_completo, dni, nivel_usuario, area_trabajo, uid_rfid,
+                              horario_trabajo_inicio, horario_trabajo_fin, facial_encoding)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(f"Usuario {i}", f"{i:08d}", "Visitante", "Planta", f"UID{i:08d}", "08:00", "18:00", pickle.dumps(encodings[i]))
+          for i in range(num_usuarios)])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+def medir_carga_antigua(ruta, repeticiones):
+    """Réplica de la carga masiva anterior (pickle.loads por fila)."""
+    mejor = None
+    for _ in range(repeticiones):
+        t_inicio = time.perf_counter()
+        conn = sqlite3.connect(ruta)
+        filas = conn.execute("""
+            SELECT id_usuario, nombre_completo, dni, nivel_usuario, area_trabajo, uid_rfid,
+                   horario_trabajo_inicio, horario_trabajo_fin, facial_encoding
+            FROM usuarios WHERE facial_encoding IS NOT NULL
+        """).fetchall()
+        conn.close()
+        encodings = [dict(zip(("id_usuario", "nombre", "dni", "nivel", "area", "uid_rfid", "h_inicio", "h_fin"), f[:8]),
+                          facial_encoding_array=pickle.loads(f[8])) for f in filas]
+        transcurrido = time.perf_counter() - t_inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor * 1000, len(encodings)
+
+def medir_carga_actual(repeticiones):
+    mejor = None
+    for _ in range(repeticiones):
+        t_inicio = time.perf_counter()
+        usuarios = db_manager.obtener_todos_los_usuarios_con_encodings_faciales_bd()
+        transcurrido = time.perf_counter() - t_inicio
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor * 1000, len(usuarios)
+
+def medir_decodificacion(ruta):
+    """Solo la deserialización de los BLOBs (sin la consulta), en microsegundos por encoding."""
+    conn = sqlite3.connect(ruta)
+    blobs = [blob for (blob,) in conn.execute("SELECT facial_encoding FROM usuarios WHERE facial_encoding IS NOT NULL")]
+    conn.close()
+    t_inicio = time.perf_counter()
+    for blob in blobs:
+        if blob[:4] == db_manager.MAGIA_ENCODING:
+            db_manager.deserializar_encoding(blob)
+        else:
+            pickle.loads(blob)
+    return (time.perf_counter() - t_inicio) * 1e6 / max(1, len(blobs)), len(blobs[0]) if blobs else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del formato de los encodings faciales en la BD.")
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[1000, 10000, 100000], help="Tamaños de BD a probar.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se informa la mejor de N cargas.")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.semilla)
+    directorio = tempfile.mkdtemp(prefix="bench_encodings_")
+    try:
+        for num_usuarios in args.usuarios:
+            ruta = os.path.join(directorio, f"bd_{num_usuarios}.db")
+            print(f"\n=== {num_usuarios} usuarios con encoding ===")
+            crear_bd_formato_antiguo(ruta, num_usuarios, rng)
+            carga_ms, n = medir_carga_antigua(ruta, args.repeticiones)
+            decod_us, bytes_blob = medir_decodificacion(ruta)
+            print(f"  pickle float64 : carga={carga_ms:8.1f} ms ({n} filas)  decodificación={decod_us:6.2f} us/enc  "
+                  f"blob={bytes_blob} B  BD={os.path.getsize(ruta) / 1e6:7.2f} MB")
+
+            t_inicio = time.perf_counter()
+            db_manager.inicializar_bd() # Migra al formato binario
+            migracion_ms = (time.perf_counter() - t_inicio) * 1000
+            conn = sqlite3.connect(ruta); conn.execute("VACUUM"); conn.close()
+            carga_ms, n = medir_carga_actual(args.repeticiones)
+            decod_us, bytes_blob = medir_decodificacion(ruta)
+            print(f"  binario float32: carga={carga_ms:8.1f} ms ({n} filas)  decodificación={decod_us:6.2f} us/enc  "
+                  f"blob={bytes_blob} B  BD={os.path.getsize(ruta) / 1e6:7.2f} MB  migración={migracion_ms:.0f} ms")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+import constants
+import arduino_comms
+import db_manager
+import reporting_logging
+import facial_recognition_utils
+import procesamiento_facial
+import instrumentacion
+import fuentes_frames
+import credenciales_qr
+import servicio_captura
+import state_machine_logic
+from state_machine_logic import EstadoSistema
+
+# ==============================================================================
+# BENCHMARK: ESTADOS DE VALIDACIÓN QR Y FACIAL DE PRINCIPIO A FIN CON UNA GRABACIÓN
+# ==============================================================================
+# Ejecuta la máquina de estados real (logica_maquina_estados) con la cámara sustituida
+# por una reproducción (fuentes_frames.py) y el Arduino simulado: SP1 detecta a una persona
+# y los switches seleccionan el protocolo. Cada repetición entra en el estado de validación
+# y termina al salir de él con una decisión (o al agotarse la grabación / el timeout).
+# Escenarios:
+#   - facial:    "Solo Reconocimiento Facial" (ESPERANDO_VALIDACION_FACIAL, búsqueda 1 a N).
+#   - qr_facial: "QR + Facial". Por defecto QR y rostro se buscan en los mismos frames dentro de
+#                ESPERANDO_VALIDACION_FACIAL (USAR_QR_FACIAL_SIMULTANEO); con --qr-secuencial, primero
+#                ESPERANDO_VALIDACION_QR_REAL y después ESPERANDO_VALIDACION_FACIAL con la misma grabación.
+# Por estado informa: tiempo hasta la decisión (reloj y tiempo de la grabación), frames por
+# segundo leídos y la decisión; y el tiempo desde que llega la persona hasta ABRIENDO_PUERTA. Al final, tiempo y CPU por etapa (instrumentacion.medir_etapa
+# en la FSM y tiempos del detector) y la CPU total del proceso.
+# Sin --con-pool la detección corre en el hilo de la FSM para que la CPU del proceso la incluya;
+# con el pool la CPU de la detección aparece igualmente en las etapas facial_hog_*_cpu.
+# En el estado QR informa además de las decodificaciones por segundo (escaner_qr.py), los
+# frames omitidos por haber una decodificación en curso, en qué etapa (roi/reducida/completa)
+# apareció el código y el tiempo desde la entrada al estado hasta el primer código.
+# El QR de la grabación debe ser una credencial emitida con la clave de la BD usada
+# (emitir_credencial_qr.py; la clave se copia con la BD). La misma credencial vale en todas
+# las repeticiones: entre una y otra se olvidan las credenciales ya usadas.
+# Con --acercamiento-s SP1 se acerca poco a poco antes de cruzar el umbral, para medir el efecto
+# del precalentamiento (precalentamiento.py) en las latencias *_primer_frame / *_primer_resultado.
+# La BD se copia a una carpeta temporal junto con los reportes: la instalación no se modifica.
+#
+# Uso:  python benchmark_fsm_reproduccion.py --escenario facial --fuente acceso_juan.mp4 --repeticiones 5
+#       python benchmark_fsm_reproduccion.py --escenario qr_facial --fuente frames_qr/ --velocidad real
+
+ESCENARIOS = {
+    # nombre: (s1_estado, s2_estado, estados de validación que se miden)
+    "facial": (1, 1, (EstadoSistema.ESPERANDO_VALIDACION_FACIAL,)),
+    "qr_facial": (1, 0, (EstadoSistema.ESPERANDO_VALIDACION_QR_REAL, EstadoSistema.ESPERANDO_VALIDACION_FACIAL)),
+}
+ESTADOS_FINALES = (EstadoSistema.ABRIENDO_PUERTA, EstadoSistema.ACCESO_DENEGADO_TEMPORAL,
+                   EstadoSistema.SISTEMA_BLOQUEADO_UID, EstadoSistema.REPOSO)
+DISTANCIA_PERSONA_CM = 10.0
+DISTANCIA_SIN_PERSONA_CM = 999.0
+
+
+def preparar_entorno(ruta_bd):
+    """Copia la BD (y la clave de credenciales QR) a una carpeta temporal y dirige allí la BD, el snapshot y los reportes."""
+    carpeta = tempfile.mkdtemp(prefix="benchmark_fsm_")
+    if os.path.isfile(ruta_bd):
+        shutil.copy2(ruta_bd, os.path.join(carpeta, os.path.basename(ruta_bd)))
+    ruta_clave_qr = os.path.join(os.path.dirname(ruta_bd), constants.ARCHIVO_CLAVE_CREDENCIALES_QR)
+    if os.path.isfile(ruta_clave_qr):
+        shutil.copy2(ruta_clave_qr, os.path.join(carpeta, constants.ARCHIVO_CLAVE_CREDENCIALES_QR))
+    db_manager.NOMBRE_BD = facial_recognition_utils.NOMBRE_BD = os.path.join(carpeta, os.path.basename(ruta_bd))
+    reporting_logging.CARPETA_REPORTES = os.path.join(carpeta, "reportes")
+    reporting_logging.ARCHIVO_ESTADO_DIARIO = os.path.join(carpeta, "estado_diario.json")
+    os.makedirs(reporting_logging.CARPETA_REPORTES, exist_ok=True)
+    constants.CARPETA_REPORTES = reporting_logging.CARPETA_REPORTES
+    return carpeta
+
+def simular_hardware(s1, s2, distancia_sp1):
+    with arduino_comms.lock_datos_hardware:
+        arduino_comms.datos_hardware.update({"sp1_distancia": distancia_sp1, "sp2_distancia": DISTANCIA_SIN_PERSONA_CM,
+                                             "e_estado": 1, "s1_estado": s1, "s2_estado": s2,
+                                             "rfid_uid": "NADA", "ultimo_rfid_procesado_para_acceso": "NADA"})
+
+def simular_acercamiento(s1, s2, duracion_s):
+    """SP1 baja de forma lineal desde DISTANCIA_MAX_TENDENCIA_SP1_CM hasta el umbral de acceso en 'duracion_s'."""
+    desde, hasta = constants.DISTANCIA_MAX_TENDENCIA_SP1_CM - 1.0, constants.UMBRAL_DETECCION_SP1_CM + 1.0
+    t_inicio = time.perf_counter()
+    fraccion = 0.0
+    while fraccion < 1.0:
+        simular_hardware(s1, s2, desde + (hasta - desde) * fraccion)
+        time.sleep(0.02)
+        fraccion = (time.perf_counter() - t_inicio) / duracion_s
+
+def ejecutar_repeticion(s1, s2, timeout_s, acercamiento_s=0.0):
+    """
+    Lanza la FSM, simula la llegada de una persona y devuelve las transiciones
+    [(estado, t_reloj_s, timestamp_grabacion_s, frames_leidos)], la fuente usada y el
+    instante en que se dejó de esperar una decisión.
+    """
+    transiciones = []
+    fuentes = []
+    cambiar_estado_original = state_machine_logic.cambiar_estado
+    abrir_fuente_original = fuentes_frames.abrir_fuente_camara
+
+    def cambiar_estado_registrado(nuevo_estado, mensaje_gui=None):
+        fuente = fuentes[-1] if fuentes else None
+        transiciones.append((nuevo_estado, time.perf_counter(),
+                             fuente.timestamp_s if fuente else None, fuente.frames_leidos if fuente else 0))
+        cambiar_estado_original(nuevo_estado, mensaje_gui)
+
+    def abrir_fuente_registrada():
+        fuente = abrir_fuente_original()
+        fuentes.append(fuente)
+        return fuente
+
+    state_machine_logic.cambiar_estado = cambiar_estado_registrado
+    fuentes_frames.abrir_fuente_camara = abrir_fuente_registrada
+    state_machine_logic.estado_actual_sistema = EstadoSistema.REPOSO
+    with credenciales_qr.lock_credenciales:
+        credenciales_qr.nonces_usados.clear() # La credencial de la grabación vuelve a valer
+        credenciales_qr.nonces_por_expiracion.clear()
+    simular_hardware(s1, s2, DISTANCIA_SIN_PERSONA_CM)
+    state_machine_logic.hilo_maquina_estados_activo = True
+    hilo = threading.Thread(target=state_machine_logic.logica_maquina_estados, daemon=True)
+    hilo.start()
+    try:
+        time.sleep(0.2) # La FSM arranca en REPOSO (BD, galería, protocolo)
+        if acercamiento_s > 0:
+            simular_acercamiento(s1, s2, acercamiento_s)
+        transiciones.clear()
+        transiciones.append((EstadoSistema.REPOSO, time.perf_counter(), None, 0))
+        simular_hardware(s1, s2, DISTANCIA_PERSONA_CM)
+        t_limite = time.perf_counter() + timeout_s
+        t_final = None
+        while time.perf_counter() < t_limite:
+            if len(transiciones) > 1 and transiciones[-1][0] in ESTADOS_FINALES:
+                break
+            if fuentes and getattr(fuentes[-1], "agotada", False):
+                t_final = time.perf_counter()
+                time.sleep(0.05) # Dar tiempo a la FSM a decidir con el último resultado
+                break
+            time.sleep(0.001)
+        t_final = t_final or time.perf_counter()
+    finally:
+        state_machine_logic.hilo_maquina_estados_activo = False
+        hilo.join(timeout=5.0)
+        state_machine_logic.cambiar_estado = cambiar_estado_original
+        fuentes_frames.abrir_fuente_camara = abrir_fuente_original
+        if state_machine_logic.cap_camara is not None:
+            state_machine_logic.cap_camara.release()
+            state_machine_logic.cap_camara = None
+        servicio_captura.detener_servicio_captura() # Cada repetición empieza la grabación desde el principio
+        state_machine_logic.estado_actual_sistema = EstadoSistema.REPOSO
+        simular_hardware(s1, s2, DISTANCIA_SIN_PERSONA_CM)
+    return transiciones, (fuentes[-1] if fuentes else None), t_final
+
+def medir_estados(transiciones, estados_medidos, fuente, t_final):
+    """
+    Por cada estado medido: (duración reloj, duración en la grabación, frames leídos, siguiente estado).
+    Si la FSM no llegó a decidir, el estado termina con la grabación (o el timeout) en t_final.
+    """
+    medidas = {}
+    for i, (estado, t_reloj, ts_grabacion, frames) in enumerate(transiciones):
+        if estado not in estados_medidos or estado in medidas:
+            continue
+        if i + 1 < len(transiciones):
+            siguiente, t_fin, ts_fin, frames_fin = transiciones[i + 1]
+            decision = siguiente.name
+        else:
+            t_fin = t_final
+            ts_fin = fuente.timestamp_s if fuente is not None else None
+            frames_fin = fuente.frames_leidos if fuente is not None else frames
+            decision = "SIN_DECISION"
+        duracion_grabacion = (ts_fin - (ts_grabacion or 0.0)) if ts_fin is not None else None
+        medidas[estado] = (t_fin - t_reloj, duracion_grabacion, frames_fin - frames, decision)
+    return medidas
+
+def tiempo_hasta_puerta(transiciones):
+    """Segundos desde la llegada de la persona hasta ABRIENDO_PUERTA, o None si no se abrió."""
+    for estado, t_reloj, _, _ in transiciones:
+        if estado == EstadoSistema.ABRIENDO_PUERTA:
+            return t_reloj - transiciones[0][1]
+    return None
+
+def imprimir_etapas():
+    tiempos = instrumentacion.obtener_resumen()["tiempos"]
+    print(f"\n  {'etapa':<36} {'n':>6} {'media ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'CPU ms':>8}")
+    for nombre, t in sorted(tiempos.items()):
+        if nombre.endswith("_cpu"):
+            continue
+        cpu = tiempos.get(f"{nombre}_cpu")
+        cpu_txt = f"{cpu['media_ms']:8.2f}" if cpu else f"{'-':>8}"
+        print(f"  {nombre:<36} {t['n']:6d} {t['media_ms']:9.2f} {t['p50_ms']:8.2f} {t['p99_ms']:8.2f} {cpu_txt}")
+
+def imprimir_qr(medidas_qr):
+    """Rendimiento del escaneo QR en el estado donde se lee el QR (medidas de ese estado)."""
+    resumen = instrumentacion.obtener_resumen()
+    contadores, tiempos = resumen["contadores"], resumen["tiempos"]
+    t_estado = sum(m[0] for m in medidas_qr)
+    decodificaciones = contadores.get("qr_decodificaciones", 0)
+    print(f"\n  QR: {decodificaciones} decodificaciones en {t_estado:.2f} s de estado "
+          f"({decodificaciones / t_estado if t_estado > 0 else 0.0:.1f} por segundo), "
+          f"{contadores.get('qr_frames_omitidos_en_curso', 0)} frames omitidos con una en curso")
+    etapas = {e: contadores.get(f"qr_codigo_en_{e}", 0) for e in ("roi", "reducida", "completa")}
+    print(f"  QR: código encontrado por etapa {etapas}")
+    primero = tiempos.get("qr_latencia_primer_codigo")
+    if primero:
+        print(f"  QR: tiempo hasta el primer código p50 {primero['p50_ms']:.1f} ms (n={primero['n']})")
+    else:
+        print("  QR: ningún código decodificado")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide los estados de validación QR/Facial de la FSM con una grabación.")
+    parser.add_argument("--escenario", choices=sorted(ESCENARIOS), default="facial", help="Protocolo a simular.")
+    parser.add_argument("--fuente", required=True, help="Video o carpeta de imágenes que sustituye a la cámara.")
+    parser.add_argument("--velocidad", choices=fuentes_frames.VELOCIDADES_REPRODUCCION, default="maxima", help="Ritmo de reproducción.")
+    parser.add_argument("--fps-imagenes", type=float, default=constants.FPS_FUENTE_IMAGENES, help="fps al reproducir una carpeta de imágenes.")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--bd", default=db_manager.NOMBRE_BD, help="BD con los usuarios enrolados (se usa una copia).")
+    parser.add_argument("--con-pool", action="store_true", help="Detección facial en el pool de procesos, como en producción.")
+    parser.add_argument("--acercamiento-s", type=float, default=0.0, help="Simular que SP1 se acerca durante estos segundos antes de cruzar el umbral (precalentamiento).")
+    parser.add_argument("--sin-precalentamiento", action="store_true", help="Desactivar USAR_PRECALENTAMIENTO_CAMARA.")
+    parser.add_argument("--qr-secuencial", action="store_true", help="En qr_facial, validar primero el QR y después el rostro (desactiva USAR_QR_FACIAL_SIMULTANEO).")
+    args = parser.parse_args()
+
+    s1, s2, estados_medidos = ESCENARIOS[args.escenario]
+    carpeta_temporal = preparar_entorno(args.bd)
+    constants.FUENTE_CAMARA = args.fuente
+    constants.VELOCIDAD_REPRODUCCION_FUENTE = args.velocidad
+    constants.FPS_FUENTE_IMAGENES = args.fps_imagenes
+    constants.USAR_POOL_DETECCION_FACIAL = args.con_pool
+    constants.USAR_PRECALENTAMIENTO_CAMARA = not args.sin_precalentamiento
+    constants.USAR_QR_FACIAL_SIMULTANEO = not args.qr_secuencial
+    arduino_comms.arduino_conectado = True # Sin puerto serie: los comandos al Arduino se ignoran
+    timeout_s = constants.TIMEOUT_SIMULACION_QR_S + constants.TIMEOUT_RECONOCIMIENTO_FACIAL_S + 5.0
+
+    print(f"Escenario '{args.escenario}' con '{args.fuente}' a velocidad {args.velocidad}, "
+          f"{'con' if args.con_pool else 'sin'} pool, {args.repeticiones} repeticiones.")
+    instrumentacion.reiniciar_metricas()
+    medidas_por_estado = {estado: [] for estado in estados_medidos}
+    tiempos_puerta = []
+    cpu_inicio, t_inicio = time.process_time(), time.perf_counter()
+    try:
+        for repeticion in range(args.repeticiones):
+            transiciones, fuente, t_final = ejecutar_repeticion(s1, s2, timeout_s, args.acercamiento_s)
+            for estado, medida in medir_estados(transiciones, estados_medidos, fuente, t_final).items():
+                medidas_por_estado[estado].append(medida)
+            t_puerta = tiempo_hasta_puerta(transiciones)
+            if t_puerta is not None:
+                tiempos_puerta.append(t_puerta)
+            print(f"  repetición {repeticion + 1}: " + " -> ".join(e.name for e, *_ in transiciones))
+    finally:
+        arduino_comms.arduino_conectado = False
+        procesamiento_facial.detener_pool_deteccion()
+    cpu_total, t_total = time.process_time() - cpu_inicio, time.perf_counter() - t_inicio
+
+    print(f"\n  {'estado':<30} {'decisión (reloj) ms':>20} {'decisión (grabación) ms':>24} {'fps':>7}  decisiones")
+    for estado, medidas in medidas_por_estado.items():
+        if not medidas:
+            print(f"  {estado.name:<30} (no se alcanzó)")
+            continue
+        reloj = np.array([m[0] for m in medidas]) * 1000
+        grabacion = [m[1] * 1000 for m in medidas if m[1] is not None]
+        fps = np.array([m[2] / m[0] for m in medidas if m[0] > 0])
+        decisiones = {}
+        for m in medidas:
+            decisiones[m[3]] = decisiones.get(m[3], 0) + 1
+        grabacion_txt = f"{np.median(grabacion):24.1f}" if grabacion else f"{'-':>24}"
+        print(f"  {estado.name:<30} {np.median(reloj):20.1f} {grabacion_txt} {np.median(fps) if len(fps) else 0.0:7.1f}  {decisiones}")
+    if tiempos_puerta:
+        print(f"\n  Hasta ABRIENDO_PUERTA: p50 {np.median(tiempos_puerta) * 1000:.1f} ms ({len(tiempos_puerta)} de {args.repeticiones} repeticiones)")
+    else:
+        print("\n  Hasta ABRIENDO_PUERTA: no se abrió en ninguna repetición")
+    estado_qr = EstadoSistema.ESPERANDO_VALIDACION_QR_REAL if args.qr_secuencial else EstadoSistema.ESPERANDO_VALIDACION_FACIAL
+    if args.escenario == "qr_facial" and medidas_por_estado.get(estado_qr):
+        imprimir_qr(medidas_por_estado[estado_qr])
+    imprimir_etapas()
+    print(f"\n  CPU del proceso: {cpu_total:.2f} s en {t_total:.2f} s ({100.0 * cpu_total / t_total if t_total > 0 else 0.0:.0f} % de un núcleo)"
+          f"{'; no incluye los procesos del pool' if args.con_pool else ''}")
+    shutil.rmtree(carpeta_temporal, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
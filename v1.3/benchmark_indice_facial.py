@@ -0,0 +1,82 @@
+import argparse
+import time
+import numpy as np
+
+import facial_recognition_utils
+import indice_facial
+
+# ==============================================================================
+# BENCHMARK: RECALL@1 Y LATENCIA DE LA BÚSQUEDA 1:N EN GALERÍAS SINTÉTICAS
+# ==============================================================================
+# Genera galerías sintéticas con una escala parecida a los encodings de dlib
+# (distancia entre personas distintas ~0.9, misma persona ~0.4), las instala con
+# facial_recognition_utils.instalar_galeria() y mide, para cada índice:
+#   - recall@1: fracción de consultas cuyo resultado coincide con el vecino exacto.
+#   - latencia p50/p99 de buscar_rostros_en_galeria() por frame (1 rostro por frame).
+#
+# Uso:  python benchmark_indice_facial.py --tamanos 1000 10000 50000 --consultas 500
+
+SIGMA_IDENTIDAD = 0.056   # Dispersión entre identidades (distancia media ~0.9)
+SIGMA_MUESTRA = 0.035     # Ruido de una nueva captura de la misma persona (distancia ~0.4)
+NUM_GRUPOS = 64           # Grupos latentes para que la galería no sea ruido uniforme
+
+
+def generar_galeria_sintetica(num_usuarios, rng):
+    centros = rng.normal(0.0, SIGMA_IDENTIDAD, size=(NUM_GRUPOS, facial_recognition_utils.DIMENSION_ENCODING))
+    grupo = rng.integers(0, NUM_GRUPOS, size=num_usuarios)
+    galeria = centros[grupo] + rng.normal(0.0, SIGMA_IDENTIDAD, size=(num_usuarios, facial_recognition_utils.DIMENSION_ENCODING))
+    return galeria.astype(np.float32)
+
+def generar_consultas(galeria, num_consultas, rng):
+    filas = rng.integers(0, len(galeria), size=num_consultas)
+    consultas = galeria[filas] + rng.normal(0.0, SIGMA_MUESTRA, size=(num_consultas, galeria.shape[1])).astype(np.float32)
+    return consultas.astype(np.float32)
+
+def vecinos_exactos(galeria, consultas):
+    normas = np.einsum('ij,ij->i', galeria, galeria)
+    return np.argmin(normas[None, :] - 2.0 * (consultas @ galeria.T), axis=1)
+
+def medir_indice(nombre, indice, galeria, consultas, verdad):
+    t_inicio = time.perf_counter()
+    metadatos = [{"id_usuario": i, "nombre": f"Usuario {i}"} for i in range(len(galeria))]
+    facial_recognition_utils.instalar_galeria(galeria, metadatos, indice=indice)
+    t_construccion_ms = (time.perf_counter() - t_inicio) * 1000
+
+    latencias_ms = []
+    aciertos = 0
+    for i, consulta in enumerate(consultas):
+        t0 = time.perf_counter()
+        indices, _ = facial_recognition_utils.buscar_rostros_en_galeria(consulta[None, :])
+        latencias_ms.append((time.perf_counter() - t0) * 1000)
+        aciertos += int(indices[0] == verdad[i])
+
+    latencias_ms = np.array(latencias_ms)
+    print(f"  {nombre:<28} recall@1={aciertos / len(consultas):6.3f}  "
+          f"p50={np.percentile(latencias_ms, 50):7.3f} ms  p99={np.percentile(latencias_ms, 99):7.3f} ms  "
+          f"construcción={t_construccion_ms:8.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de índices para la búsqueda facial 1:N.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 50000], help="Tamaños de galería a probar.")
+    parser.add_argument("--consultas", type=int, default=500, help="Consultas (frames con 1 rostro) por configuración.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16], help="Valores de nprobe para IVF.")
+    parser.add_argument("--pq", type=int, default=16, help="Subvectores PQ para la variante IVF+PQ (0 = omitir).")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.semilla)
+    for tamano in args.tamanos:
+        print(f"\n=== Galería sintética de {tamano} encodings, {args.consultas} consultas ===")
+        galeria = generar_galeria_sintetica(tamano, rng)
+        consultas = generar_consultas(galeria, args.consultas, rng)
+        verdad = vecinos_exactos(galeria, consultas)
+
+        medir_indice("exacto", indice_facial.IndiceExacto(), galeria, consultas, verdad)
+        for nprobe in args.nprobe:
+            medir_indice(f"ivf nprobe={nprobe}", indice_facial.IndiceIVF(nprobe=nprobe), galeria, consultas, verdad)
+        if args.pq:
+            for nprobe in args.nprobe:
+                medir_indice(f"ivf+pq m={args.pq} nprobe={nprobe}", indice_facial.IndiceIVF(nprobe=nprobe, subvectores_pq=args.pq), galeria, consultas, verdad)
+
+if __name__ == "__main__":
+    main()
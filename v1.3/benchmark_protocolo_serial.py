@@ -0,0 +1,70 @@
+import argparse
+import time
+import random
+
+import protocolo_serial
+
+# ==============================================================================
+# BENCHMARK: RENDIMIENTO DE LOS PARSERS DEL PROTOCOLO SERIE
+# ==============================================================================
+# Genera N paquetes DATOS aleatorios (con una tarjeta RFID en uno de cada 10) en los dos
+# formatos de protocolo_serial.py, los concatena y los entrega al parser en bloques de
+# --bloque bytes, como llegarían de arduino_serial.read(). Mide paquetes/s, us por paquete,
+# bytes por paquete (ocupación del enlace a 115200 baudios) y comprueba que ambos parsers
+# devuelven las mismas lecturas. Con --ruido se intercalan líneas INFO entre paquetes.
+#
+# Uso:  python benchmark_protocolo_serial.py --paquetes 100000 --bloque 16 64 512
+
+BITS_POR_BYTE_SERIE = 10 # 8N1: bit de inicio + 8 de datos + bit de parada
+
+
+def generar_lecturas(paquetes, semilla):
+    rng = random.Random(semilla)
+    lecturas = []
+    for i in range(paquetes):
+        uid = "".join(f"{rng.randrange(256):02X}" for _ in range(rng.choice((4, 7)))) if i % 10 == 0 else protocolo_serial.LECTURA_VACIA_UID
+        lecturas.append((round(rng.uniform(2.0, 400.0), 1), 999.0, rng.randrange(2), rng.randrange(2), 1, uid))
+    return lecturas
+
+def medir(fabrica_parser, flujo, bloque, repeticiones):
+    mejor, lecturas = float("inf"), None
+    for _ in range(repeticiones):
+        parser = fabrica_parser()
+        salida = []
+        t0 = time.perf_counter()
+        for inicio in range(0, len(flujo), bloque):
+            salida.extend(parser.alimentar(flujo[inicio:inicio + bloque]))
+        mejor = min(mejor, time.perf_counter() - t0)
+        lecturas = salida
+    return mejor, lecturas
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de los parsers texto/binario del Arduino.")
+    parser.add_argument("--paquetes", type=int, default=100000, help="Paquetes DATOS generados.")
+    parser.add_argument("--bloque", type=int, nargs="+", default=[16, 64, 512], help="Bytes entregados al parser por llamada.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se informa la mejor repetición.")
+    parser.add_argument("--ruido", action="store_true", help="Intercalar una línea INFO cada 50 paquetes.")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    lecturas = generar_lecturas(args.paquetes, args.semilla)
+    formatos = (("texto", protocolo_serial.codificar_linea_datos, protocolo_serial.ParserTexto),
+                ("binario", protocolo_serial.codificar_trama_datos, protocolo_serial.ParserBinario))
+    for nombre, codificar, fabrica in formatos:
+        partes = []
+        for i, lectura in enumerate(lecturas):
+            if args.ruido and i % 50 == 0:
+                partes.append(b"INFO: Comando ABRIR_PUERTA recibido (servo deshabilitado)\r\n")
+            partes.append(codificar(*lectura))
+        flujo = b"".join(partes)
+        bytes_por_paquete = len(flujo) / args.paquetes
+        ocupacion_ms = bytes_por_paquete * BITS_POR_BYTE_SERIE / 115200 * 1000
+        print(f"\n=== {nombre}: {bytes_por_paquete:.1f} bytes/paquete ({ocupacion_ms:.2f} ms de enlace a 115200 baudios) ===")
+        for bloque in args.bloque:
+            segundos, salida = medir(fabrica, flujo, bloque, args.repeticiones)
+            correcto = "OK" if salida == lecturas else f"DIFERENTE ({len(salida)} lecturas)"
+            print(f"  bloque {bloque:>4} B: {args.paquetes / segundos:>10.0f} paquetes/s  "
+                  f"{segundos / args.paquetes * 1e6:6.2f} us/paquete  lecturas {correcto}")
+
+if __name__ == "__main__":
+    main()
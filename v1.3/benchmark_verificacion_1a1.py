@@ -0,0 +1,67 @@
+import argparse
+import time
+import numpy as np
+
+import face_recognition
+
+import facial_recognition_utils
+
+# ==============================================================================
+# BENCHMARK: COSTE POR FRAME DE LA VERIFICACIÓN 1:1 (RFID/QR + FACIAL)
+# ==============================================================================
+# Compara, para M rostros por frame y un usuario con K muestras:
+#   - "face_distance por rostro": la llamada anterior de la FSM,
+#     face_recognition.face_distance([encoding_usuario], rostro) por cada rostro y muestra.
+#   - "VerificadorUsuario": las muestras se preparan una vez y todos los rostros del frame
+#     se puntúan con VerificadorUsuario.distancias() en una sola llamada.
+# También comprueba que ambas distancias coinciden.
+#
+# Uso:  python benchmark_verificacion_1a1.py --rostros 1 2 4 --muestras 1 5 --frames 20000
+
+
+def medir(funcion, frames):
+    tiempos_us = np.empty(frames)
+    for i in range(frames):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos_us[i] = (time.perf_counter() - t0) * 1e6
+    return np.percentile(tiempos_us, 50), np.percentile(tiempos_us, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de la verificación facial 1:1 por frame.")
+    parser.add_argument("--rostros", type=int, nargs="+", default=[1, 2, 4], help="Rostros por frame.")
+    parser.add_argument("--muestras", type=int, nargs="+", default=[1, 5], help="Muestras registradas del usuario.")
+    parser.add_argument("--frames", type=int, default=20000, help="Frames medidos por configuración.")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.semilla)
+    for num_muestras in args.muestras:
+        muestras = rng.normal(0.0, 0.06, size=(num_muestras, facial_recognition_utils.DIMENSION_ENCODING))
+        usuario = {"id_usuario": 1, "facial_encoding_array": muestras.mean(axis=0),
+                   "facial_encodings_muestras": muestras if num_muestras > 1 else None}
+        lista_muestras = list(muestras)
+        for num_rostros in args.rostros:
+            # Encodings tal como llegan del pool: un array float64 por rostro
+            rostros = [m for m in rng.normal(0.0, 0.06, size=(num_rostros, facial_recognition_utils.DIMENSION_ENCODING))]
+
+            def por_rostro():
+                return [min(face_recognition.face_distance([m], r)[0] for m in lista_muestras) for r in rostros]
+
+            verificador = facial_recognition_utils.crear_verificador_usuario(usuario)
+            def vectorizado():
+                return verificador.distancias(rostros)
+
+            error = np.max(np.abs(np.asarray(por_rostro()) - vectorizado()))
+            print(f"\n=== {num_rostros} rostro(s) por frame, usuario con {num_muestras} muestra(s) (error máx. {error:.1e}) ===")
+            for nombre, funcion in (("face_distance por rostro", por_rostro), ("VerificadorUsuario", vectorizado)):
+                p50, p99 = medir(funcion, args.frames)
+                print(f"  {nombre:<26} p50={p50:7.2f} us/frame  p99={p99:7.2f} us/frame")
+
+            t0 = time.perf_counter()
+            for _ in range(1000):
+                facial_recognition_utils.crear_verificador_usuario(usuario)
+            print(f"  (preparación del verificador al entrar al estado: {(time.perf_counter() - t0) * 1000:.2f} us)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import threading
+
+try:
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: instrumentacion.py no encontrado en canal_vista_previa.py.")
+    class instrumentacion: incrementar_contador = lambda n, c=1: None
+
+# ==============================================================================
+# CANAL DE VISTA PREVIA: ÚLTIMO FRAME DE LA CÁMARA PARA LA GUI
+# ==============================================================================
+# Antes la FSM metía cada frame en ui_queue ("camera_feed_update"). La GUI vacía esa cola
+# cada 100 ms, así que los frames se acumulaban (cola sin límite) y se dibujaban todos.
+# Este canal tiene un único hueco: publicar_frame() sustituye el frame anterior si la GUI
+# aún no lo tomó, y la GUI toma solo el más reciente con tomar_ultimo(), a lo sumo
+# FPS_MAX_VISTA_PREVIA veces por segundo (gui_manager.actualizar_vista_previa).
+# El frame se pasa por referencia (sin copias); la primera copia es el redimensionado de
+# la GUI. Quien publica no debe modificar el frame después de publicarlo.
+
+TEXTO_CAMARA_APAGADA = "Cámara OFF"
+
+lock_vista_previa = threading.Lock()
+frame_pendiente = None      # Frame BGR más reciente sin mostrar
+texto_pendiente = None      # Texto a mostrar en lugar de video (cámara apagada)
+hay_novedad = False         # True si hay algo publicado que la GUI todavía no tomó
+texto_apagada_actual = TEXTO_CAMARA_APAGADA # Texto publicado con la cámara apagada (None si hay video)
+
+
+def publicar_frame(frame_bgr):
+    """Deja 'frame_bgr' como el frame a mostrar, sustituyendo al anterior si no se mostró."""
+    global frame_pendiente, texto_pendiente, hay_novedad, texto_apagada_actual
+    with lock_vista_previa:
+        if hay_novedad and frame_pendiente is not None:
+            instrumentacion.incrementar_contador("vista_previa_frames_sustituidos")
+        frame_pendiente = frame_bgr
+        texto_pendiente = None
+        hay_novedad = True
+        texto_apagada_actual = None
+
+def publicar_camara_apagada(texto=TEXTO_CAMARA_APAGADA):
+    """Sustituye el video por 'texto'. Si ya se publicó ese mismo texto, no hace nada."""
+    global frame_pendiente, texto_pendiente, hay_novedad, texto_apagada_actual
+    with lock_vista_previa:
+        if texto_apagada_actual == texto:
+            return
+        frame_pendiente = None
+        texto_pendiente = texto
+        hay_novedad = True
+        texto_apagada_actual = texto
+
+def tomar_ultimo():
+    """
+    Devuelve (frame, texto) con lo último publicado desde la llamada anterior, o None si no
+    hay nada nuevo. Exactamente uno de los dos es None.
+    """
+    global frame_pendiente, hay_novedad
+    with lock_vista_previa:
+        if not hay_novedad:
+            return None
+        resultado = (frame_pendiente, texto_pendiente)
+        frame_pendiente = None
+        hay_novedad = False
+        return resultado
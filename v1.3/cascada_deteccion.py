@@ -0,0 +1,153 @@
+import time
+import cv2
+import numpy as np
+import face_recognition
+
+try:
+    import constants
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py o instrumentacion.py no encontrados en cascada_deteccion.py.")
+    class constants: USAR_FILTRO_MOVIMIENTO_FACIAL = True; UMBRAL_DIFERENCIA_PIXEL_MOVIMIENTO = 15; FRACCION_MINIMA_MOVIMIENTO = 0.01; INTERVALO_MAX_SIN_PROCESAR_FACIAL_S = 1.0; ARCHIVO_CASCADA_HAAR = ""; MARGEN_REGION_HAAR = 0.4
+    class instrumentacion: incrementar_contador = lambda n, c=1: None
+
+# ==============================================================================
+# CASCADA DE DETECCIÓN FACIAL: FILTROS BARATOS ANTES DE HOG + ENCODING
+# ==============================================================================
+# La mayoría de los frames de la cámara de la puerta no aportan nada nuevo (escena vacía
+# o persona quieta). Antes de pagar HOG (~100-300 ms) y el encoder de 128-d se aplican:
+#
+#   1. Movimiento (hilo de la FSM, <1 ms): diferencia contra el último frame ENVIADO, sobre
+#      una miniatura en gris. Sin cambios significativos el frame no se envía al pool.
+#      Cada INTERVALO_MAX_SIN_PROCESAR_FACIAL_S se envía uno igualmente (red de seguridad).
+#   2. Pre-detector Haar/LBP de OpenCV (opcional, dentro del proceso de detección): si no
+#      propone ninguna caja se omite HOG; si propone cajas, HOG se ejecuta solo sobre esas
+#      regiones (ampliadas por MARGEN_REGION_HAAR) y no sobre el frame completo.
+#
+# Cada etapa registra en instrumentacion.py cuántos frames deja pasar u omite.
+
+ANCHO_MINIATURA_MOVIMIENTO = 80   # Ancho (px) de la miniatura en gris usada para comparar frames
+FRACCION_MAXIMA_REGIONES = 0.6    # Si las regiones candidatas cubren más que esto, HOG sobre el frame completo
+
+
+class DetectorMovimiento:
+    """Decide si un frame difiere lo suficiente del último enviado como para procesarlo."""
+
+    def __init__(self, umbral_pixel=None, fraccion_minima=None, intervalo_max_s=None):
+        self.umbral_pixel = constants.UMBRAL_DIFERENCIA_PIXEL_MOVIMIENTO if umbral_pixel is None else umbral_pixel
+        self.fraccion_minima = constants.FRACCION_MINIMA_MOVIMIENTO if fraccion_minima is None else fraccion_minima
+        self.intervalo_max_s = constants.INTERVALO_MAX_SIN_PROCESAR_FACIAL_S if intervalo_max_s is None else intervalo_max_s
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Olvida el frame de referencia: el siguiente frame siempre se procesa."""
+        self.referencia = None
+        self.t_ultimo_envio = 0.0
+
+    def _miniatura(self, frame):
+        alto, ancho = frame.shape[:2]
+        escala = ANCHO_MINIATURA_MOVIMIENTO / float(ancho)
+        if escala < 1.0: # Reducir antes de convertir: la conversión a gris se hace sobre la miniatura
+            frame = cv2.resize(frame, (ANCHO_MINIATURA_MOVIMIENTO, max(1, int(alto * escala))), interpolation=cv2.INTER_AREA)
+        gris = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.ndim == 3 else frame
+        return cv2.GaussianBlur(gris, (5, 5), 0)
+
+    def hay_movimiento(self, frame, ahora=None):
+        """
+        Devuelve True si el frame debe pasar a la detección facial. La referencia solo se
+        actualiza con los frames que pasan, así que un cambio lento termina superando el umbral.
+        Acepta frames RGB o BGR (solo se comparan intensidades entre frames del mismo origen).
+        """
+        ahora = time.time() if ahora is None else ahora
+        instrumentacion.incrementar_contador("facial_frames_camara")
+        miniatura = self._miniatura(frame)
+
+        pasa = (self.referencia is None or self.referencia.shape != miniatura.shape or
+                ahora - self.t_ultimo_envio >= self.intervalo_max_s)
+        if not pasa:
+            diferencia = cv2.absdiff(miniatura, self.referencia)
+            fraccion_cambiada = np.count_nonzero(diferencia > self.umbral_pixel) / float(diferencia.size)
+            pasa = fraccion_cambiada >= self.fraccion_minima
+
+        if pasa:
+            self.referencia = miniatura
+            self.t_ultimo_envio = ahora
+        else:
+            instrumentacion.incrementar_contador("facial_omitidos_sin_movimiento")
+        return pasa
+
+
+# --- Pre-detector Haar/LBP (se ejecuta dentro de los procesos del pool) ---
+clasificador_haar = None        # Uno por proceso, cargado la primera vez que se usa
+clasificador_haar_no_disponible = False
+
+def _obtener_clasificador_haar():
+    global clasificador_haar, clasificador_haar_no_disponible
+    if clasificador_haar is not None or clasificador_haar_no_disponible:
+        return clasificador_haar
+    ruta = constants.ARCHIVO_CASCADA_HAAR
+    if not ruta:
+        ruta = cv2.data.haarcascades + "haarcascade_frontalface_default.xml" if hasattr(cv2, "data") else ""
+    # OpenCV 5 sacó CascadeClassifier del módulo principal: en ese caso no hay pre-detector
+    clasificador = cv2.CascadeClassifier(ruta) if ruta and hasattr(cv2, "CascadeClassifier") else None
+    if clasificador is None or clasificador.empty():
+        print(f"ADVERTENCIA: No se pudo cargar el clasificador Haar/LBP '{ruta}'. Se usará HOG sobre el frame completo.")
+        clasificador_haar_no_disponible = True
+        return None
+    clasificador_haar = clasificador
+    return clasificador_haar
+
+def regiones_candidatas_haar(frame_rgb, margen=None):
+    """
+    Ejecuta el pre-detector y devuelve las regiones donde tiene sentido ejecutar HOG,
+    como lista de (top, right, bottom, left) ya ampliadas y fusionadas si se solapan.
+
+    Returns:
+        list | None: [] si no hay candidatos (se puede omitir HOG), o None si el
+                     pre-detector no está disponible o no aporta ahorro (HOG sobre el frame completo).
+    """
+    clasificador = _obtener_clasificador_haar()
+    if clasificador is None:
+        return None
+    margen = constants.MARGEN_REGION_HAAR if margen is None else margen
+    alto, ancho = frame_rgb.shape[:2]
+    gris = cv2.equalizeHist(cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY))
+    cajas = clasificador.detectMultiScale(gris, scaleFactor=1.1, minNeighbors=3, minSize=(24, 24))
+
+    regiones = []
+    for (x, y, w, h) in cajas:
+        dx, dy = int(w * margen), int(h * margen)
+        regiones.append([max(0, y - dy), min(ancho, x + w + dx), min(alto, y + h + dy), max(0, x - dx)])
+    regiones = _fusionar_regiones(regiones)
+
+    area_regiones = sum((b - t) * (r - l) for t, r, b, l in regiones)
+    if area_regiones > FRACCION_MAXIMA_REGIONES * alto * ancho:
+        return None
+    return [tuple(r) for r in regiones]
+
+def _fusionar_regiones(regiones):
+    """Une regiones que se solapan para no ejecutar HOG dos veces sobre los mismos píxeles."""
+    fusionadas = []
+    for region in sorted(regiones, key=lambda r: r[3]):
+        for otra in fusionadas:
+            if region[0] < otra[2] and region[2] > otra[0] and region[3] < otra[1] and region[1] > otra[3]:
+                otra[0], otra[1] = min(otra[0], region[0]), max(otra[1], region[1])
+                otra[2], otra[3] = max(otra[2], region[2]), min(otra[3], region[3])
+                break
+        else:
+            fusionadas.append(list(region))
+    return fusionadas
+
+def localizar_rostros_en_regiones(frame_rgb, regiones, detectar=None):
+    """
+    Ejecuta el detector solo dentro de cada región y devuelve las ubicaciones en coordenadas del frame.
+    'detectar' es el detectar() del backend facial (por defecto, HOG de face_recognition).
+    """
+    if detectar is None:
+        detectar = lambda imagen: face_recognition.face_locations(imagen, model="hog")
+    ubicaciones = []
+    for top, right, bottom, left in regiones:
+        recorte = np.ascontiguousarray(frame_rgb[top:bottom, left:right])
+        for (t, r, b, l) in detectar(recorte):
+            ubicaciones.append((t + top, r + left, b + top, l + left))
+    return ubicaciones
@@ -56,12 +56,17 @@ def guardar_configuracion(nuevas_configuraciones):
 # --- Configuración de Comunicación Serial ---
 VELOCIDAD_ARDUINO = get_config("VELOCIDAD_ARDUINO", 115200)
 TIMEOUT_SERIAL = get_config("TIMEOUT_SERIAL", 1)  # Segundos para timeout en lecturas seriales
+USAR_PROTOCOLO_BINARIO_ARDUINO = get_config("USAR_PROTOCOLO_BINARIO_ARDUINO", True) # Negociar tramas binarias tras ARDUINO_LISTO (protocolo_serial.py)
+TIMEOUT_NEGOCIACION_PROTOCOLO_S = get_config("TIMEOUT_NEGOCIACION_PROTOCOLO_S", 0.5) # Sin respuesta en este tiempo se sigue con texto
+TIMEOUT_ARDUINO_LISTO_S = get_config("TIMEOUT_ARDUINO_LISTO_S", 7) # Reinicio del Arduino al abrir el puerto + envío de ARDUINO_LISTO
 
 # --- Nombres de Archivos y Carpetas ---
 NOMBRE_BD = get_config("NOMBRE_BD", "sistema_acceso.db")
 ARCHIVO_ESTADO_DIARIO = get_config("ARCHIVO_ESTADO_DIARIO", "estado_diario.json")
 CARPETA_REPORTES = get_config("CARPETA_REPORTES", "reportes_acceso")
 ARCHIVO_ENCODINGS_FACIALES_PKL = get_config("ARCHIVO_ENCODINGS_FACIALES_PKL", "encodings_faciales.pkl")
+ARCHIVO_SNAPSHOT_GALERIA = get_config("ARCHIVO_SNAPSHOT_GALERIA", "galeria_facial")   # Prefijo de los archivos del snapshot de la galería (junto a la BD)
+USAR_SNAPSHOT_GALERIA = get_config("USAR_SNAPSHOT_GALERIA", True)                   # Arrancar desde el snapshot mapeado en memoria si la BD no cambió
 ROSTROS_CONOCIDOS_DIR = get_config("ROSTROS_CONOCIDOS_DIR", "rostros_conocidos") # Usado por facial_recognition_utils.py
 
 # --- Parámetros de Sensores y Puerta ---
@@ -88,11 +93,88 @@ TIEMPO_COOLDOWN_ACCESO_S = get_config("TIEMPO_COOLDOWN_ACCESO_S", 30)
 
 # --- Parámetros de Cámara y Reconocimiento Facial ---
 INDICE_CAMARA = get_config("INDICE_CAMARA", 1)                          # Índice de la cámara a usar (0 suele ser la integrada, 1 podría ser DroidCam)
-FACTOR_REDUCCION_FRAME_FACIAL = get_config("FACTOR_REDUCCION_FRAME_FACIAL", 0.5)        # Factor para redimensionar frames al procesar rostros (0.25 - 1.0)
+FUENTE_CAMARA = get_config("FUENTE_CAMARA", "")                          # "" = cámara en vivo; ruta a un video o carpeta de imágenes = reproducción (fuentes_frames.py)
+VELOCIDAD_REPRODUCCION_FUENTE = get_config("VELOCIDAD_REPRODUCCION_FUENTE", "real") # "real" (ritmo de la grabación) o "maxima" (sin esperas)
+FPS_FUENTE_IMAGENES = get_config("FPS_FUENTE_IMAGENES", 15.0)            # Frames por segundo al reproducir una carpeta de imágenes
+TIEMPO_RETENCION_CAMARA_S = get_config("TIEMPO_RETENCION_CAMARA_S", 30.0) # La cámara sigue abierta este tiempo tras dejar de usarse (servicio_captura.py)
+FPS_MAX_VISTA_PREVIA = get_config("FPS_MAX_VISTA_PREVIA", 15.0)          # Frames por segundo como máximo en la vista previa de la GUI (canal_vista_previa.py)
+
+# --- Escaneo de Códigos QR (ver escaner_qr.py) ---
+ESCALA_REDUCIDA_QR = get_config("ESCALA_REDUCIDA_QR", 0.5)              # Escala de la pasada rápida sobre el frame entero (1.0 = sin pasada reducida)
+MARGEN_ROI_QR = get_config("MARGEN_ROI_QR", 0.5)                        # Margen alrededor de la caja del último código, en fracción de su tamaño
+VIGENCIA_ROI_QR_S = get_config("VIGENCIA_ROI_QR_S", 1.0)                # Segundos durante los que se prueba primero la caja del último código
+PASADA_COMPLETA_QR_CADA_N = get_config("PASADA_COMPLETA_QR_CADA_N", 4)  # Pasada a resolución completa cada N frames sin código (0 = nunca)
+USAR_QR_FACIAL_SIMULTANEO = get_config("USAR_QR_FACIAL_SIMULTANEO", True) # "QR + Facial": leer el QR y buscar el rostro en los mismos frames (False = primero QR, luego facial)
+
+# --- Credenciales QR Firmadas (ver credenciales_qr.py) ---
+ARCHIVO_CLAVE_CREDENCIALES_QR = get_config("ARCHIVO_CLAVE_CREDENCIALES_QR", "clave_credenciales_qr.key") # Clave HMAC, junto a la BD (se crea si no existe)
+VALIDEZ_CREDENCIAL_QR_S = get_config("VALIDEZ_CREDENCIAL_QR_S", 300)                  # Segundos de validez de una credencial emitida
+TAMANO_CACHE_CREDENCIALES_QR = get_config("TAMANO_CACHE_CREDENCIALES_QR", 256)        # Credenciales verificadas que se recuerdan (LRU)
+
+# --- Precalentamiento de Cámara y Detector al Acercarse Alguien (ver precalentamiento.py) ---
+USAR_PRECALENTAMIENTO_CAMARA = get_config("USAR_PRECALENTAMIENTO_CAMARA", True)
+UMBRAL_PRECALENTAMIENTO_SP1_CM = get_config("UMBRAL_PRECALENTAMIENTO_SP1_CM", 80.0)     # Precalentar si SP1 mide menos (debe ser mayor que UMBRAL_DETECCION_SP1_CM)
+VELOCIDAD_ACERCAMIENTO_SP1_CM_S = get_config("VELOCIDAD_ACERCAMIENTO_SP1_CM_S", 15.0)   # ...o si la distancia baja más rápido que esto
+VENTANA_TENDENCIA_SP1_S = get_config("VENTANA_TENDENCIA_SP1_S", 0.6)                   # Lecturas de SP1 usadas para calcular la tendencia
+DISTANCIA_MAX_TENDENCIA_SP1_CM = get_config("DISTANCIA_MAX_TENDENCIA_SP1_CM", 200.0)   # Lecturas más lejanas no cuentan para la tendencia
+FACTOR_REDUCCION_FRAME_FACIAL = get_config("FACTOR_REDUCCION_FRAME_FACIAL", 0.5)        # Factor para redimensionar frames al procesar rostros (0.25 - 1.0). Escala inicial si el escalado adaptativo está activo
 TOLERANCIA_FACIAL = get_config("TOLERANCIA_FACIAL", 0.6)                    # Tolerancia para la comparación de rostros (más bajo = más estricto)
-
-# --- (Opcional) Cadenas de Texto Específicas ---
-CADENA_QR_ESPERADA_ESTATICO = "12 34 21 32 A2 6F 8B" # Cadena para el QR estático de prueba
+USAR_POOL_DETECCION_FACIAL = get_config("USAR_POOL_DETECCION_FACIAL", True)  # Detección/encoding en procesos aparte (False = en el hilo de la FSM)
+NUM_PROCESOS_DETECCION_FACIAL = get_config("NUM_PROCESOS_DETECCION_FACIAL", 0) # Procesos del pool (0 = núcleos - 1)
+TAMANO_COLA_FRAMES_FACIAL = get_config("TAMANO_COLA_FRAMES_FACIAL", 2)         # Frames pendientes como máximo (se descarta el más antiguo)
+
+# --- Backend de Detección/Encoding Facial (ver backends_faciales.py) ---
+BACKEND_FACIAL = get_config("BACKEND_FACIAL", "dlib")                             # "dlib" (face_recognition) o "yunet" (detector DNN de OpenCV + encoder dlib)
+MODELO_DETECCION_DLIB = get_config("MODELO_DETECCION_DLIB", "hog")                # Detector de dlib: "hog" o "cnn"
+ARCHIVO_MODELO_YUNET = get_config("ARCHIVO_MODELO_YUNET", "face_detection_yunet_2023mar.onnx") # Modelo ONNX de YuNet (opencv_zoo)
+UMBRAL_CONFIANZA_YUNET = get_config("UMBRAL_CONFIANZA_YUNET", 0.8)                # Confianza mínima de una detección YuNet
+UMBRAL_NMS_YUNET = get_config("UMBRAL_NMS_YUNET", 0.3)                            # Supresión de no-máximos de YuNet
+
+# --- Cascada de Detección Facial (ver cascada_deteccion.py) ---
+USAR_FILTRO_MOVIMIENTO_FACIAL = get_config("USAR_FILTRO_MOVIMIENTO_FACIAL", True)       # No enviar a HOG frames sin cambios respecto al último procesado
+UMBRAL_DIFERENCIA_PIXEL_MOVIMIENTO = get_config("UMBRAL_DIFERENCIA_PIXEL_MOVIMIENTO", 15) # Diferencia de gris (0-255) para considerar que un píxel cambió
+FRACCION_MINIMA_MOVIMIENTO = get_config("FRACCION_MINIMA_MOVIMIENTO", 0.01)             # Fracción de píxeles cambiados para considerar que hay movimiento
+INTERVALO_MAX_SIN_PROCESAR_FACIAL_S = get_config("INTERVALO_MAX_SIN_PROCESAR_FACIAL_S", 1.0) # Se procesa un frame como mínimo cada este intervalo
+USAR_PREFILTRO_HAAR_FACIAL = get_config("USAR_PREFILTRO_HAAR_FACIAL", False)           # Pre-detector Haar/LBP: sin candidatos se omite HOG; con candidatos HOG solo en sus regiones
+ARCHIVO_CASCADA_HAAR = get_config("ARCHIVO_CASCADA_HAAR", "")                          # XML Haar o LBP ("" = haarcascade_frontalface_default.xml de OpenCV)
+MARGEN_REGION_HAAR = get_config("MARGEN_REGION_HAAR", 0.4)                             # Ampliación de cada caja Haar (fracción de su tamaño) antes de pasar a HOG
+
+# --- Seguimiento de Rostros entre Frames (ver seguimiento_facial.py) ---
+USAR_SEGUIMIENTO_FACIAL = get_config("USAR_SEGUIMIENTO_FACIAL", True)                   # Reutilizar el encoding de una pista confiable en lugar de recalcularlo
+IOU_MINIMO_SEGUIMIENTO = get_config("IOU_MINIMO_SEGUIMIENTO", 0.4)                     # Solapamiento mínimo para asociar una caja con una pista
+MARGEN_CONFIANZA_SEGUIMIENTO = get_config("MARGEN_CONFIANZA_SEGUIMIENTO", 0.08)        # Distancias a menos de esto de TOLERANCIA_FACIAL se recalculan siempre
+MAX_SEGUNDOS_SIN_RECODIFICAR = get_config("MAX_SEGUNDOS_SIN_RECODIFICAR", 2.0)         # Edad máxima del encoding de una pista
+DERIVA_MAXIMA_SEGUIMIENTO = get_config("DERIVA_MAXIMA_SEGUIMIENTO", 0.35)              # Desplazamiento/escala relativa desde el último encoding que obliga a recalcular
+MAX_SEGUNDOS_PISTA_SIN_VER = get_config("MAX_SEGUNDOS_PISTA_SIN_VER", 1.0)             # Se descarta una pista que no se ve durante este tiempo
+
+# --- Escalado Adaptativo del Frame Facial (ver escalado_adaptativo.py) ---
+USAR_ESCALADO_ADAPTATIVO_FACIAL = get_config("USAR_ESCALADO_ADAPTATIVO_FACIAL", True)   # False = siempre FACTOR_REDUCCION_FRAME_FACIAL sobre el frame completo
+PRESUPUESTO_LATENCIA_FACIAL_MS = get_config("PRESUPUESTO_LATENCIA_FACIAL_MS", 80)       # Tiempo objetivo de detección + encoding por frame
+ESCALA_MINIMA_FACIAL = get_config("ESCALA_MINIMA_FACIAL", 0.25)                         # Límites de la escala elegida
+ESCALA_MAXIMA_FACIAL = get_config("ESCALA_MAXIMA_FACIAL", 1.0)
+TAMANO_MIN_ROSTRO_PX = get_config("TAMANO_MIN_ROSTRO_PX", 50)                           # Altura mínima del rostro tras reducir (por debajo HOG deja de detectarlo)
+TAMANO_OBJETIVO_ROSTRO_PX = get_config("TAMANO_OBJETIVO_ROSTRO_PX", 120)                # Altura suficiente para el encoder; rostros mayores se reducen más
+MARGEN_ROI_FACIAL = get_config("MARGEN_ROI_FACIAL", 1.0)                                # Recorte alrededor del último rostro (fracción de su tamaño por lado)
+VIGENCIA_ROI_FACIAL_S = get_config("VIGENCIA_ROI_FACIAL_S", 1.5)                        # Sin rostro durante este tiempo se vuelve al frame completo
+
+# --- Fusión Temporal de la Decisión Facial (ver fusion_temporal.py) ---
+MODO_FUSION_FACIAL = get_config("MODO_FUSION_FACIAL", "k_de_n")                         # "frame_unico", "k_de_n" o "media"
+VENTANA_FUSION_FACIAL = get_config("VENTANA_FUSION_FACIAL", 5)                          # n: observaciones (encodings nuevos) recordadas por pista
+K_FUSION_FACIAL = get_config("K_FUSION_FACIAL", 2)                                      # k: votos <= TOLERANCIA_FACIAL (o mínimo de observaciones para "media")
+DISTANCIA_ACEPTACION_INMEDIATA = get_config("DISTANCIA_ACEPTACION_INMEDIATA", 0.45)     # Una sola observación por debajo de esto acepta sin esperar votos
+
+# --- Índice de Búsqueda Facial 1:N (ver indice_facial.py) ---
+TIPO_INDICE_FACIAL = get_config("TIPO_INDICE_FACIAL", "exacto")                 # "exacto" (fuerza bruta) o "ivf" (aproximado, para galerías grandes)
+MIN_ENCODINGS_PARA_INDICE_IVF = get_config("MIN_ENCODINGS_PARA_INDICE_IVF", 5000) # Por debajo de este tamaño se usa siempre el índice exacto
+IVF_NUM_LISTAS = get_config("IVF_NUM_LISTAS", 0)                                # Listas invertidas del cuantizador grueso (0 = automático, ~4*sqrt(N))
+IVF_NPROBE = get_config("IVF_NPROBE", 8)                                        # Listas visitadas por consulta (más alto = más recall, más lento)
+IVF_SUBVECTORES_PQ = get_config("IVF_SUBVECTORES_PQ", 0)                        # Subvectores de cuantización de producto (0 = sin PQ; debe dividir 128)
+IVF_TOP_K_RERANKING = get_config("IVF_TOP_K_RERANKING", 10)                     # Candidatos re-ordenados con la distancia exacta
+
+# --- Varios Encodings por Usuario (tabla encodings_faciales) ---
+MAX_ENCODINGS_POR_USUARIO = get_config("MAX_ENCODINGS_POR_USUARIO", 5)           # Muestras guardadas por usuario (se descartan las más antiguas)
+CANDIDATOS_REPUNTUACION_MUESTRAS = get_config("CANDIDATOS_REPUNTUACION_MUESTRAS", 5) # Usuarios (por centroide) re-puntuados con todas sus muestras en 1:N
+FRAMES_CAPTURA_ROSTRO_FORMULARIO = get_config("FRAMES_CAPTURA_ROSTRO_FORMULARIO", 10) # Frames probados por "Capturar Rostro" del formulario antes de rendirse
 
 # --- Textos para la GUI (opcional, para facilitar internacionalización futura) ---
 # Por ahora, los mantenemos directamente en gui_manager.py
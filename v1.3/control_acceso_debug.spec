@@ -20,6 +20,22 @@ a = Analysis(
         ('validation_logic.py', '.'),
         ('buscar_camaras.py', '.'),
         ('global_state.py', '.'),
+        ('indice_facial.py', '.'),
+        ('procesamiento_facial.py', '.'),
+        ('instrumentacion.py', '.'),
+        ('cascada_deteccion.py', '.'),
+        ('seguimiento_facial.py', '.'),
+        ('fusion_temporal.py', '.'),
+        ('escalado_adaptativo.py', '.'),
+        ('backends_faciales.py', '.'),
+        ('fuentes_frames.py', '.'),
+        ('servicio_captura.py', '.'),
+        ('precalentamiento.py', '.'),
+        ('canal_vista_previa.py', '.'),
+        ('renderizador_vista_previa.py', '.'),
+        ('escaner_qr.py', '.'),
+        ('credenciales_qr.py', '.'),
+        ('protocolo_serial.py', '.'),
         ('requirements.txt', '.'),
         ('file_version_info.txt', '.'),
         # Carpetas necesarias
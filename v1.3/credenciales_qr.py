@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+import collections
+
+try:
+    import constants
+    import instrumentacion
+    import db_manager
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py, instrumentacion.py o db_manager.py no encontrados en credenciales_qr.py.")
+    class constants: ARCHIVO_CLAVE_CREDENCIALES_QR = "clave_credenciales_qr.key"; VALIDEZ_CREDENCIAL_QR_S = 300; TAMANO_CACHE_CREDENCIALES_QR = 256
+    class instrumentacion: incrementar_contador = lambda n, c=1: None; registrar_tiempo = lambda n, s: None
+    db_manager = None
+
+# ==============================================================================
+# CREDENCIALES QR FIRMADAS (HMAC)
+# ==============================================================================
+# Antes cualquier QR con contenido daba acceso como "Usuario QR". Ahora el QR lleva una
+# credencial firmada con la clave de esta instalación:
+#
+#   ACQR1.<id_usuario>.<expira_epoch>.<nonce>.<firma>
+#
+# firma = HMAC-SHA256(clave, "ACQR1.<id_usuario>.<expira_epoch>.<nonce>"), 16 bytes en base64url.
+# La clave (32 bytes aleatorios) se crea la primera vez en ARCHIVO_CLAVE_CREDENCIALES_QR, junto
+# a la BD con permisos 0600; sin ella no se pueden emitir credenciales válidas. No debe
+# versionarse (está en .gitignore).
+#
+# La verificación es local:
+#   - Caché LRU (TAMANO_CACHE_CREDENCIALES_QR) de credenciales con la firma ya comprobada y los
+#     datos del usuario: el escáner decodifica el mismo QR varias veces por segundo y antes cada
+#     lectura habría supuesto el HMAC y una consulta a la BD. Las altas/bajas/actualizaciones de
+#     usuarios invalidan sus entradas (db_manager.registrar_oyente_cambios_usuarios).
+#   - Protección contra repetición: cada credencial da acceso una sola vez. Su nonce se guarda
+#     hasta que la credencial expira (después ya se rechaza por expirada) y entonces se descarta.
+#     El conjunto vive en memoria: tras reiniciar la aplicación solo protege la expiración.
+
+PREFIJO_CREDENCIAL = "ACQR1"
+BYTES_FIRMA = 16
+BYTES_NONCE = 8
+MOTIVO_SIN_FORMATO = "QR sin formato de credencial" # El FSM ignora estos QR (no son credenciales)
+PATRON_CREDENCIAL = re.compile(r"(ACQR1\.(\d{1,10})\.(\d{1,12})\.([0-9a-f]{16}))\.([A-Za-z0-9_-]{22})", re.ASCII)
+
+# --- Variables Globales del Módulo ---
+lock_credenciales = threading.Lock() # Protege clave, caché y nonces
+clave_credenciales = None            # bytes, cargada en el primer uso
+cache_verificadas = collections.OrderedDict() # credencial -> (id_usuario, expira, nonce, usuario_info)
+nonces_usados = {}                            # nonce -> expira (epoch)
+nonces_por_expiracion = collections.deque()   # (expira, nonce) en orden de registro, para descartar
+
+
+def _ruta_clave():
+    carpeta = os.path.dirname(db_manager.NOMBRE_BD) if db_manager is not None else ""
+    return os.path.join(carpeta, constants.ARCHIVO_CLAVE_CREDENCIALES_QR)
+
+def _obtener_clave():
+    """Clave HMAC de la instalación; se genera y guarda si aún no existe. Llamar con el lock tomado."""
+    global clave_credenciales
+    if clave_credenciales is None:
+        ruta = _ruta_clave()
+        if os.path.exists(ruta):
+            with open(ruta, "rb") as f:
+                clave_credenciales = f.read()
+        else:
+            clave_credenciales = secrets.token_bytes(32)
+            # Solo legible por el usuario de la aplicación; O_EXCL: nunca sobrescribir una clave existente
+            descriptor = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(clave_credenciales)
+            print(f"Clave de credenciales QR creada en '{ruta}'.")
+    return clave_credenciales
+
+def _b64(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode("ascii")
+
+def _firmar(clave, cuerpo):
+    return _b64(hmac.new(clave, cuerpo.encode("ascii"), hashlib.sha256).digest()[:BYTES_FIRMA])
+
+def generar_credencial_qr(id_usuario, validez_s=None):
+    """Devuelve el texto a codificar en el QR para 'id_usuario', válido 'validez_s' segundos."""
+    if validez_s is None:
+        validez_s = constants.VALIDEZ_CREDENCIAL_QR_S
+    expira = int(time.time() + validez_s)
+    cuerpo = f"{PREFIJO_CREDENCIAL}.{int(id_usuario)}.{expira}.{secrets.token_hex(BYTES_NONCE)}"
+    with lock_credenciales:
+        clave = _obtener_clave()
+    return f"{cuerpo}.{_firmar(clave, cuerpo)}"
+
+def _descartar_nonces_expirados(ahora):
+    while nonces_por_expiracion and nonces_por_expiracion[0][0] < ahora:
+        _, nonce = nonces_por_expiracion.popleft()
+        nonces_usados.pop(nonce, None)
+
+def _verificar_firma(credencial):
+    """(id_usuario, expira, nonce) si el formato y la firma son correctos; si no, el motivo (str)."""
+    coincidencia = PATRON_CREDENCIAL.fullmatch(credencial)
+    if coincidencia is None:
+        return MOTIVO_SIN_FORMATO
+    cuerpo, id_txt, expira_txt, nonce, firma = coincidencia.groups()
+    with lock_credenciales:
+        clave = _obtener_clave()
+    if not hmac.compare_digest(firma, _firmar(clave, cuerpo)):
+        return "Firma de QR inválida"
+    return int(id_txt), int(expira_txt), nonce
+
+def verificar_credencial_qr(credencial, consumir=True, ahora=None):
+    """
+    Verifica el texto leído de un QR. Devuelve (usuario_info, None) si es válido o
+    (None, motivo) si no. Con consumir=True la credencial queda usada y no vuelve a valer.
+    """
+    t_inicio = time.perf_counter()
+    ahora = time.time() if ahora is None else ahora
+    with lock_credenciales:
+        entrada = cache_verificadas.get(credencial)
+        if entrada is not None:
+            cache_verificadas.move_to_end(credencial)
+    if entrada is not None:
+        instrumentacion.incrementar_contador("qr_credenciales_cache_aciertos")
+    else:
+        instrumentacion.incrementar_contador("qr_credenciales_cache_fallos")
+        verificada = _verificar_firma(credencial)
+        if isinstance(verificada, str):
+            instrumentacion.incrementar_contador("qr_credenciales_rechazadas")
+            return None, verificada
+        id_usuario, expira, nonce = verificada
+        usuario_info = db_manager.obtener_usuario_por_id_bd(id_usuario) if expira >= ahora else None
+        entrada = (id_usuario, expira, nonce, usuario_info)
+        if usuario_info is not None:
+            with lock_credenciales:
+                cache_verificadas[credencial] = entrada
+                while len(cache_verificadas) > constants.TAMANO_CACHE_CREDENCIALES_QR:
+                    cache_verificadas.popitem(last=False)
+    id_usuario, expira, nonce, usuario_info = entrada
+    motivo = None
+    with lock_credenciales:
+        _descartar_nonces_expirados(ahora)
+        if expira < ahora:
+            motivo = "QR expirado"
+            cache_verificadas.pop(credencial, None)
+        elif usuario_info is None:
+            motivo = "Usuario del QR no registrado"
+        elif nonce in nonces_usados:
+            motivo = "QR ya utilizado"
+        elif consumir:
+            nonces_usados[nonce] = expira
+            nonces_por_expiracion.append((expira, nonce))
+    instrumentacion.registrar_tiempo("qr_verificacion_credencial", time.perf_counter() - t_inicio)
+    if motivo is not None:
+        instrumentacion.incrementar_contador("qr_credenciales_rechazadas")
+        return None, motivo
+    return usuario_info, None
+
+def _al_cambiar_usuario_bd(operacion, id_usuario, usuario_info=None):
+    """Oyente de db_manager: descarta de la caché las credenciales del usuario modificado."""
+    with lock_credenciales:
+        for credencial in [c for c, e in cache_verificadas.items() if str(e[0]) == str(id_usuario)]:
+            del cache_verificadas[credencial]
+
+if db_manager is not None:
+    db_manager.registrar_oyente_cambios_usuarios(_al_cambiar_usuario_bd)
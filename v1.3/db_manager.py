@@ -1,7 +1,11 @@
 import sqlite3
 import os
-import pickle # Para serializar/deserializar el facial_encoding
+import pickle # Solo para migrar los encodings guardados con el formato antiguo
+import struct
 import sys
+import datetime
+import random
+import numpy as np
 
 # Determinar la ubicación de la base de datos
 if getattr(sys, 'frozen', False):
@@ -19,6 +23,118 @@ NOMBRE_BD = os.path.join(application_path, constants.NOMBRE_BD)
 # --- Constantes del Módulo (ahora desde constants.py) ---
 # CARPETA_REPORTES se gestiona desde constants.py, no es necesaria una definición local aquí
 
+# --- Oyentes de Cambios de Usuarios ---
+# Otros módulos (p. ej., la galería facial en memoria de facial_recognition_utils.py) se
+# registran aquí para enterarse de cada alta/actualización/baja sin que db_manager los importe.
+oyentes_cambios_usuarios = []
+
+def registrar_oyente_cambios_usuarios(oyente):
+    """'oyente(operacion, id_usuario, usuario_info)' con operacion "alta", "actualizacion" o "baja"."""
+    if oyente not in oyentes_cambios_usuarios:
+        oyentes_cambios_usuarios.append(oyente)
+
+def _notificar_cambio_usuario(operacion, id_usuario, usuario_info=None):
+    for oyente in list(oyentes_cambios_usuarios):
+        try:
+            oyente(operacion, id_usuario, usuario_info)
+        except Exception as e:
+            print(f"Error al notificar el cambio '{operacion}' del usuario ID {id_usuario}: {e}")
+
+# --- Formato Binario del Encoding Facial ---
+# El BLOB facial_encoding es una cabecera de 8 bytes seguida de los valores en bruto:
+#   "FENC" | versión (uint8) | tipo (uint8, 1 = float32 little-endian) | dimensión (uint16 LE)
+# Se lee con np.frombuffer sin copiar (el array resultante es de solo lectura).
+# Antes se guardaba pickle.dumps(ndarray float64); migrar_encodings_a_formato_binario()
+# convierte esas filas una sola vez (se llama desde inicializar_bd()).
+MAGIA_ENCODING = b"FENC"
+VERSION_FORMATO_ENCODING = 1
+TIPO_FLOAT32_LE = 1
+CABECERA_ENCODING = struct.Struct("<4sBBH")
+
+def serializar_encoding(encoding):
+    """Array NumPy (cualquier tipo numérico, 1D) -> BLOB en el formato binario."""
+    valores = np.ascontiguousarray(np.asarray(encoding).ravel(), dtype='<f4')
+    return CABECERA_ENCODING.pack(MAGIA_ENCODING, VERSION_FORMATO_ENCODING, TIPO_FLOAT32_LE, len(valores)) + valores.tobytes()
+
+def deserializar_encoding(blob):
+    """BLOB en el formato binario -> array float32 (vista de solo lectura sobre el BLOB). None si no hay BLOB."""
+    if not blob:
+        return None
+    if len(blob) < CABECERA_ENCODING.size:
+        raise ValueError("BLOB de encoding demasiado corto.")
+    magia, version, tipo, dimension = CABECERA_ENCODING.unpack_from(blob)
+    if magia != MAGIA_ENCODING or version != VERSION_FORMATO_ENCODING or tipo != TIPO_FLOAT32_LE:
+        raise ValueError("Formato de encoding desconocido (¿fila sin migrar?).")
+    if len(blob) != CABECERA_ENCODING.size + 4 * dimension:
+        raise ValueError("Longitud del BLOB de encoding inconsistente con su cabecera.")
+    return np.frombuffer(blob, dtype='<f4', count=dimension, offset=CABECERA_ENCODING.size)
+
+def migrar_encodings_a_formato_binario(conn):
+    """
+    Convierte los encodings guardados con pickle al formato binario, en una sola transacción.
+    Solo se hace pickle.loads de las filas que aún no tienen la cabecera del nuevo formato.
+    Devuelve el número de filas migradas.
+    """
+    filas = conn.execute(
+        "SELECT id_usuario, facial_encoding FROM usuarios WHERE facial_encoding IS NOT NULL AND substr(facial_encoding, 1, 4) != ?",
+        (MAGIA_ENCODING,)).fetchall()
+    migradas = []
+    for id_usuario, blob in filas:
+        try:
+            migradas.append((serializar_encoding(pickle.loads(blob)), id_usuario))
+        except Exception as e:
+            print(f"Error al migrar el encoding del usuario ID {id_usuario}: {e}")
+    if migradas:
+        conn.executemany("UPDATE usuarios SET facial_encoding = ? WHERE id_usuario = ?", migradas)
+        print(f"Encodings faciales migrados al formato binario: {len(migradas)}.")
+    return len(migradas)
+
+# --- Muestras Faciales por Usuario ---
+# Cada usuario puede tener hasta MAX_ENCODINGS_POR_USUARIO muestras en encodings_faciales.
+# Los diccionarios de usuario llevan 'facial_encoding_array' (el centroide) y
+# 'facial_encodings_muestras': array K x 128 si el usuario tiene más de una muestra, o None
+# si solo tiene una (entonces la muestra es el propio centroide).
+
+def _insertar_muestra(conn, id_usuario, encoding, origen):
+    conn.execute("INSERT INTO encodings_faciales (id_usuario, encoding, origen, fecha_registro) VALUES (?, ?, ?, ?)",
+                 (id_usuario, serializar_encoding(encoding), origen, datetime.datetime.now().isoformat(timespec="seconds")))
+
+def _recalcular_centroide(conn, id_usuario):
+    """Descarta las muestras más antiguas que sobran y guarda la media de las restantes en usuarios.facial_encoding."""
+    filas = conn.execute("SELECT id_encoding, encoding FROM encodings_faciales WHERE id_usuario = ? ORDER BY id_encoding DESC",
+                         (id_usuario,)).fetchall()
+    sobrantes = filas[constants.MAX_ENCODINGS_POR_USUARIO:]
+    if sobrantes:
+        conn.executemany("DELETE FROM encodings_faciales WHERE id_encoding = ?", [(f[0],) for f in sobrantes])
+        filas = filas[:constants.MAX_ENCODINGS_POR_USUARIO]
+    centroide = np.mean([deserializar_encoding(f[1]) for f in filas], axis=0) if filas else None
+    conn.execute("UPDATE usuarios SET facial_encoding = ? WHERE id_usuario = ?",
+                 (serializar_encoding(centroide) if centroide is not None else None, id_usuario))
+
+def _obtener_muestras(conn, id_usuario):
+    filas = conn.execute("SELECT encoding FROM encodings_faciales WHERE id_usuario = ? ORDER BY id_encoding", (id_usuario,)).fetchall()
+    return np.stack([deserializar_encoding(f[0]) for f in filas]) if len(filas) > 1 else None
+
+def agregar_encoding_facial_bd(id_usuario, encoding, origen="captura"):
+    """
+    Añade una muestra facial al usuario (sin borrar las anteriores) y recalcula su centroide.
+    Devuelve (True, "mensaje") o (False, "mensaje de error").
+    """
+    conn = sqlite3.connect(NOMBRE_BD)
+    try:
+        with conn:
+            if conn.execute("SELECT 1 FROM usuarios WHERE id_usuario = ?", (id_usuario,)).fetchone() is None:
+                return False, "Error: El usuario no existe."
+            _insertar_muestra(conn, id_usuario, encoding, origen)
+            _recalcular_centroide(conn, id_usuario)
+    except sqlite3.Error as e:
+        print(f"Error al agregar muestra facial: {e}")
+        return False, f"Error al agregar muestra facial: {e}"
+    finally:
+        conn.close()
+    _notificar_cambio_usuario("actualizacion", id_usuario, obtener_usuario_por_id_bd(id_usuario))
+    return True, "Muestra facial agregada."
+
 # ==============================================================================
 # FUNCIONES DE LA BASE DE DATOS (SQLite)
 # ==============================================================================
@@ -45,10 +161,76 @@ def inicializar_bd():
             facial_encoding BLOB
         )
     ''')
+
+    # Contador de cambios de la tabla usuarios (lo mantienen los triggers, incluso si otra
+    # herramienta modifica la BD). 'id_bd' distingue esta BD de otra con el mismo contador.
+    # Lo usa el snapshot de la galería facial para saber si sigue vigente.
+    cursor.execute("CREATE TABLE IF NOT EXISTS contador_cambios (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO contador_cambios (clave, valor) VALUES ('usuarios', 0)")
+    cursor.execute("INSERT OR IGNORE INTO contador_cambios (clave, valor) VALUES ('id_bd', ?)", (random.getrandbits(62),))
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS usuarios_contador_{evento.lower()} AFTER {evento} ON usuarios
+            BEGIN UPDATE contador_cambios SET valor = valor + 1 WHERE clave = 'usuarios'; END
+        ''')
+
+    # Imágenes ya procesadas por enrolamiento_masivo.py (hash SHA-256 del contenido del archivo)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS imagenes_enroladas (
+            hash_contenido TEXT PRIMARY KEY,
+            id_usuario INTEGER NOT NULL,
+            ruta TEXT,
+            fecha_enrolamiento TEXT
+        )
+    ''')
+
+    # Varias muestras (encodings) por usuario. usuarios.facial_encoding guarda su centroide
+    # (media de las muestras) para la primera pasada de la búsqueda 1:N.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS encodings_faciales (
+            id_encoding INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_usuario INTEGER NOT NULL,
+            encoding BLOB NOT NULL,
+            origen TEXT,
+            fecha_registro TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_encodings_faciales_usuario ON encodings_faciales (id_usuario)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS usuarios_borrar_encodings AFTER DELETE ON usuarios
+        BEGIN DELETE FROM encodings_faciales WHERE id_usuario = OLD.id_usuario; END
+    ''')
+    for evento in ("INSERT", "DELETE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS encodings_faciales_contador_{evento.lower()} AFTER {evento} ON encodings_faciales
+            BEGIN UPDATE contador_cambios SET valor = valor + 1 WHERE clave = 'usuarios'; END
+        ''')
+
+    migrar_encodings_a_formato_binario(conn)
+    # Usuarios con encoding pero sin muestras (BD anterior a encodings_faciales): su encoding pasa a ser la primera muestra
+    cursor.execute('''
+        INSERT INTO encodings_faciales (id_usuario, encoding, origen, fecha_registro)
+        SELECT id_usuario, facial_encoding, 'migracion', datetime('now', 'localtime') FROM usuarios
+        WHERE facial_encoding IS NOT NULL AND id_usuario NOT IN (SELECT id_usuario FROM encodings_faciales)
+    ''')
     
     conn.commit()
     conn.close()
 
+def obtener_version_usuarios_bd():
+    """
+    Devuelve (id_bd, contador) de la tabla usuarios. El contador aumenta con cada
+    INSERT/UPDATE/DELETE. Devuelve None si la BD aún no tiene contador.
+    """
+    conn = sqlite3.connect(NOMBRE_BD)
+    try:
+        filas = dict(conn.execute("SELECT clave, valor FROM contador_cambios").fetchall())
+        return (filas["id_bd"], filas["usuarios"])
+    except (sqlite3.Error, KeyError):
+        return None
+    finally:
+        conn.close()
+
 def agregar_usuario_bd(datos_usuario):
     """
     Agrega un nuevo usuario a la base de datos.
@@ -63,7 +245,7 @@ def agregar_usuario_bd(datos_usuario):
     
     encoding_serializado = None
     if datos_usuario.get('facial_encoding_array') is not None: # Usamos la clave consistente
-        encoding_serializado = pickle.dumps(datos_usuario['facial_encoding_array'])
+        encoding_serializado = serializar_encoding(datos_usuario['facial_encoding_array'])
     
     try:
         cursor.execute('''
@@ -73,7 +255,10 @@ def agregar_usuario_bd(datos_usuario):
         ''', (datos_usuario['nombre'], datos_usuario['dni'], datos_usuario['nivel'], datos_usuario['area'], 
               datos_usuario['uid_rfid'], datos_usuario.get('h_inicio'), datos_usuario.get('h_fin'), 
               encoding_serializado))
+        if datos_usuario.get('facial_encoding_array') is not None:
+            _insertar_muestra(conn, cursor.lastrowid, datos_usuario['facial_encoding_array'], "alta")
         conn.commit()
+        _notificar_cambio_usuario("alta", cursor.lastrowid, dict(datos_usuario, id_usuario=cursor.lastrowid))
         return True, "Usuario agregado exitosamente a la base de datos."
     except sqlite3.IntegrityError as e:
         if "UNIQUE constraint failed: usuarios.dni" in str(e):
@@ -96,12 +281,14 @@ def obtener_usuario_por_rfid_bd(uid_rfid):
     cursor = conn.cursor()
     cursor.execute("SELECT id_usuario, nombre_completo, dni, nivel_usuario, area_trabajo, horario_trabajo_inicio, horario_trabajo_fin, facial_encoding FROM usuarios WHERE uid_rfid = ?", (uid_rfid,))
     data = cursor.fetchone()
+    muestras = _obtener_muestras(conn, data[0]) if data else None
     conn.close()
     if data:
-        encoding_np = pickle.loads(data[7]) if data[7] else None
+        encoding_np = deserializar_encoding(data[7])
         return {"id_usuario": data[0], "nombre": data[1], "dni": data[2], "nivel": data[3], 
                 "area": data[4], "h_inicio": data[5], "h_fin": data[6], "uid_rfid": uid_rfid, 
-                "facial_encoding_array": encoding_np} # Clave consistente para el array NumPy
+                "facial_encoding_array": encoding_np, # Clave consistente para el array NumPy
+                "facial_encodings_muestras": muestras}
     return None
 
 def obtener_usuario_por_nombre_bd(nombre_completo):
@@ -114,12 +301,13 @@ def obtener_usuario_por_nombre_bd(nombre_completo):
     cursor = conn.cursor()
     cursor.execute("SELECT id_usuario, nombre_completo, dni, nivel_usuario, area_trabajo, uid_rfid, horario_trabajo_inicio, horario_trabajo_fin, facial_encoding FROM usuarios WHERE nombre_completo = ?", (nombre_completo,))
     data = cursor.fetchone()
+    muestras = _obtener_muestras(conn, data[0]) if data else None
     conn.close()
     if data:
-        encoding_np = pickle.loads(data[8]) if data[8] else None # El BLOB de la BD
+        encoding_np = deserializar_encoding(data[8]) # El BLOB de la BD
         return {"id_usuario": data[0], "nombre": data[1], "dni": data[2], "nivel": data[3], 
                 "area": data[4], "uid_rfid": data[5], "h_inicio": data[6], "h_fin": data[7], 
-                "facial_encoding_array": encoding_np}
+                "facial_encoding_array": encoding_np, "facial_encodings_muestras": muestras}
     return None
 
 def obtener_usuario_por_id_bd(id_usuario):
@@ -132,12 +320,13 @@ def obtener_usuario_por_id_bd(id_usuario):
     cursor = conn.cursor()
     cursor.execute("SELECT id_usuario, nombre_completo, dni, nivel_usuario, area_trabajo, uid_rfid, horario_trabajo_inicio, horario_trabajo_fin, facial_encoding FROM usuarios WHERE id_usuario = ?", (id_usuario,))
     data = cursor.fetchone()
+    muestras = _obtener_muestras(conn, data[0]) if data else None
     conn.close()
     if data:
-        encoding_np = pickle.loads(data[8]) if data[8] else None
+        encoding_np = deserializar_encoding(data[8])
         return {"id_usuario": data[0], "nombre": data[1], "dni": data[2], "nivel": data[3], 
                 "area": data[4], "uid_rfid": data[5], "h_inicio": data[6], "h_fin": data[7], 
-                "facial_encoding_array": encoding_np}
+                "facial_encoding_array": encoding_np, "facial_encodings_muestras": muestras}
     return None
 
 def verificar_uid_existente_bd(uid_rfid, excluir_id_usuario=None):
@@ -160,8 +349,8 @@ def obtener_todos_los_usuarios_bd():
 def obtener_todos_los_usuarios_con_encodings_faciales_bd():
     """
     Obtiene la información completa de todos los usuarios que tienen un facial_encoding registrado.
-    Devuelve una lista de diccionarios, cada uno con los datos del usuario
-    y el 'facial_encoding_array' como un array NumPy.
+    Devuelve una lista de diccionarios, cada uno con los datos del usuario,
+    el 'facial_encoding_array' (centroide) como un array NumPy y 'facial_encodings_muestras'.
     """
     conn = sqlite3.connect(NOMBRE_BD)
     cursor = conn.cursor()
@@ -171,12 +360,21 @@ def obtener_todos_los_usuarios_con_encodings_faciales_bd():
         FROM usuarios WHERE facial_encoding IS NOT NULL
     """)
     results = cursor.fetchall()
+    # Solo se leen las muestras de los usuarios que tienen más de una (el resto usa el centroide)
+    cursor.execute("""
+        SELECT id_usuario, encoding FROM encodings_faciales
+        WHERE id_usuario IN (SELECT id_usuario FROM encodings_faciales GROUP BY id_usuario HAVING COUNT(*) > 1)
+        ORDER BY id_usuario, id_encoding
+    """)
+    muestras_por_usuario = {}
+    for id_usuario, blob in cursor.fetchall():
+        muestras_por_usuario.setdefault(id_usuario, []).append(deserializar_encoding(blob))
     conn.close()
 
     usuarios_con_encodings = []
     for data in results:
         try:
-            encoding_np = pickle.loads(data[8]) if data[8] else None
+            encoding_np = deserializar_encoding(data[8])
             if encoding_np is not None:
                 usuarios_con_encodings.append({
                     "id_usuario": data[0],
@@ -187,7 +385,8 @@ def obtener_todos_los_usuarios_con_encodings_faciales_bd():
                     "uid_rfid": data[5],
                     "h_inicio": data[6],
                     "h_fin": data[7],
-                    "facial_encoding_array": encoding_np
+                    "facial_encoding_array": encoding_np,
+                    "facial_encodings_muestras": np.stack(muestras_por_usuario[data[0]]) if data[0] in muestras_por_usuario else None
                 })
         except Exception as e:
             print(f"Error al deserializar encoding para usuario ID {data[0]}: {e}")
@@ -222,9 +421,9 @@ def actualizar_usuario_bd(id_usuario, datos_actualizacion):
             set_clauses.append(f"{col_nombre_bd} = ?")
             params.append(datos_actualizacion[campo])
 
-    # Manejo especial para facial_encoding
+    # Manejo especial para facial_encoding: un rostro nuevo reemplaza todas las muestras del usuario
     if 'facial_encoding_array' in datos_actualizacion: # Si se proporciona, se actualiza
-        encoding_serializado = pickle.dumps(datos_actualizacion['facial_encoding_array']) if datos_actualizacion['facial_encoding_array'] is not None else None
+        encoding_serializado = serializar_encoding(datos_actualizacion['facial_encoding_array']) if datos_actualizacion['facial_encoding_array'] is not None else None
         set_clauses.append("facial_encoding = ?")
         params.append(encoding_serializado)
     
@@ -236,7 +435,14 @@ def actualizar_usuario_bd(id_usuario, datos_actualizacion):
     
     try:
         cursor.execute(query_update, tuple(params))
-        conn.commit(); return True, "Usuario actualizado exitosamente."
+        if 'facial_encoding_array' in datos_actualizacion:
+            cursor.execute("DELETE FROM encodings_faciales WHERE id_usuario = ?", (id_usuario,))
+            if datos_actualizacion['facial_encoding_array'] is not None:
+                _insertar_muestra(conn, id_usuario, datos_actualizacion['facial_encoding_array'], "actualizacion")
+        conn.commit()
+        # Se notifica lo que quedó realmente guardado en la BD
+        _notificar_cambio_usuario("actualizacion", id_usuario, obtener_usuario_por_id_bd(id_usuario))
+        return True, "Usuario actualizado exitosamente."
     except sqlite3.IntegrityError as e:
         if "dni" in str(e): return False, "Error: El DNI proporcionado ya está registrado para otro usuario."
         if "uid_rfid" in str(e): return False, "Error: El UID RFID proporcionado ya está registrado para otro usuario."
@@ -248,10 +454,59 @@ def actualizar_usuario_bd(id_usuario, datos_actualizacion):
 
 def borrar_usuario_bd(id_usuario):
     conn = sqlite3.connect(NOMBRE_BD); cursor = conn.cursor()
-    try: cursor.execute("DELETE FROM usuarios WHERE id_usuario = ?", (id_usuario,)); conn.commit(); return True, "Usuario borrado exitosamente."
+    try:
+        cursor.execute("DELETE FROM usuarios WHERE id_usuario = ?", (id_usuario,)); conn.commit()
+        _notificar_cambio_usuario("baja", id_usuario)
+        return True, "Usuario borrado exitosamente."
     except Exception as e: return False, f"Error al borrar usuario de la BD: {e}"
     finally: conn.close()
 
+# --- Enrolamiento Masivo ---
+COLUMNAS_CLAVE_ENROLAMIENTO = {"dni": "dni", "uid_rfid": "uid_rfid", "nombre": "nombre_completo"}
+
+def obtener_ids_por_clave_bd(clave):
+    """Diccionario {valor de 'clave' (dni, uid_rfid o nombre): id_usuario} de todos los usuarios."""
+    columna = COLUMNAS_CLAVE_ENROLAMIENTO[clave]
+    conn = sqlite3.connect(NOMBRE_BD)
+    try:
+        return {str(valor): id_usuario for valor, id_usuario in conn.execute(f"SELECT {columna}, id_usuario FROM usuarios")}
+    finally:
+        conn.close()
+
+def obtener_hashes_enrolados_bd():
+    """Diccionario {hash de contenido: id_usuario} de las imágenes ya enroladas."""
+    conn = sqlite3.connect(NOMBRE_BD)
+    try:
+        return dict(conn.execute("SELECT hash_contenido, id_usuario FROM imagenes_enroladas"))
+    finally:
+        conn.close()
+
+def guardar_encodings_enrolamiento_bd(registros):
+    """
+    Guarda un lote de encodings en una sola transacción, como muestras nuevas de cada usuario
+    (se recalcula el centroide de los usuarios afectados).
+    'registros' es una lista de tuplas (id_usuario, encoding_array, hash_contenido, ruta).
+    No notifica a los oyentes: pensado para herramientas fuera de la aplicación (la galería
+    en ejecución detecta el cambio por el contador de cambios de la BD al reiniciar).
+    Devuelve (True, num_guardados) o (False, mensaje de error).
+    """
+    fecha = datetime.datetime.now().isoformat(timespec="seconds")
+    conn = sqlite3.connect(NOMBRE_BD)
+    try:
+        with conn:
+            conn.executemany("INSERT INTO encodings_faciales (id_usuario, encoding, origen, fecha_registro) VALUES (?, ?, ?, ?)",
+                             [(id_usuario, serializar_encoding(encoding), "enrolamiento", fecha) for id_usuario, encoding, _, _ in registros])
+            for id_usuario in sorted({r[0] for r in registros}):
+                _recalcular_centroide(conn, id_usuario)
+            conn.executemany("INSERT OR REPLACE INTO imagenes_enroladas (hash_contenido, id_usuario, ruta, fecha_enrolamiento) VALUES (?, ?, ?, ?)",
+                             [(hash_contenido, id_usuario, ruta, fecha) for id_usuario, _, hash_contenido, ruta in registros])
+        return True, len(registros)
+    except sqlite3.Error as e:
+        print(f"Error al guardar el lote de enrolamiento: {e}")
+        return False, str(e)
+    finally:
+        conn.close()
+
 # --- Bloque de prueba (opcional, para ejecutar este módulo directamente) ---
 if __name__ == '__main__':
     print("Ejecutando pruebas del módulo db_manager.py...")
@@ -261,7 +516,7 @@ if __name__ == '__main__':
     # Prueba agregar usuario
     # Nota: facial_encoding_array sería un array NumPy real si lo tuviéramos.
     # Para esta prueba, podemos usar None o un objeto simple serializable si no tenemos los encodings aún.
-    # O generar uno falso con pickle.dumps(np.random.rand(128).astype(np.float64)) si np está importado.
+    # O generar uno falso con np.random.rand(128) (se guarda con serializar_encoding).
     
     # Limpiar la tabla para pruebas limpias (¡CUIDADO EN PRODUCCIÓN!)
     # conn_test = sqlite3.connect(NOMBRE_BD)
@@ -0,0 +1,45 @@
+import argparse
+
+import cv2
+
+import constants
+import db_manager
+import credenciales_qr
+
+# ==============================================================================
+# EMISIÓN DE CREDENCIALES QR FIRMADAS
+# ==============================================================================
+# Genera la credencial de un usuario existente (credenciales_qr.py) y, opcionalmente, la
+# imagen PNG del QR para enviarla o imprimirla. La credencial se firma con la clave de esta
+# instalación (ARCHIVO_CLAVE_CREDENCIALES_QR junto a la BD), vale VALIDEZ_CREDENCIAL_QR_S
+# segundos (o --validez-s) y da acceso una sola vez.
+#
+# Uso:  python emitir_credencial_qr.py --clave dni --valor 12345678 --imagen qr_12345678.png
+#       python emitir_credencial_qr.py --clave uid_rfid --valor "12 34 21 32" --validez-s 3600
+
+PIXELES_POR_MODULO = 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emite una credencial QR firmada para un usuario.")
+    parser.add_argument("--clave", choices=sorted(db_manager.COLUMNAS_CLAVE_ENROLAMIENTO), default="dni", help="Campo que identifica al usuario.")
+    parser.add_argument("--valor", required=True, help="Valor de la clave (DNI, UID RFID o nombre completo).")
+    parser.add_argument("--validez-s", type=int, default=constants.VALIDEZ_CREDENCIAL_QR_S, help="Segundos de validez de la credencial.")
+    parser.add_argument("--imagen", help="Guardar también el QR en este archivo PNG.")
+    args = parser.parse_args()
+
+    db_manager.inicializar_bd()
+    id_usuario = db_manager.obtener_ids_por_clave_bd(args.clave).get(args.valor)
+    if id_usuario is None:
+        print(f"ERROR: No hay usuario con {args.clave} '{args.valor}'.")
+        return
+    credencial = credenciales_qr.generar_credencial_qr(id_usuario, args.validez_s)
+    print(credencial)
+    if args.imagen:
+        qr = cv2.QRCodeEncoder.create().encode(credencial)
+        qr = cv2.resize(qr, (0, 0), fx=PIXELES_POR_MODULO, fy=PIXELES_POR_MODULO, interpolation=cv2.INTER_NEAREST)
+        cv2.imwrite(args.imagen, qr)
+        print(f"QR guardado en '{args.imagen}' (válido {args.validez_s} s).")
+
+if __name__ == "__main__":
+    main()
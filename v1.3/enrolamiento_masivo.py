@@ -0,0 +1,178 @@
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import os
+import time
+
+import face_recognition
+
+import db_manager
+
+# ==============================================================================
+# ENROLAMIENTO MASIVO DE ROSTROS EN LA BASE DE DATOS
+# ==============================================================================
+# Sustituye a generar_encodings.py (que escribía un pickle que la v1.3 ya no lee).
+# Las imágenes se asocian a usuarios existentes por DNI, UID RFID o nombre completo:
+#   - Directorio: el nombre del archivo (sin extensión) es la clave, p. ej. 12345678.jpg,
+#     o una subcarpeta por usuario con varias fotos, p. ej. 12345678/frente.jpg.
+#   - Manifiesto CSV: columnas "ruta" y la clave elegida (rutas relativas al CSV).
+# Los encodings se calculan con face_recognition en un pool de procesos y se guardan
+# directamente como muestras del usuario (tabla encodings_faciales, que recalcula el
+# centroide en usuarios.facial_encoding), en transacciones de --lote imágenes.
+# Una imagen cuyo hash SHA-256 ya está en imagenes_enroladas no se vuelve a procesar.
+#
+# Uso:  python enrolamiento_masivo.py --directorio rostros_conocidos --clave dni
+#       python enrolamiento_masivo.py --manifiesto alta.csv --clave uid_rfid --procesos 8
+
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".bmp")
+INTERVALO_PROGRESO_S = 2.0
+
+
+def hash_contenido(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def leer_directorio(directorio):
+    """Lista de (clave, ruta) a partir de los nombres de archivo (o subcarpetas) del directorio."""
+    entradas = []
+    for nombre in sorted(os.listdir(directorio)):
+        ruta = os.path.join(directorio, nombre)
+        if os.path.isdir(ruta):
+            entradas.extend((nombre, os.path.join(ruta, archivo)) for archivo in sorted(os.listdir(ruta))
+                            if os.path.splitext(archivo)[1].lower() in EXTENSIONES_IMAGEN)
+            continue
+        base, extension = os.path.splitext(nombre)
+        if extension.lower() in EXTENSIONES_IMAGEN:
+            entradas.append((base, ruta))
+    return entradas
+
+def leer_manifiesto(ruta_csv, clave):
+    """Lista de (clave, ruta) a partir de un CSV con columnas 'ruta' y la clave elegida."""
+    base = os.path.dirname(os.path.abspath(ruta_csv))
+    entradas = []
+    with open(ruta_csv, newline="", encoding="utf-8-sig") as f:
+        for fila in csv.DictReader(f):
+            if not fila.get("ruta") or not fila.get(clave):
+                print(f"ADVERTENCIA: Fila del manifiesto sin 'ruta' o '{clave}': {fila}. Saltando.")
+                continue
+            ruta = fila["ruta"] if os.path.isabs(fila["ruta"]) else os.path.join(base, fila["ruta"])
+            entradas.append((fila[clave].strip(), ruta))
+    return entradas
+
+def codificar_imagen(ruta, modelo_deteccion="hog", upsample=1):
+    """
+    Trabajo de cada proceso: carga la imagen y devuelve (encoding o None, mensaje).
+    Si hay varios rostros se usa el más grande (el de la persona que posa para la foto).
+    """
+    try:
+        imagen = face_recognition.load_image_file(ruta)
+        ubicaciones = face_recognition.face_locations(imagen, number_of_times_to_upsample=upsample, model=modelo_deteccion)
+        if not ubicaciones:
+            return None, "sin rostro"
+        mayor = max(ubicaciones, key=lambda c: (c[2] - c[0]) * (c[1] - c[3]))
+        encodings = face_recognition.face_encodings(imagen, known_face_locations=[mayor])
+        if not encodings:
+            return None, "sin encoding"
+        return encodings[0], "varios rostros, se usó el mayor" if len(ubicaciones) > 1 else "ok"
+    except Exception as e:
+        return None, f"error: {e}"
+
+def imprimir_progreso(hechas, total, t_inicio):
+    transcurrido = time.perf_counter() - t_inicio
+    ritmo = hechas / transcurrido if transcurrido > 0 else 0.0
+    restante = (total - hechas) / ritmo if ritmo > 0 else 0.0
+    print(f"  {hechas}/{total} imágenes  {ritmo:6.1f} img/s  restante ~{restante:5.0f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrolamiento masivo de rostros en la base de datos.")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--directorio", help="Carpeta con imágenes <clave>.jpg o subcarpetas <clave>/.")
+    origen.add_argument("--manifiesto", help="CSV con columnas 'ruta' y la clave elegida.")
+    parser.add_argument("--clave", choices=sorted(db_manager.COLUMNAS_CLAVE_ENROLAMIENTO), default="dni", help="Campo que identifica al usuario.")
+    parser.add_argument("--procesos", type=int, default=0, help="Procesos del pool (0 = todos los núcleos).")
+    parser.add_argument("--lote", type=int, default=200, help="Encodings por transacción.")
+    parser.add_argument("--modelo", choices=("hog", "cnn"), default="hog", help="Detector de face_recognition.")
+    parser.add_argument("--upsample", type=int, default=1, help="Veces que se amplía la imagen para detectar rostros pequeños.")
+    parser.add_argument("--forzar", action="store_true", help="Procesar también las imágenes ya enroladas.")
+    parser.add_argument("--simulacion", action="store_true", help="Calcular los encodings sin escribir en la BD.")
+    args = parser.parse_args()
+
+    db_manager.inicializar_bd()
+    entradas = leer_directorio(args.directorio) if args.directorio else leer_manifiesto(args.manifiesto, args.clave)
+    ids_por_clave = db_manager.obtener_ids_por_clave_bd(args.clave)
+    hashes_enrolados = {} if args.forzar else db_manager.obtener_hashes_enrolados_bd()
+
+    resumen = {"enroladas": 0, "ya_enroladas": 0, "sin_usuario": 0, "sin_rostro": 0, "errores": 0}
+    pendientes = []   # (id_usuario, ruta, hash)
+    for clave, ruta in entradas:
+        id_usuario = ids_por_clave.get(clave)
+        if id_usuario is None:
+            print(f"ADVERTENCIA: No hay usuario con {args.clave} '{clave}' para '{ruta}'. Saltando.")
+            resumen["sin_usuario"] += 1
+            continue
+        try:
+            hash_imagen = hash_contenido(ruta)
+        except OSError as e:
+            print(f"ERROR: No se pudo leer '{ruta}': {e}")
+            resumen["errores"] += 1
+            continue
+        if hash_imagen in hashes_enrolados:
+            if hashes_enrolados[hash_imagen] != id_usuario:
+                print(f"ADVERTENCIA: '{ruta}' es la misma imagen ya enrolada para el usuario ID {hashes_enrolados[hash_imagen]}. Saltando.")
+            resumen["ya_enroladas"] += 1
+            continue
+        hashes_enrolados[hash_imagen] = id_usuario
+        pendientes.append((id_usuario, ruta, hash_imagen))
+
+    total = len(pendientes)
+    num_procesos = args.procesos or os.cpu_count() or 1
+    print(f"{len(entradas)} imágenes encontradas, {total} por procesar con {num_procesos} procesos "
+          f"({resumen['ya_enroladas']} ya enroladas, {resumen['sin_usuario']} sin usuario).")
+
+    lote = []
+    def guardar_lote():
+        if lote and not args.simulacion:
+            exito, resultado = db_manager.guardar_encodings_enrolamiento_bd(lote)
+            if not exito:
+                resumen["errores"] += len(lote)
+                resumen["enroladas"] -= len(lote)
+        lote.clear()
+
+    t_inicio = time.perf_counter()
+    t_ultimo_progreso = t_inicio
+    hechas = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_procesos) as pool:
+        futuros = {pool.submit(codificar_imagen, ruta, args.modelo, args.upsample): (id_usuario, ruta, hash_imagen)
+                   for id_usuario, ruta, hash_imagen in pendientes}
+        for futuro in concurrent.futures.as_completed(futuros):
+            id_usuario, ruta, hash_imagen = futuros[futuro]
+            encoding, mensaje = futuro.result()
+            hechas += 1
+            if encoding is None:
+                resumen["errores" if mensaje.startswith("error") else "sin_rostro"] += 1
+                print(f"ADVERTENCIA: '{ruta}': {mensaje}.")
+            else:
+                if mensaje != "ok":
+                    print(f"AVISO: '{ruta}': {mensaje}.")
+                resumen["enroladas"] += 1
+                lote.append((id_usuario, encoding, hash_imagen, ruta))
+                if len(lote) >= args.lote:
+                    guardar_lote()
+            ahora = time.perf_counter()
+            if ahora - t_ultimo_progreso >= INTERVALO_PROGRESO_S:
+                imprimir_progreso(hechas, total, t_inicio)
+                t_ultimo_progreso = ahora
+    guardar_lote()
+
+    transcurrido = time.perf_counter() - t_inicio
+    print(f"\n--- Enrolamiento {'simulado ' if args.simulacion else ''}terminado en {transcurrido:.1f} s "
+          f"({hechas / transcurrido if transcurrido > 0 else 0.0:.1f} img/s) ---")
+    for concepto, cantidad in resumen.items():
+        print(f"  {concepto:<13} {cantidad}")
+
+if __name__ == "__main__":
+    main()
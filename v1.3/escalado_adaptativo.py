@@ -0,0 +1,112 @@
+import cv2
+
+try:
+    import constants
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py o instrumentacion.py no encontrados en escalado_adaptativo.py.")
+    class constants: FACTOR_REDUCCION_FRAME_FACIAL = 0.5; USAR_ESCALADO_ADAPTATIVO_FACIAL = True; PRESUPUESTO_LATENCIA_FACIAL_MS = 80; ESCALA_MINIMA_FACIAL = 0.25; ESCALA_MAXIMA_FACIAL = 1.0; TAMANO_MIN_ROSTRO_PX = 50; TAMANO_OBJETIVO_ROSTRO_PX = 120; MARGEN_ROI_FACIAL = 1.0; VIGENCIA_ROI_FACIAL_S = 1.5
+    class instrumentacion: registrar_valor = lambda n, v: None
+
+# ==============================================================================
+# ESCALADO ADAPTATIVO Y REGIÓN DE INTERÉS PARA LA DETECCIÓN FACIAL
+# ==============================================================================
+# En lugar de reducir siempre cada frame por FACTOR_REDUCCION_FRAME_FACIAL, la escala se
+# ajusta tras cada resultado de detección:
+#   - Por tiempo: el coste de HOG es ~proporcional a los píxeles, así que la escala se
+#     corrige con sqrt(presupuesto / tiempo medido) para acercarse a PRESUPUESTO_LATENCIA_FACIAL_MS.
+#   - Por tamaño de rostro: nunca se reduce tanto que el último rostro quede por debajo de
+#     TAMANO_MIN_ROSTRO_PX (HOG dejaría de verlo), ni se procesa más grande de lo necesario
+#     para que mida TAMANO_OBJETIVO_ROSTRO_PX.
+# Mientras haya un rostro reciente (VIGENCIA_ROI_FACIAL_S) solo se procesa un recorte a su
+# alrededor. Cada frame enviado lleva su TransformacionFrame para devolver las cajas del
+# resultado a coordenadas del frame completo de la cámara.
+
+ALFA_TIEMPO = 0.3          # Suavizado exponencial del tiempo de detección medido
+PASO_MAXIMO_ESCALA = 1.25  # Cambio máximo de escala (multiplicativo) por actualización
+
+
+class TransformacionFrame:
+    """Recorte (x0, y0) + escala aplicados a un frame de cámara antes de la detección."""
+
+    def __init__(self, escala, x0=0, y0=0):
+        self.escala = escala
+        self.x0 = x0
+        self.y0 = y0
+
+    def a_frame_completo(self, caja):
+        """Caja (top, right, bottom, left) del frame procesado -> coordenadas del frame de cámara."""
+        t, r, b, l = caja
+        e = self.escala
+        return (int(t / e) + self.y0, int(r / e) + self.x0, int(b / e) + self.y0, int(l / e) + self.x0)
+
+    def a_frame_procesado(self, caja):
+        """Caja en coordenadas del frame de cámara -> coordenadas del frame procesado."""
+        t, r, b, l = caja
+        e = self.escala
+        return (int((t - self.y0) * e), int((r - self.x0) * e), int((b - self.y0) * e), int((l - self.x0) * e))
+
+
+class EscaladorAdaptativo:
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.escala = constants.FACTOR_REDUCCION_FRAME_FACIAL
+        self.tiempo_medio_s = None
+        self.ultimo_rostro = None     # Caja del rostro más grande en coordenadas del frame completo
+        self.t_ultimo_rostro = 0.0
+
+    def preparar(self, frame_bgr, ahora):
+        """
+        Recorta (si hay un rostro reciente) y reduce el frame de cámara.
+
+        Returns:
+            tuple: (frame RGB listo para la detección, TransformacionFrame)
+        """
+        if not constants.USAR_ESCALADO_ADAPTATIVO_FACIAL:
+            escala = constants.FACTOR_REDUCCION_FRAME_FACIAL
+            reducido = cv2.resize(frame_bgr, (0, 0), fx=escala, fy=escala)
+            return cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB), TransformacionFrame(escala)
+
+        alto, ancho = frame_bgr.shape[:2]
+        x0, y0, x1, y1 = 0, 0, ancho, alto
+        if self.ultimo_rostro is not None and ahora - self.t_ultimo_rostro <= constants.VIGENCIA_ROI_FACIAL_S:
+            t, r, b, l = self.ultimo_rostro
+            margen_x, margen_y = int((r - l) * constants.MARGEN_ROI_FACIAL), int((b - t) * constants.MARGEN_ROI_FACIAL)
+            x0, y0 = max(0, l - margen_x), max(0, t - margen_y)
+            x1, y1 = min(ancho, r + margen_x), min(alto, b + margen_y)
+        recorte = frame_bgr[y0:y1, x0:x1]
+        destino = (max(1, int(round((x1 - x0) * self.escala))), max(1, int(round((y1 - y0) * self.escala))))
+        reducido = cv2.resize(recorte, destino, interpolation=cv2.INTER_AREA if self.escala < 1.0 else cv2.INTER_LINEAR)
+        instrumentacion.registrar_valor("facial_roi", (x0, y0, x1, y1))
+        return cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB), TransformacionFrame(self.escala, x0, y0)
+
+    def actualizar(self, ubicaciones_frame_completo, tiempo_proceso_s, ahora, hubo_hog=True):
+        """
+        Ajusta la escala con el tiempo medido y el tamaño del rostro más grande detectado.
+        'hubo_hog' = False (frame descartado por el pre-detector) no alimenta la medición de tiempo.
+        """
+        if not hubo_hog:
+            tiempo_proceso_s = self.tiempo_medio_s if self.tiempo_medio_s is not None else constants.PRESUPUESTO_LATENCIA_FACIAL_MS / 1000.0
+        if self.tiempo_medio_s is None:
+            self.tiempo_medio_s = tiempo_proceso_s
+        else:
+            self.tiempo_medio_s = ALFA_TIEMPO * tiempo_proceso_s + (1 - ALFA_TIEMPO) * self.tiempo_medio_s
+
+        presupuesto_s = constants.PRESUPUESTO_LATENCIA_FACIAL_MS / 1000.0
+        factor = (presupuesto_s / max(self.tiempo_medio_s, 1e-4)) ** 0.5
+        factor = min(PASO_MAXIMO_ESCALA, max(1.0 / PASO_MAXIMO_ESCALA, factor))
+        nueva_escala = self.escala * factor
+
+        if ubicaciones_frame_completo:
+            self.ultimo_rostro = max(ubicaciones_frame_completo, key=lambda c: c[2] - c[0])
+            self.t_ultimo_rostro = ahora
+        if self.ultimo_rostro is not None and ahora - self.t_ultimo_rostro <= constants.VIGENCIA_ROI_FACIAL_S:
+            altura_rostro = max(1, self.ultimo_rostro[2] - self.ultimo_rostro[0])
+            nueva_escala = min(nueva_escala, constants.TAMANO_OBJETIVO_ROSTRO_PX / float(altura_rostro))
+            nueva_escala = max(nueva_escala, constants.TAMANO_MIN_ROSTRO_PX / float(altura_rostro))
+
+        self.escala = min(constants.ESCALA_MAXIMA_FACIAL, max(constants.ESCALA_MINIMA_FACIAL, nueva_escala))
+        instrumentacion.registrar_valor("facial_escala", round(self.escala, 3))
+        instrumentacion.registrar_valor("facial_tiempo_medio_ms", round(self.tiempo_medio_s * 1000.0, 1))
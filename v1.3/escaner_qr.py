@@ -0,0 +1,124 @@
+import time
+import threading
+import concurrent.futures
+import cv2
+from pyzbar.pyzbar import decode as decode_qr
+
+try:
+    import constants
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py o instrumentacion.py no encontrados en escaner_qr.py.")
+    class constants: ESCALA_REDUCIDA_QR = 0.5; MARGEN_ROI_QR = 0.5; VIGENCIA_ROI_QR_S = 1.0; PASADA_COMPLETA_QR_CADA_N = 4
+    class instrumentacion: incrementar_contador = lambda n, c=1: None; registrar_tiempo = lambda n, s: None
+
+# ==============================================================================
+# ESCANEO DE CÓDIGOS QR POR ETAPAS
+# ==============================================================================
+# Antes la FSM llamaba a pyzbar con cada frame BGR completo en su propio hilo. Ahora cada
+# frame se convierte a gris una sola vez y se prueba, de lo más barato a lo más caro:
+#   1. "roi":       si hubo un código hace menos de VIGENCIA_ROI_QR_S, solo su caja ampliada
+#                   con MARGEN_ROI_QR, a resolución completa.
+#   2. "reducida":  el frame entero reducido a ESCALA_REDUCIDA_QR.
+#   3. "completa":  el frame entero a resolución completa, uno de cada PASADA_COMPLETA_QR_CADA_N
+#                   frames sin código (0 = nunca), para códigos pequeños o lejanos.
+# La decodificación corre en un hilo aparte (zbar libera el GIL): la FSM entrega frames con
+# enviar_frame() sin esperar y, mientras hay uno en curso, los nuevos se omiten.
+# Cada resultado es una lista de {"datos": str, "caja": (x, y, ancho, alto), "etapa": str}
+# con la caja en coordenadas del frame original.
+
+
+def _decodificar(gris, escala=1.0, x0=0, y0=0):
+    """pyzbar sobre una imagen en gris; cajas devueltas a coordenadas del frame completo."""
+    codigos = []
+    for obj in decode_qr(gris):
+        x, y, w, h = obj.rect
+        codigos.append({"datos": obj.data.decode("utf-8", errors="replace"),
+                        "caja": (int(x / escala) + x0, int(y / escala) + y0, int(w / escala), int(h / escala))})
+    return codigos
+
+def decodificar_qr_por_etapas(frame_bgr, caja_previa=None, probar_completa=True):
+    """
+    Aplica las etapas descritas arriba a un frame BGR. 'caja_previa' es la caja (x, y, w, h)
+    del último código visto o None. Devuelve la lista de códigos (vacía si no hay ninguno).
+    """
+    gris = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY) if frame_bgr.ndim == 3 else frame_bgr
+    alto, ancho = gris.shape[:2]
+    if caja_previa is not None:
+        x, y, w, h = caja_previa
+        mx, my = int(w * constants.MARGEN_ROI_QR), int(h * constants.MARGEN_ROI_QR)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(ancho, x + w + mx), min(alto, y + h + my)
+        if x1 > x0 and y1 > y0:
+            codigos = _decodificar(gris[y0:y1, x0:x1], 1.0, x0, y0)
+            if codigos:
+                return [dict(c, etapa="roi") for c in codigos]
+    escala = constants.ESCALA_REDUCIDA_QR
+    if 0 < escala < 1.0:
+        reducido = cv2.resize(gris, (0, 0), fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+        codigos = _decodificar(reducido, escala)
+        if codigos:
+            return [dict(c, etapa="reducida") for c in codigos]
+        if not probar_completa:
+            return []
+    codigos = _decodificar(gris)
+    return [dict(c, etapa="completa") for c in codigos]
+
+
+class EscanerQR:
+    """Decodificación QR en segundo plano para la FSM (un frame en curso como máximo)."""
+
+    def __init__(self):
+        self.ejecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="escaner_qr")
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Nueva sesión de escaneo: olvida la caja anterior y descarta el frame en curso."""
+        with self.lock:
+            self.futuro = None
+            self.caja_previa = None
+            self.t_caja_previa = 0.0
+            self.frames_sin_codigo = 0
+
+    def enviar_frame(self, frame_bgr):
+        """Entrega el frame para decodificar; devuelve False si se omitió por haber uno en curso."""
+        with self.lock:
+            if self.futuro is not None and not self.futuro.done():
+                instrumentacion.incrementar_contador("qr_frames_omitidos_en_curso")
+                return False
+            caja = self.caja_previa if time.time() - self.t_caja_previa <= constants.VIGENCIA_ROI_QR_S else None
+            cada_n = constants.PASADA_COMPLETA_QR_CADA_N
+            probar_completa = cada_n > 0 and self.frames_sin_codigo % cada_n == cada_n - 1
+            self.futuro = self.ejecutor.submit(self._trabajo, frame_bgr, caja, probar_completa)
+            return True
+
+    def obtener_resultado(self):
+        """Códigos del último frame terminado (una sola vez por frame), o None si no hay resultado nuevo."""
+        with self.lock:
+            futuro = self.futuro
+            if futuro is None or not futuro.done():
+                return None
+            self.futuro = None
+        try:
+            codigos = futuro.result()
+        except Exception as e:
+            print(f"Error al decodificar QR: {e}")
+            return None
+        with self.lock:
+            if codigos:
+                self.caja_previa = codigos[0]["caja"]
+                self.t_caja_previa = time.time()
+                self.frames_sin_codigo = 0
+            else:
+                self.frames_sin_codigo += 1
+        return codigos
+
+    def _trabajo(self, frame_bgr, caja_previa, probar_completa):
+        t_inicio = time.perf_counter()
+        codigos = decodificar_qr_por_etapas(frame_bgr, caja_previa, probar_completa)
+        instrumentacion.registrar_tiempo("qr_decodificacion", time.perf_counter() - t_inicio)
+        instrumentacion.incrementar_contador("qr_decodificaciones")
+        if codigos:
+            instrumentacion.incrementar_contador(f"qr_codigo_en_{codigos[0]['etapa']}")
+        return codigos
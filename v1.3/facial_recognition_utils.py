@@ -1,7 +1,11 @@
-import face_recognition
 # import pickle # Ya no se necesita aquí para cargar/guardar encodings
 import os
-import sqlite3 # Para buscar info de usuario por nombre al cargar encodings
+import abc # ListaMapeada declara la lectura de fila que implementa cada subclase
+import json # Cabecera del snapshot de la galería
+import time
+import threading # Para proteger la galería entre el hilo de la FSM y la GUI
+import numpy as np # Para la matriz contigua de la galería facial
+import indice_facial # Índices 1:N intercambiables (exacto / IVF)
 # Necesitaremos acceso a algunas funciones de db_manager.py o definir stubs
 # Por ahora, asumiremos que db_manager.py existe y podemos importar de él.
 # Al inicio de facial_recognition_utils.py
@@ -13,14 +17,17 @@ except ImportError:
     class constants_stub:
         # ARCHIVO_ENCODINGS_FACIALES_PKL = "encodings_faciales_fallback.pkl" # Ya no se usa
         # ROSTROS_CONOCIDOS_DIR = "rostros_conocidos_fallback" # Ya no se usa
-        pass # No se necesitan stubs para estas constantes si no se usan
+        TIPO_INDICE_FACIAL = "exacto"; MIN_ENCODINGS_PARA_INDICE_IVF = 5000; IVF_NUM_LISTAS = 0; IVF_NPROBE = 8; IVF_SUBVECTORES_PQ = 0; IVF_TOP_K_RERANKING = 10
+        ARCHIVO_SNAPSHOT_GALERIA = "galeria_facial"; USAR_SNAPSHOT_GALERIA = True; CANDIDATOS_REPUNTUACION_MUESTRAS = 5
     constants = constants_stub()
 try:
-    from db_manager import obtener_usuario_por_nombre_bd, obtener_todos_los_usuarios_con_encodings_faciales_bd 
+    from db_manager import obtener_todos_los_usuarios_con_encodings_faciales_bd, registrar_oyente_cambios_usuarios, obtener_version_usuarios_bd, NOMBRE_BD
 except ImportError:
-    print("ADVERTENCIA: No se pudo importar 'obtener_usuario_por_nombre_bd' o 'obtener_todos_los_usuarios_con_encodings_faciales_bd' desde db_manager.py para facial_recognition_utils.py.")
-    def obtener_usuario_por_nombre_bd(nombre_completo): return None
+    print("ADVERTENCIA: No se pudieron importar las funciones de db_manager.py para facial_recognition_utils.py.")
     def obtener_todos_los_usuarios_con_encodings_faciales_bd(): return []
+    def registrar_oyente_cambios_usuarios(oyente): pass
+    def obtener_version_usuarios_bd(): return None
+    NOMBRE_BD = "sistema_acceso.db"
 
 # --- Constantes del Módulo ---
 # ROSTROS_CONOCIDOS_DIR se obtiene de constants.py (pero ya no se usará directamente para cargar)
@@ -37,9 +44,27 @@ except ImportError:
 #     # Debes actualizar este diccionario con tus usuarios e imágenes reales
 # }
 
-# --- Variable Global del Módulo para Encodings Cargados ---
-encodings_faciales_cargados_global = [] # Formato: [{"nombre": ..., "encoding_array": ..., ...otros datos de BD...}]
-nombres_usuarios_cargados_global = [] # Nueva variable global para nombres (simplifica el acceso)
+# --- Galería Facial en Memoria ---
+# Los encodings se guardan en una matriz float32 contigua (capacidad x 128) preasignada,
+# junto con sus normas al cuadrado precalculadas. Solo las primeras 'num_encodings_galeria'
+# filas son válidas. Así la búsqueda 1:N de todos los rostros de un frame es un único
+# producto matricial, sin re-apilar listas de Python en cada llamada.
+# Cada fila es el centroide de las muestras del usuario; los CANDIDATOS_REPUNTUACION_MUESTRAS
+# centroides más cercanos se re-puntúan con la menor distancia a cualquiera de sus muestras.
+DIMENSION_ENCODING = 128
+CAPACIDAD_INICIAL_GALERIA = 256
+
+lock_galeria = threading.Lock() # Protege la galería (la FSM busca, la GUI puede recargar)
+matriz_galeria_global = np.zeros((CAPACIDAD_INICIAL_GALERIA, DIMENSION_ENCODING), dtype=np.float32)
+normas_cuadradas_galeria_global = np.zeros(CAPACIDAD_INICIAL_GALERIA, dtype=np.float32)
+num_encodings_galeria = 0
+metadatos_galeria_global = [] # Registro compacto del usuario de cada fila (ver _metadatos_compactos)
+muestras_galeria_global = [] # Muestras (K x 128) de cada fila, o None si el centroide es la única muestra
+indice_galeria_global = indice_facial.IndiceExacto() # Propone candidatos 1:N (ver indice_facial.py)
+fila_por_id_usuario = {} # id_usuario -> fila de la galería (para altas/cambios/bajas incrementales)
+generacion_galeria = 0   # Aumenta con cada instalar_galeria(); invalida reconstrucciones de índice en curso
+hilo_reconstruccion_indice = None
+filas_modificadas_durante_reconstruccion = None # set() mientras un hilo reconstruye el índice
 # USUARIOS_DE_PRUEBA_IMAGENES = { # ELIMINADO
 #     "Fabrizio Reyes": "rostro_fabrizio.jpg", 
 #     # "Nikola Tesla": "rostro_nikola.jpg", 
@@ -52,16 +77,400 @@ nombres_usuarios_cargados_global = [] # Nueva variable global para nombres (simp
 #     El diccionario USUARIOS_DE_PRUEBA_IMAGENES mapea nombres de usuario a nombres de archivo de imagen.
 #     """
 # ... existing code ...
+def _capacidad_para(num_filas):
+    """Devuelve la capacidad (potencia de 2, mínimo CAPACIDAD_INICIAL_GALERIA) para 'num_filas'."""
+    capacidad = CAPACIDAD_INICIAL_GALERIA
+    while capacidad < num_filas:
+        capacidad *= 2
+    return capacidad
+
+def _tipo_indice_para(num_filas):
+    if constants.TIPO_INDICE_FACIAL == indice_facial.IndiceIVF.nombre and num_filas >= constants.MIN_ENCODINGS_PARA_INDICE_IVF:
+        return indice_facial.IndiceIVF.nombre
+    return indice_facial.IndiceExacto.nombre
+
+def crear_indice_configurado(num_filas):
+    """Crea el índice 1:N indicado en config.json (exacto para galerías pequeñas)."""
+    return indice_facial.crear_indice_facial(_tipo_indice_para(num_filas), num_listas=constants.IVF_NUM_LISTAS,
+                                             nprobe=constants.IVF_NPROBE, subvectores_pq=constants.IVF_SUBVECTORES_PQ)
+
+CAMPOS_METADATOS_GALERIA = ("id_usuario", "nombre", "dni", "nivel", "area", "uid_rfid", "h_inicio", "h_fin")
+
+def _metadatos_compactos(usuario_info):
+    """Copia de los datos de un usuario (sin el encoding) que se guarda junto a su fila de la galería."""
+    return {campo: usuario_info.get(campo) for campo in CAMPOS_METADATOS_GALERIA}
+
+def _muestras_compactas(usuario_info):
+    """Muestras del usuario en float32 (K x 128), o None si no tiene más de una."""
+    muestras = usuario_info.get("facial_encodings_muestras")
+    if muestras is None or len(muestras) <= 1:
+        return None
+    return np.asarray(muestras, dtype=np.float32).reshape(-1, DIMENSION_ENCODING)
+
+def instalar_galeria(encodings, metadatos, indice=None, normas=None, muestras=None):
+    """
+    Reemplaza la galería en memoria por 'encodings' (N x 128, centroides) y los 'metadatos' de
+    cada fila (diccionarios con las claves de CAMPOS_METADATOS_GALERIA, o un MetadatosMapeados).
+    'muestras' tiene, por fila, las muestras del usuario o None (por defecto, todas None).
+    La matriz, las normas y el índice se construyen fuera del lock y se publican de una sola vez.
+    Si no se pasa 'indice', se crea el configurado en config.json.
+    Si se pasan 'normas', 'encodings' ya es la matriz float32 definitiva (p. ej., mapeada desde
+    el snapshot) y se usa sin copiar; se copiará la primera vez que haya que escribir en ella.
+    Devuelve el número de filas instaladas.
+    """
+    global matriz_galeria_global, normas_cuadradas_galeria_global, num_encodings_galeria, metadatos_galeria_global, indice_galeria_global
+    global fila_por_id_usuario, generacion_galeria, muestras_galeria_global
+    num_filas = len(encodings)
+    nuevas_muestras = muestras if isinstance(muestras, MuestrasMapeadas) else (list(muestras) if muestras is not None else [None] * num_filas)
+    if normas is not None:
+        nueva_matriz, nuevas_normas = encodings, normas
+    else:
+        nueva_matriz = np.zeros((_capacidad_para(num_filas), DIMENSION_ENCODING), dtype=np.float32)
+        nuevas_normas = np.zeros(nueva_matriz.shape[0], dtype=np.float32)
+        if num_filas:
+            nueva_matriz[:num_filas] = np.asarray(encodings, dtype=np.float32).reshape(num_filas, DIMENSION_ENCODING)
+            nuevas_normas[:num_filas] = np.einsum('ij,ij->i', nueva_matriz[:num_filas], nueva_matriz[:num_filas])
+
+    nuevo_indice = indice if indice is not None else crear_indice_configurado(num_filas)
+    nuevo_indice.construir(nueva_matriz[:num_filas])
+    if isinstance(metadatos, MetadatosMapeados):
+        nuevos_metadatos = metadatos
+        nueva_fila_por_id = {id_usuario: fila for fila, id_usuario in enumerate(metadatos.ids_usuario())}
+    else:
+        nuevos_metadatos = list(metadatos)
+        nueva_fila_por_id = {m.get("id_usuario"): fila for fila, m in enumerate(nuevos_metadatos)}
+
+    with lock_galeria:
+        matriz_galeria_global = nueva_matriz
+        normas_cuadradas_galeria_global = nuevas_normas
+        num_encodings_galeria = num_filas
+        metadatos_galeria_global = nuevos_metadatos
+        muestras_galeria_global = nuevas_muestras
+        indice_galeria_global = nuevo_indice
+        fila_por_id_usuario = nueva_fila_por_id
+        generacion_galeria += 1
+    return num_filas
+
+# --- Cambios Incrementales de la Galería ---
+# Altas, cambios y bajas de un usuario tocan una sola fila (O(1)) bajo 'lock_galeria', sin
+# recargar la BD. Una baja mueve la última fila al hueco (swap-remove). El índice recibe
+# cada fila modificada; cuando un IVF acumula demasiadas filas pendientes, o la galería
+# cruza MIN_ENCODINGS_PARA_INDICE_IVF, se reconstruye en un hilo aparte y se publica sin
+# detener las búsquedas de la FSM.
+
+def agregar_o_actualizar_usuario_galeria(usuario_info):
+    """
+    Inserta o reemplaza la fila del usuario 'usuario_info["id_usuario"]' con su
+    'facial_encoding_array' (centroide) y sus 'facial_encodings_muestras'.
+    Si el usuario ya no tiene encoding, se quita de la galería.
+    """
+    global num_encodings_galeria
+    id_usuario = usuario_info.get("id_usuario")
+    if id_usuario is None:
+        return
+    if usuario_info.get("facial_encoding_array") is None:
+        eliminar_usuario_galeria(id_usuario)
+        return
+    vector = np.asarray(usuario_info["facial_encoding_array"], dtype=np.float32).reshape(DIMENSION_ENCODING)
+    metadatos = _metadatos_compactos(usuario_info)
+    muestras = _muestras_compactas(usuario_info)
+
+    with lock_galeria:
+        fila = fila_por_id_usuario.get(id_usuario)
+        _asegurar_capacidad_sin_lock(num_encodings_galeria + (1 if fila is None else 0))
+        if fila is None:
+            fila = num_encodings_galeria
+            num_encodings_galeria += 1
+            metadatos_galeria_global.append(metadatos)
+            muestras_galeria_global.append(muestras)
+            fila_por_id_usuario[id_usuario] = fila
+        else:
+            metadatos_galeria_global[fila] = metadatos
+            muestras_galeria_global[fila] = muestras
+        matriz_galeria_global[fila] = vector
+        normas_cuadradas_galeria_global[fila] = np.dot(vector, vector)
+        _marcar_fila_modificada_sin_lock(fila)
+        reconstruir = _indice_desactualizado_sin_lock()
+    if reconstruir:
+        _programar_reconstruccion_indice()
+
+def eliminar_usuario_galeria(id_usuario):
+    """Quita la fila del usuario (la última fila ocupa su lugar). Devuelve True si estaba en la galería."""
+    global num_encodings_galeria
+    with lock_galeria:
+        fila = fila_por_id_usuario.pop(id_usuario, None)
+        if fila is None:
+            return False
+        ultima = num_encodings_galeria - 1
+        _asegurar_capacidad_sin_lock(num_encodings_galeria)
+        if fila != ultima:
+            matriz_galeria_global[fila] = matriz_galeria_global[ultima]
+            normas_cuadradas_galeria_global[fila] = normas_cuadradas_galeria_global[ultima]
+            metadatos_galeria_global[fila] = metadatos_galeria_global[ultima]
+            muestras_galeria_global[fila] = muestras_galeria_global[ultima]
+            fila_por_id_usuario[metadatos_galeria_global[fila].get("id_usuario")] = fila
+        metadatos_galeria_global.pop()
+        muestras_galeria_global.pop()
+        num_encodings_galeria = ultima
+        _marcar_fila_modificada_sin_lock(fila)
+        if fila != ultima:
+            _marcar_fila_modificada_sin_lock(ultima)
+        reconstruir = _indice_desactualizado_sin_lock()
+    if reconstruir:
+        _programar_reconstruccion_indice()
+    return True
+
+def _asegurar_capacidad_sin_lock(num_filas):
+    """
+    Duplica la matriz preasignada si hace falta (coste amortizado O(1) por alta).
+    También copia a memoria propia una matriz de solo lectura (mapeada desde el snapshot).
+    """
+    global matriz_galeria_global, normas_cuadradas_galeria_global
+    if num_filas <= len(matriz_galeria_global) and matriz_galeria_global.flags.writeable:
+        return
+    nueva_matriz = np.zeros((_capacidad_para(num_filas), DIMENSION_ENCODING), dtype=np.float32)
+    nuevas_normas = np.zeros(nueva_matriz.shape[0], dtype=np.float32)
+    nueva_matriz[:num_encodings_galeria] = matriz_galeria_global[:num_encodings_galeria]
+    nuevas_normas[:num_encodings_galeria] = normas_cuadradas_galeria_global[:num_encodings_galeria]
+    matriz_galeria_global = nueva_matriz
+    normas_cuadradas_galeria_global = nuevas_normas
+
+def _vector_de_fila_sin_lock(fila):
+    """Vector actual de 'fila' para el índice (None si la fila ya no existe)."""
+    return matriz_galeria_global[fila] if fila < num_encodings_galeria else None
+
+def _marcar_fila_modificada_sin_lock(fila):
+    indice_galeria_global.marcar_fila_modificada(fila, num_encodings_galeria, _vector_de_fila_sin_lock(fila))
+    if filas_modificadas_durante_reconstruccion is not None:
+        filas_modificadas_durante_reconstruccion.add(fila)
+
+def _indice_desactualizado_sin_lock():
+    return (indice_galeria_global.nombre != _tipo_indice_para(num_encodings_galeria) or
+            indice_galeria_global.necesita_reconstruccion(num_encodings_galeria))
+
+def _programar_reconstruccion_indice():
+    """Reconstruye el índice sobre una copia de la galería en un hilo aparte (si no hay uno en curso)."""
+    global hilo_reconstruccion_indice, filas_modificadas_durante_reconstruccion
+    with lock_galeria:
+        if hilo_reconstruccion_indice is not None and hilo_reconstruccion_indice.is_alive():
+            return
+        copia = matriz_galeria_global[:num_encodings_galeria].copy()
+        filas_modificadas_durante_reconstruccion = set()
+        hilo_reconstruccion_indice = threading.Thread(target=_reconstruir_indice, args=(copia, generacion_galeria), daemon=True)
+        hilo_reconstruccion_indice.start()
+
+def _reconstruir_indice(copia_galeria, generacion):
+    global indice_galeria_global, filas_modificadas_durante_reconstruccion, hilo_reconstruccion_indice
+    nuevo_indice = crear_indice_configurado(len(copia_galeria))
+    nuevo_indice.construir(copia_galeria)
+    with lock_galeria:
+        modificadas = filas_modificadas_durante_reconstruccion
+        filas_modificadas_durante_reconstruccion = None
+        hilo_reconstruccion_indice = None
+        if generacion != generacion_galeria:
+            return # La galería se reinstaló completa mientras tanto; este índice ya no sirve
+        # Las filas cambiadas después de copiar la galería quedan como pendientes del nuevo índice
+        for fila in modificadas:
+            nuevo_indice.marcar_fila_modificada(fila, num_encodings_galeria, _vector_de_fila_sin_lock(fila))
+        indice_galeria_global = nuevo_indice
+        reconstruir_otra_vez = _indice_desactualizado_sin_lock() # Cambios llegados durante la reconstrucción
+    print(f"Índice facial '{nuevo_indice.nombre}' reconstruido en segundo plano ({len(copia_galeria)} filas).")
+    if reconstruir_otra_vez:
+        _programar_reconstruccion_indice()
+
+def _al_cambiar_usuario_bd(operacion, id_usuario, usuario_info):
+    """Oyente de db_manager: aplica a la galería cada alta, actualización o baja de usuario."""
+    if operacion == "baja":
+        eliminar_usuario_galeria(id_usuario)
+    elif usuario_info is not None:
+        agregar_o_actualizar_usuario_galeria(usuario_info)
+
+registrar_oyente_cambios_usuarios(_al_cambiar_usuario_bd)
+
+# --- Snapshot de la Galería en Disco ---
+# Para no deserializar todos los BLOBs de la BD en cada arranque, la galería se guarda junto
+# a la BD como:
+#   <ARCHIVO_SNAPSHOT_GALERIA>.npy             matriz float32 (N x 128)
+#   <ARCHIVO_SNAPSHOT_GALERIA>_normas.npy      normas al cuadrado (N)
+#   <ARCHIVO_SNAPSHOT_GALERIA>_metadatos.npy   id_usuario + datos del usuario en JSON por fila
+#   <ARCHIVO_SNAPSHOT_GALERIA>_muestras.npy    muestras de los usuarios con más de una (S x 128)
+#   <ARCHIVO_SNAPSHOT_GALERIA>_muestras_inicio.npy  fila -> primera muestra (N + 1 posiciones)
+#   <ARCHIVO_SNAPSHOT_GALERIA>.json            cabecera: formato, (id_bd, contador) de la BD y N
+# La cabecera se escribe la última (marca que el snapshot está completo). Al arrancar, si
+# coincide con obtener_version_usuarios_bd(), los .npy se abren con np.load(mmap_mode='r'):
+# el arranque no lee los datos y los procesos comparten las páginas del archivo.
+VERSION_FORMATO_SNAPSHOT = 2
+
+class ListaMapeada(abc.ABC):
+    """
+    Lista por fila de la galería respaldada por arrays del snapshot. Cada fila se lee del
+    archivo solo cuando se pide; las escrituras (altas/cambios/bajas) se guardan aparte.
+    """
+
+    def __init__(self, num_filas_archivo):
+        self.num_filas_archivo = num_filas_archivo
+        self.num_filas = num_filas_archivo
+        self.cambios = {}    # fila -> valor que reemplaza a la fila del archivo
+
+    @abc.abstractmethod
+    def _leer_fila(self, fila):
+        """Valor de 'fila' tal como está en el archivo del snapshot."""
+
+    def __len__(self):
+        return self.num_filas
+
+    def __getitem__(self, fila):
+        if fila < 0:
+            fila += self.num_filas
+        if fila in self.cambios:
+            return self.cambios[fila]
+        if not 0 <= fila < min(self.num_filas, self.num_filas_archivo):
+            raise IndexError(fila)
+        return self._leer_fila(fila)
+
+    def __setitem__(self, fila, valor):
+        self.cambios[fila] = valor
+
+    def __iter__(self):
+        for fila in range(self.num_filas):
+            yield self[fila]
+
+    def append(self, valor):
+        self.cambios[self.num_filas] = valor
+        self.num_filas += 1
+
+    def pop(self):
+        valor = self[self.num_filas - 1]
+        self.cambios.pop(self.num_filas - 1, None)
+        self.num_filas -= 1
+        return valor
+
+class MetadatosMapeados(ListaMapeada):
+    """Metadatos de cada fila: el JSON se decodifica al pedir la fila."""
+
+    def __init__(self, tabla):
+        super().__init__(len(tabla))
+        self.tabla = tabla   # Array estructurado (id_usuario, datos) mapeado en memoria
+
+    def ids_usuario(self):
+        return self.tabla["id_usuario"][:self.num_filas_archivo].tolist()
+
+    def _leer_fila(self, fila):
+        return json.loads(self.tabla["datos"][fila].decode("utf-8"))
+
+class MuestrasMapeadas(ListaMapeada):
+    """Muestras de cada fila: vista sobre la matriz de muestras (None si la fila no tiene)."""
+
+    def __init__(self, matriz_muestras, inicios):
+        super().__init__(len(inicios) - 1)
+        self.matriz_muestras = matriz_muestras
+        self.inicios = inicios
+
+    def _leer_fila(self, fila):
+        inicio, fin = int(self.inicios[fila]), int(self.inicios[fila + 1])
+        return self.matriz_muestras[inicio:fin] if fin > inicio else None
+
+def _rutas_snapshot():
+    base = os.path.join(os.path.dirname(os.path.abspath(NOMBRE_BD)), constants.ARCHIVO_SNAPSHOT_GALERIA)
+    return {"matriz": base + ".npy", "normas": base + "_normas.npy", "metadatos": base + "_metadatos.npy",
+            "muestras": base + "_muestras.npy", "inicios_muestras": base + "_muestras_inicio.npy", "cabecera": base + ".json"}
+
+def guardar_snapshot_galeria(version_bd):
+    """Escribe la galería actual en disco (archivos temporales + os.replace, cabecera al final)."""
+    with lock_galeria:
+        num_filas = num_encodings_galeria
+        matriz = np.array(matriz_galeria_global[:num_filas], dtype=np.float32)
+        normas = np.array(normas_cuadradas_galeria_global[:num_filas], dtype=np.float32)
+        metadatos = [metadatos_galeria_global[fila] for fila in range(num_filas)]
+        muestras_por_fila = [muestras_galeria_global[fila] for fila in range(num_filas)]
+    inicios = np.zeros(num_filas + 1, dtype=np.int64)
+    inicios[1:] = np.cumsum([len(m) if m is not None else 0 for m in muestras_por_fila])
+    presentes = [m for m in muestras_por_fila if m is not None]
+    muestras = np.concatenate(presentes).astype(np.float32) if presentes else np.zeros((0, DIMENSION_ENCODING), dtype=np.float32)
+    datos = [json.dumps(m, ensure_ascii=False).encode("utf-8") for m in metadatos]
+    tabla = np.zeros(num_filas, dtype=[("id_usuario", "<i8"), ("datos", f"S{max([len(d) for d in datos] + [1])}")])
+    tabla["id_usuario"] = [m.get("id_usuario") or 0 for m in metadatos]
+    tabla["datos"] = datos
+
+    rutas = _rutas_snapshot()
+    cabecera = {"version_formato": VERSION_FORMATO_SNAPSHOT, "version_bd": list(version_bd),
+                "num_filas": num_filas, "dimension": DIMENSION_ENCODING}
+    try:
+        if os.path.exists(rutas["cabecera"]):
+            os.remove(rutas["cabecera"]) # Sin cabecera, un snapshot a medio escribir nunca se considera válido
+        for clave, array in (("matriz", matriz), ("normas", normas), ("metadatos", tabla),
+                             ("muestras", muestras), ("inicios_muestras", inicios)):
+            with open(rutas[clave] + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(rutas[clave] + ".tmp", rutas[clave])
+        with open(rutas["cabecera"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(cabecera, f)
+        os.replace(rutas["cabecera"] + ".tmp", rutas["cabecera"])
+        print(f"Snapshot de la galería facial guardado ({num_filas} filas).")
+        return True
+    except OSError as e: # En Windows falla si otro proceso tiene el snapshot mapeado
+        print(f"ADVERTENCIA: No se pudo guardar el snapshot de la galería facial: {e}")
+        return False
+
+def cargar_snapshot_galeria(version_bd):
+    """
+    Abre el snapshot mapeado en memoria si corresponde a 'version_bd'.
+    Devuelve (matriz, normas, MetadatosMapeados, MuestrasMapeadas) o None si no existe o está desactualizado.
+    """
+    rutas = _rutas_snapshot()
+    try:
+        with open(rutas["cabecera"], "r", encoding="utf-8") as f:
+            cabecera = json.load(f)
+        if (cabecera.get("version_formato") != VERSION_FORMATO_SNAPSHOT or version_bd is None or
+                cabecera.get("version_bd") != list(version_bd) or cabecera.get("dimension") != DIMENSION_ENCODING):
+            return None
+        num_filas = cabecera["num_filas"]
+        matriz = np.load(rutas["matriz"], mmap_mode='r')
+        normas = np.load(rutas["normas"], mmap_mode='r')
+        tabla = np.load(rutas["metadatos"], mmap_mode='r')
+        muestras = np.load(rutas["muestras"], mmap_mode='r')
+        inicios = np.load(rutas["inicios_muestras"], mmap_mode='r')
+    except (OSError, ValueError, KeyError):
+        return None
+    if (matriz.shape != (num_filas, DIMENSION_ENCODING) or matriz.dtype != np.float32 or
+            normas.shape != (num_filas,) or len(tabla) != num_filas or
+            inicios.shape != (num_filas + 1,) or muestras.ndim != 2 or muestras.shape[1] != DIMENSION_ENCODING or
+            int(inicios[-1]) != len(muestras)):
+        return None
+    return np.asarray(matriz), np.asarray(normas), MetadatosMapeados(tabla), MuestrasMapeadas(np.asarray(muestras), inicios)
+
+def _reconstruir_indice_si_hace_falta():
+    with lock_galeria:
+        reconstruir = _indice_desactualizado_sin_lock()
+    if reconstruir:
+        _programar_reconstruccion_indice()
+
 # def cargar_encodings_faciales_al_inicio(archivo_pickle=constants.ARCHIVO_ENCODINGS_FACIALES_PKL): # YA NO TOMA ARGUMENTO archivo_pickle
 def cargar_encodings_faciales_al_inicio():
-    global encodings_faciales_cargados_global, nombres_usuarios_cargados_global
     """
     Carga los encodings faciales directamente desde la base de datos.
-    Puebla la variable global 'encodings_faciales_cargados_global' con la información completa del usuario.
+    Construye la galería en memoria (matriz float32, normas al cuadrado e índice 1:N)
+    y guarda, por cada fila, los datos del usuario necesarios para conceder el acceso
+    sin volver a consultar la base de datos.
+    Si el snapshot en disco corresponde a la versión actual de la BD se usa ese snapshot
+    (mapeado en memoria); si no, se lee la BD y se regenera el snapshot.
+    Se instala con el índice exacto; un IVF configurado se construye en segundo plano.
     """
+    version_bd = obtener_version_usuarios_bd() if constants.USAR_SNAPSHOT_GALERIA else None
+    if version_bd is not None:
+        t_inicio = time.perf_counter()
+        snapshot = cargar_snapshot_galeria(version_bd)
+        if snapshot is not None:
+            matriz, normas, metadatos, muestras = snapshot
+            num_filas = instalar_galeria(matriz, metadatos, indice=indice_facial.IndiceExacto(), normas=normas, muestras=muestras)
+            print(f"--- Galería facial cargada desde el snapshot: {num_filas} perfiles en {(time.perf_counter() - t_inicio) * 1000:.1f} ms. ---")
+            _reconstruir_indice_si_hace_falta()
+            return
+
     print("Cargando encodings faciales desde la base de datos...")
-    encodings_faciales_cargados_global = [] # Limpiar antes de cargar
-    nombres_usuarios_cargados_global = [] # Limpiar también los nombres
+    encodings_leidos = []
+    metadatos_leidos = []
+    muestras_leidas = []
 
     usuarios_con_encodings = obtener_todos_los_usuarios_con_encodings_faciales_bd()
 
@@ -69,22 +478,162 @@ def cargar_encodings_faciales_al_inicio():
         for usuario_info in usuarios_con_encodings:
             # Asumimos que usuario_info ya viene con 'facial_encoding_array' como un array NumPy
             if usuario_info.get("facial_encoding_array") is not None:
-                encodings_faciales_cargados_global.append(usuario_info["facial_encoding_array"])
-                nombres_usuarios_cargados_global.append(usuario_info.get("nombre", "Desconocido")) # Guardar nombres para referencia
-        
-        if encodings_faciales_cargados_global:
-            print(f"--- Encodings faciales cargados desde la BD para {len(encodings_faciales_cargados_global)} perfiles. ---")
-            # print(f"Nombres cargados: {nombres_usuarios_cargados_global}") # Descomentar para depurar nombres
-        else:
-            print("ADVERTENCIA: No se encontraron encodings faciales válidos en la base de datos.")
+                encodings_leidos.append(usuario_info["facial_encoding_array"])
+                metadatos_leidos.append(_metadatos_compactos(usuario_info))
+                muestras_leidas.append(_muestras_compactas(usuario_info))
+
+    num_filas = instalar_galeria(encodings_leidos, metadatos_leidos, indice=indice_facial.IndiceExacto(), muestras=muestras_leidas)
+    if version_bd is not None:
+        guardar_snapshot_galeria(version_bd)
+    _reconstruir_indice_si_hace_falta()
+
+    if num_filas:
+        print(f"--- Encodings faciales cargados desde la BD para {num_filas} perfiles. ---")
+    elif usuarios_con_encodings:
+        print("ADVERTENCIA: No se encontraron encodings faciales válidos en la base de datos.")
     else:
         print("ADVERTENCIA: No se encontraron usuarios con encodings faciales en la base de datos.")
 
+def asegurar_galeria_cargada():
+    """
+    Carga la galería desde la BD solo si aún no se instaló en este proceso. Después, los
+    cambios de usuarios llegan de forma incremental (ver _al_cambiar_usuario_bd), así que
+    reconectar no necesita recargarla.
+    """
+    if generacion_galeria == 0:
+        cargar_encodings_faciales_al_inicio()
+
+def buscar_rostros_en_galeria(encodings_detectados):
+    """
+    Busca en la galería el vecino más cercano de cada encoding detectado (búsqueda 1:N).
+    Con el índice exacto, todos los rostros de un frame se comparan en un único producto
+    matricial usando ||q - g||^2 = ||q||^2 + ||g||^2 - 2 q·g con las normas ya precalculadas.
+    Con un índice aproximado (IVF), solo se re-ordenan con la distancia exacta los
+    IVF_TOP_K_RERANKING candidatos que propone el índice.
+
+    Args:
+        encodings_detectados (list | np.ndarray): M encodings de 128 dimensiones.
+
+    Returns:
+        tuple: (indices, distancias), dos arrays de longitud M con la fila de la galería
+               más cercana y su distancia euclídea (-1 e infinito si el índice no propuso
+               candidatos). (None, None) si la galería está vacía o no hay encodings detectados.
+    """
+    if encodings_detectados is None or len(encodings_detectados) == 0:
+        return None, None
+    consultas = np.asarray(encodings_detectados, dtype=np.float32).reshape(-1, DIMENSION_ENCODING)
+
+    with lock_galeria:
+        return _buscar_en_galeria_sin_lock(consultas)
+
+def identificar_rostros_en_galeria(encodings_detectados):
+    """
+    Igual que buscar_rostros_en_galeria, pero devuelve directamente una copia de los datos
+    del usuario de la fila ganadora (tomada dentro del mismo lock, así sigue siendo correcta
+    aunque la galería se recargue justo después y aunque dos usuarios compartan nombre).
+
+    Returns:
+        tuple: (usuarios, distancias): lista de M diccionarios (o None si no hubo candidato)
+               y array de M distancias. (None, None) si no hay galería o encodings.
+    """
+    if encodings_detectados is None or len(encodings_detectados) == 0:
+        return None, None
+    consultas = np.asarray(encodings_detectados, dtype=np.float32).reshape(-1, DIMENSION_ENCODING)
+
+    with lock_galeria:
+        indices, distancias = _buscar_en_galeria_sin_lock(consultas)
+        if indices is None:
+            return None, None
+        usuarios = [dict(metadatos_galeria_global[i]) if i >= 0 else None for i in indices]
+    return usuarios, distancias
+
+class VerificadorUsuario:
+    """
+    Verificación 1:1 (RFID/QR + Facial) contra el usuario ya identificado en el paso previo.
+    Sus muestras se preparan una sola vez al entrar en ESPERANDO_VALIDACION_FACIAL (matriz
+    contigua + normas al cuadrado) y todos los rostros de un frame se puntúan con un único
+    producto matricial, sin crear listas ni arrays por rostro.
+    """
+
+    def __init__(self, usuario_info):
+        muestras = usuario_info.get("facial_encodings_muestras")
+        if muestras is None or len(muestras) == 0:
+            muestras = [usuario_info["facial_encoding_array"]]
+        self.id_usuario = usuario_info.get("id_usuario")
+        # float64: con pocas muestras el coste es el mismo y la distancia junto a la tolerancia es exacta
+        self.muestras = np.ascontiguousarray(np.asarray(muestras, dtype=np.float64).reshape(-1, DIMENSION_ENCODING))
+        self.normas_cuadradas = np.einsum('ij,ij->i', self.muestras, self.muestras)
+
+    def distancias(self, encodings_detectados):
+        """Array con la menor distancia euclídea de cada rostro a cualquiera de las muestras del usuario."""
+        if encodings_detectados is None or len(encodings_detectados) == 0:
+            return np.empty(0)
+        consultas = np.asarray(encodings_detectados, dtype=np.float64).reshape(-1, DIMENSION_ENCODING)
+        distancias_cuadradas = consultas @ self.muestras.T # (M x K)
+        distancias_cuadradas *= -2.0
+        distancias_cuadradas += self.normas_cuadradas[None, :]
+        distancias_cuadradas += np.einsum('ij,ij->i', consultas, consultas)[:, None]
+        return np.sqrt(np.maximum(distancias_cuadradas.min(axis=1), 0.0))
+
+def crear_verificador_usuario(usuario_info):
+    """VerificadorUsuario para 'usuario_info', o None si el usuario no tiene rostro registrado."""
+    if not usuario_info or usuario_info.get("facial_encoding_array") is None:
+        return None
+    return VerificadorUsuario(usuario_info)
+
+def _buscar_en_galeria_sin_lock(consultas):
+    """Búsqueda 1:N sobre la galería actual. El llamador debe tener 'lock_galeria'."""
+    if num_encodings_galeria == 0:
+        return None, None
+    galeria = matriz_galeria_global[:num_encodings_galeria]
+    candidatos = indice_galeria_global.buscar_candidatos(consultas, constants.IVF_TOP_K_RERANKING)
+    if candidatos is not None:
+        return _reordenar_candidatos_exacto(galeria, consultas, candidatos)
+    distancias_cuadradas = galeria @ consultas.T # (N x M)
+    distancias_cuadradas *= -2.0
+    distancias_cuadradas += normas_cuadradas_galeria_global[:num_encodings_galeria, None]
+    distancias_cuadradas += np.einsum('ij,ij->i', consultas, consultas)[None, :]
+    num_candidatos = min(constants.CANDIDATOS_REPUNTUACION_MUESTRAS, num_encodings_galeria)
+    if num_candidatos <= 1:
+        candidatos = np.argmin(distancias_cuadradas, axis=0)[:, None]
+    else:
+        candidatos = np.argpartition(distancias_cuadradas, num_candidatos - 1, axis=0)[:num_candidatos].T
+    # La distancia final se recalcula exactamente (evita errores de redondeo junto a la tolerancia)
+    return _reordenar_candidatos_exacto(galeria, consultas, candidatos)
+
+def _reordenar_candidatos_exacto(galeria, consultas, candidatos):
+    """
+    Elige, para cada consulta, el candidato con menor distancia euclídea exacta. La distancia
+    a un usuario con varias muestras es la menor distancia a cualquiera de ellas.
+    """
+    indices = np.full(len(consultas), -1, dtype=np.int64)
+    distancias = np.full(len(consultas), np.inf)
+    validos = (candidatos >= 0) & (candidatos < len(galeria))
+    if not validos.any():
+        return indices, distancias
+    # Muestras de todos los candidatos distintos en una matriz plana (el centroide si la fila no tiene):
+    # la fila unicas[u] ocupa las posiciones inicios[u]..inicios[u + 1] de 'muestras'
+    unicas, posicion_unica = np.unique(np.where(validos, candidatos, 0), return_inverse=True)
+    posicion_unica = posicion_unica.reshape(candidatos.shape)
+    bloques = [muestras_galeria_global[fila] for fila in unicas.tolist()]
+    bloques = [b if b is not None else galeria[fila:fila + 1] for fila, b in zip(unicas.tolist(), bloques)]
+    inicios = np.concatenate(([0], np.cumsum([len(b) for b in bloques])[:-1]))
+    muestras = np.concatenate(bloques).astype(np.float64)
+    diferencias = muestras[None, :, :] - consultas.astype(np.float64)[:, None, :] # (M x S x 128), exacto junto a la tolerancia
+    d_muestras = np.sqrt(np.einsum('ijk,ijk->ij', diferencias, diferencias))
+    d_unicas = np.minimum.reduceat(d_muestras, inicios, axis=1) # (M x U): menor distancia a cada usuario
+    d = np.where(validos, np.take_along_axis(d_unicas, posicion_unica, axis=1), np.inf)
+    mejores = np.argmin(d, axis=1)
+    con_candidato = validos.any(axis=1)
+    indices[con_candidato] = candidatos[con_candidato, mejores[con_candidato]]
+    distancias[con_candidato] = d[con_candidato, mejores[con_candidato]]
+    return indices, distancias
+
 # --- Bloque de prueba (opcional, para ejecutar este módulo directamente) ---
 if __name__ == '__main__':
     print("Ejecutando facial_recognition_utils.py directamente...")
     
-    # 1. Inicializar la BD (necesario para que obtener_usuario_por_nombre_bd funcione)
+    # 1. Inicializar la BD (cargar_encodings_faciales_al_inicio lee los usuarios con sus muestras faciales)
     # Se asume que db_manager.py ya maneja la inicialización al ser importado y usado
     # Si este script se ejecuta de forma totalmente autónoma, deberías importar db_manager
     # y llamar db_manager.inicializar_bd() aquí.
@@ -101,11 +650,10 @@ if __name__ == '__main__':
     print("\n--- Intentando cargar encodings faciales desde la base de datos ---")
     cargar_encodings_faciales_al_inicio()
     
-    if encodings_faciales_cargados_global:
-        print("\nContenido de encodings_faciales_cargados_global (primeros 5):")
-        for i, encoding in enumerate(encodings_faciales_cargados_global):
-            if i >= 5: break
-            print(f"  Encoding {i+1} (nombre: {nombres_usuarios_cargados_global[i]}): {encoding[:5]}...") # Muestra solo los primeros 5 elementos del array
+    if num_encodings_galeria:
+        print(f"\nContenido de la galería facial (primeras 5 de {num_encodings_galeria} filas):")
+        for i in range(min(5, num_encodings_galeria)):
+            print(f"  Encoding {i+1} (nombre: {metadatos_galeria_global[i]['nombre']}, ID: {metadatos_galeria_global[i]['id_usuario']}): {matriz_galeria_global[i, :5]}...") # Muestra solo los primeros 5 elementos del array
     else:
         print("No se cargaron encodings para mostrar.")
 
@@ -0,0 +1,186 @@
+import os
+import abc
+import time
+import cv2
+
+try:
+    import constants
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py no encontrado en fuentes_frames.py.")
+    class constants: INDICE_CAMARA = 1; FUENTE_CAMARA = ""; VELOCIDAD_REPRODUCCION_FUENTE = "real"; FPS_FUENTE_IMAGENES = 15.0
+
+# ==============================================================================
+# FUENTES DE FRAMES: CÁMARA EN VIVO O REPRODUCCIÓN DE UNA GRABACIÓN
+# ==============================================================================
+# La máquina de estados lee frames con la misma interfaz que cv2.VideoCapture
+# (isOpened, read, get, release), así que puede recibir:
+#   - FuenteCamara:   la cámara de la puerta (INDICE_CAMARA). Comportamiento original.
+#   - FuenteVideo:    un archivo de video grabado.
+#   - FuenteImagenes: una carpeta de imágenes (orden alfabético) a FPS_FUENTE_IMAGENES.
+# Se elige con FUENTE_CAMARA en config.json ("" = cámara en vivo; ruta a un video o carpeta
+# = reproducción). Las grabaciones se reproducen con VELOCIDAD_REPRODUCCION_FUENTE:
+#   - "real":   read() espera hasta la hora de cada frame, como una cámara.
+#   - "maxima": read() devuelve el siguiente frame sin esperar (benchmarks).
+# En ambas velocidades timestamp_s del frame es determinista: índice / fps desde el
+# primer frame, de modo que dos reproducciones del mismo clip dan los mismos tiempos.
+# Al terminar la grabación read() devuelve (False, None), igual que una cámara desconectada.
+
+VELOCIDADES_REPRODUCCION = ("real", "maxima")
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FuenteCamara:
+    """cv2.VideoCapture de la cámara; timestamp_s es la hora del sistema de cada lectura."""
+
+    def __init__(self, indice_camara=None):
+        self.indice_camara = constants.INDICE_CAMARA if indice_camara is None else indice_camara
+        self.captura = cv2.VideoCapture(self.indice_camara, cv2.CAP_DSHOW)
+        time.sleep(0.5) # Tiempo para que la cámara entregue frames estables
+        self.frames_leidos = 0
+        self.timestamp_s = None
+
+    def isOpened(self):
+        return self.captura.isOpened()
+
+    def read(self):
+        ret, frame = self.captura.read()
+        if ret:
+            self.frames_leidos += 1
+            self.timestamp_s = time.time()
+        return ret, frame
+
+    def get(self, propiedad):
+        return self.captura.get(propiedad)
+
+    def release(self):
+        self.captura.release()
+
+    def __str__(self):
+        return f"cámara {self.indice_camara}"
+
+
+class FuenteGrabada(abc.ABC):
+    """
+    Base de las reproducciones: lleva el índice del frame, calcula su timestamp y, a
+    velocidad "real", espera hasta su hora. Las subclases implementan _leer_siguiente().
+    """
+
+    def __init__(self, fps, velocidad="real"):
+        if velocidad not in VELOCIDADES_REPRODUCCION:
+            raise ValueError(f"Velocidad de reproducción '{velocidad}' no válida; use una de {VELOCIDADES_REPRODUCCION}.")
+        self.fps = float(fps)
+        self.velocidad = velocidad
+        self.frames_leidos = 0
+        self.timestamp_s = None
+        self.agotada = False # True cuando read() ya devolvió el último frame
+        self.t_inicio_reproduccion = None
+
+    def read(self):
+        if self.agotada or not self.isOpened():
+            return False, None
+        frame = self._leer_siguiente()
+        if frame is None:
+            self.agotada = True
+            return False, None
+        self.timestamp_s = self.frames_leidos / self.fps
+        self.frames_leidos += 1
+        if self.velocidad == "real":
+            if self.t_inicio_reproduccion is None:
+                self.t_inicio_reproduccion = time.perf_counter()
+            espera = self.t_inicio_reproduccion + self.timestamp_s - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+        return True, frame
+
+    @abc.abstractmethod
+    def _leer_siguiente(self):
+        """Devuelve el siguiente frame de la grabación, o None si ya no quedan."""
+
+
+class FuenteVideo(FuenteGrabada):
+    """Reproduce un archivo de video a los fps con los que se grabó."""
+
+    def __init__(self, ruta_video, velocidad="real", fps_por_defecto=30.0):
+        self.ruta = ruta_video
+        self.captura = cv2.VideoCapture(ruta_video)
+        fps = self.captura.get(cv2.CAP_PROP_FPS) if self.captura.isOpened() else 0.0
+        super().__init__(fps if fps and fps > 0 else fps_por_defecto, velocidad)
+
+    def isOpened(self):
+        return self.captura.isOpened()
+
+    def _leer_siguiente(self):
+        ret, frame = self.captura.read()
+        return frame if ret else None
+
+    def get(self, propiedad):
+        if propiedad == cv2.CAP_PROP_FPS:
+            return self.fps
+        return self.captura.get(propiedad)
+
+    def release(self):
+        self.captura.release()
+
+    def __str__(self):
+        return f"video '{self.ruta}' ({self.fps:.1f} fps, velocidad {self.velocidad})"
+
+
+class FuenteImagenes(FuenteGrabada):
+    """Reproduce las imágenes de una carpeta, en orden alfabético, como frames a 'fps'."""
+
+    def __init__(self, directorio, fps=None, velocidad="real"):
+        super().__init__(constants.FPS_FUENTE_IMAGENES if fps is None else fps, velocidad)
+        self.ruta = directorio
+        self.rutas_imagenes = sorted(os.path.join(directorio, n) for n in os.listdir(directorio)
+                                     if os.path.splitext(n)[1].lower() in EXTENSIONES_IMAGEN) if os.path.isdir(directorio) else []
+        self.tamano = None # (ancho, alto) del primer frame, para get()
+        self.abierta = bool(self.rutas_imagenes)
+
+    def isOpened(self):
+        return self.abierta
+
+    def _leer_siguiente(self):
+        while self.frames_leidos < len(self.rutas_imagenes):
+            frame = cv2.imread(self.rutas_imagenes[self.frames_leidos])
+            if frame is not None:
+                if self.tamano is None:
+                    self.tamano = (frame.shape[1], frame.shape[0])
+                return frame
+            print(f"ADVERTENCIA: No se pudo leer la imagen '{self.rutas_imagenes[self.frames_leidos]}'. Saltando.")
+            del self.rutas_imagenes[self.frames_leidos]
+        return None
+
+    def get(self, propiedad):
+        if propiedad == cv2.CAP_PROP_FPS:
+            return self.fps
+        if propiedad == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.rutas_imagenes))
+        if propiedad in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT):
+            if self.tamano is None and self.rutas_imagenes:
+                primera = cv2.imread(self.rutas_imagenes[0])
+                self.tamano = (primera.shape[1], primera.shape[0]) if primera is not None else (0, 0)
+            ancho, alto = self.tamano or (0, 0)
+            return float(ancho if propiedad == cv2.CAP_PROP_FRAME_WIDTH else alto)
+        return 0.0
+
+    def release(self):
+        self.abierta = False
+
+    def __str__(self):
+        return f"carpeta '{self.ruta}' ({len(self.rutas_imagenes)} imágenes a {self.fps:.1f} fps, velocidad {self.velocidad})"
+
+
+def abrir_fuente_camara():
+    """
+    Abre la fuente configurada en FUENTE_CAMARA: la cámara en vivo si está vacía,
+    una carpeta de imágenes si es un directorio o, si no, un archivo de video.
+    """
+    ruta = constants.FUENTE_CAMARA
+    if not ruta:
+        return FuenteCamara()
+    if os.path.isdir(ruta):
+        fuente = FuenteImagenes(ruta, velocidad=constants.VELOCIDAD_REPRODUCCION_FUENTE)
+    else:
+        fuente = FuenteVideo(ruta, constants.VELOCIDAD_REPRODUCCION_FUENTE)
+    print(f"Fuente de frames: {fuente}")
+    return fuente
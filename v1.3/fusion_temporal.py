@@ -0,0 +1,83 @@
+try:
+    import constants
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py o instrumentacion.py no encontrados en fusion_temporal.py.")
+    class constants: TOLERANCIA_FACIAL = 0.6; MODO_FUSION_FACIAL = "k_de_n"; K_FUSION_FACIAL = 2; DISTANCIA_ACEPTACION_INMEDIATA = 0.45
+    class instrumentacion: incrementar_contador = lambda n, c=1: None
+
+# ==============================================================================
+# FUSIÓN TEMPORAL DE DECISIONES FACIALES
+# ==============================================================================
+# Cada pista de seguimiento_facial.py guarda una ventana con las últimas observaciones
+# (identidad, distancia) obtenidas con encodings NUEVOS (un encoding reutilizado no es
+# un voto independiente). La decisión de aceptar se toma sobre esa ventana:
+#
+#   - "frame_unico": comportamiento clásico, basta una distancia <= TOLERANCIA_FACIAL.
+#   - "k_de_n":      al menos K_FUSION_FACIAL observaciones de la misma identidad <= TOLERANCIA_FACIAL
+#                    dentro de la ventana (VENTANA_FUSION_FACIAL).
+#   - "media":       media de las distancias de una identidad <= TOLERANCIA_FACIAL, con al menos
+#                    K_FUSION_FACIAL observaciones suyas en la ventana.
+#
+# En los dos modos de fusión, una observación <= DISTANCIA_ACEPTACION_INMEDIATA acepta
+# en el acto (rostros claros no esperan a reunir votos).
+
+MODOS_FUSION = ("frame_unico", "k_de_n", "media")
+
+
+def evaluar_observaciones(observaciones, modo=None):
+    """
+    Aplica la regla de fusión a una ventana de observaciones.
+
+    Args:
+        observaciones (iterable): Tuplas (id_identidad, distancia, usuario_info), de la más antigua a la más reciente.
+        modo (str): Uno de MODOS_FUSION (por defecto, MODO_FUSION_FACIAL de config.json).
+
+    Returns:
+        tuple: (usuario_info aceptado o None, motivo) donde motivo es
+               "frame_unico", "inmediata", "fusion" o None si aún no hay decisión.
+    """
+    observaciones = list(observaciones)
+    if not observaciones:
+        return None, None
+    modo = constants.MODO_FUSION_FACIAL if modo is None else modo
+    _, ultima_distancia, ultimo_usuario = observaciones[-1]
+
+    if modo not in ("k_de_n", "media"):
+        return (ultimo_usuario, "frame_unico") if ultima_distancia <= constants.TOLERANCIA_FACIAL else (None, None)
+    if ultima_distancia <= constants.DISTANCIA_ACEPTACION_INMEDIATA:
+        return ultimo_usuario, "inmediata"
+
+    por_identidad = {}
+    for id_identidad, distancia, usuario in observaciones:
+        distancias, _ = por_identidad.get(id_identidad, ([], None))
+        distancias.append(distancia)
+        por_identidad[id_identidad] = (distancias, usuario) # Se queda con los datos más recientes
+
+    mejor_usuario, mejor_puntuacion = None, None
+    for distancias, usuario in por_identidad.values():
+        if modo == "k_de_n":
+            votos = sum(1 for d in distancias if d <= constants.TOLERANCIA_FACIAL)
+            if votos >= constants.K_FUSION_FACIAL and (mejor_puntuacion is None or votos > mejor_puntuacion):
+                mejor_usuario, mejor_puntuacion = usuario, votos
+        else:
+            media = sum(distancias) / len(distancias)
+            if (len(distancias) >= constants.K_FUSION_FACIAL and media <= constants.TOLERANCIA_FACIAL and
+                    (mejor_puntuacion is None or -media > mejor_puntuacion)):
+                mejor_usuario, mejor_puntuacion = usuario, -media
+    return (mejor_usuario, "fusion") if mejor_usuario is not None else (None, None)
+
+def usuario_aceptado(pista):
+    """
+    Evalúa la ventana de una pista y devuelve los datos del usuario aceptado (o None).
+    La aceptación queda guardada en la pista para que el seguidor pueda dejar de recodificarla.
+    """
+    if pista is None:
+        return None
+    if pista.usuario_aceptado is None:
+        usuario, motivo = evaluar_observaciones(pista.observaciones)
+        if usuario is None:
+            return None
+        pista.usuario_aceptado = usuario
+        instrumentacion.incrementar_contador(f"facial_aceptacion_{motivo}")
+    return pista.usuario_aceptado
@@ -1,3 +1,5 @@
+# OBSOLETO: la v1.3 carga los encodings desde la BD y ya no lee encodings_faciales.pkl.
+# Para enrolar rostros usar enrolamiento_masivo.py.
 import face_recognition
 import pickle
 import os
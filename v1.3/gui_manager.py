@@ -4,14 +4,12 @@ import serial.tools.list_ports
 import threading # Para manejar referencias a hilos
 import time # Para delays si es necesario
 import re  # Agregando importación del módulo re
-import cv2 # Importar OpenCV
 import buscar_camaras # Importar el módulo para buscar cámaras
 import datetime # Mover datetime a las importaciones superiores
 from PIL import Image, ImageTk # Importar para manejar imágenes de OpenCV en Tkinter
 from enum import Enum
 import face_recognition # Para el reconocimiento facial
 import numpy as np # Para promediar encodings
-import facial_recognition_utils # <-- Agregado aquí para evitar NameError
 import queue # <--- ¡NUEVO! Para la cola de la UI
 
 # --- Importar nuestros módulos y constantes ---
@@ -22,6 +20,9 @@ try:
     import db_manager    
     import reporting_logging 
     import global_state # FIX: Importar el estado global
+    import renderizador_vista_previa # Escala el último frame de la cámara fuera del hilo de Tk
+    import servicio_captura # Cámara compartida con la FSM (para capturar rostros en el formulario)
+    import instrumentacion
     # facial_recognition_utils no se importa directamente aquí, 
     # ya que la GUI no interactúa con sus funciones directamente en esta fase
 except ImportError as e:
@@ -35,7 +36,7 @@ except ImportError as e:
     class state_machine_logic: 
         class EstadoSistema: REPOSO="S_REPOSO_STUB"
         estado_actual_sistema=EstadoSistema.REPOSO; protocolo_seleccionado_actual={"descripcion":"--"}; logica_maquina_estados=print; hilo_maquina_estados=None; hilo_maquina_estados_activo=False
-    class db_manager: obtener_usuario_por_id_bd=lambda x:None;verificar_uid_existente_bd=lambda x,y=None:None;verificar_dni_existente_bd=lambda x,y=None:None;agregar_usuario_bd=lambda d:(False,"");actualizar_usuario_bd=lambda x,d:(False,"");obtener_todos_los_usuarios_bd=lambda:[];borrar_usuario_bd=lambda x:(False,"")
+    class db_manager: obtener_usuario_por_id_bd=lambda x:None;verificar_uid_existente_bd=lambda x,y=None:None;verificar_dni_existente_bd=lambda x,y=None:None;agregar_usuario_bd=lambda d:(False,"");actualizar_usuario_bd=lambda x,d:(False,"");agregar_encoding_facial_bd=lambda x,e,o="captura":(False,"");obtener_todos_los_usuarios_bd=lambda:[];borrar_usuario_bd=lambda x:(False,"")
     class reporting_logging: contador_accesos_hoy=0;eventos_acceso_hoy=[];intentos_fallidos_hoy=[];fecha_actual_para_conteo="";verificar_y_resetear_por_cambio_de_dia=print;generar_reporte_final_dia=print
     print("ADVERTENCIA: GUI con funcionalidad limitada debido a errores de importación.")
 
@@ -83,6 +84,11 @@ class InterfazGrafica(tk.Tk):
         self.crear_widgets_tab_reportes_diarios()
         
         self.procesar_cola_ui() # <--- Reemplaza a actualizar_gui_periodicamente
+        self.renderizador_vista_previa = renderizador_vista_previa.RenderizadorVistaPrevia()
+        self.foto_vista_previa = None # ImageTk.PhotoImage reutilizada con paste()
+        self.lbl_camera_feed.bind("<Configure>", lambda e: self.renderizador_vista_previa.ajustar_tamano(e.width, e.height))
+        self.renderizador_vista_previa.iniciar()
+        self.actualizar_vista_previa() # Video de la cámara, fuera de la cola de la UI
         self.habilitar_deshabilitar_gui_por_conexion(False) 
 
     def crear_widgets_conexion(self, master_frame):
@@ -172,6 +178,9 @@ class InterfazGrafica(tk.Tk):
         self.btn_capturar_rostro.grid(row=8, column=1, padx=5, pady=5, sticky="ew")
         self.lbl_estado_facial = ttk.Label(self.frame_formulario_usuario, text="No capturado", foreground="gray")
         self.lbl_estado_facial.grid(row=8, column=2, padx=5, pady=5, sticky="w")
+        # En edición, "Guardar Cambios" con un rostro capturado reemplaza todas las muestras; "Agregar Muestra" la añade a las existentes
+        self.btn_agregar_muestra = ttk.Button(self.frame_formulario_usuario, text="Agregar Muestra", command=self.accion_agregar_muestra_facial, state=tk.DISABLED)
+        self.btn_agregar_muestra.grid(row=9, column=1, padx=5, pady=5, sticky="ew")
 
         frame_lista_usuarios = ttk.LabelFrame(self.tab_gestion_usuarios, text="Lista de Usuarios Registrados"); frame_lista_usuarios.pack(padx=10, pady=10, fill="both", expand=True)
         cols_usuarios = ("id", "nombre", "dni", "nivel", "uid_rfid")
@@ -245,6 +254,41 @@ class InterfazGrafica(tk.Tk):
             self.modo_escaneo_rfid_para_registro = False 
             if hasattr(self, 'lbl_mensaje_acceso'): self.lbl_mensaje_acceso.config(text="") 
 
+    def capturar_rostro_action(self): # Usa servicio_captura
+        """Toma frames de la cámara compartida hasta encontrar exactamente un rostro y guarda su encoding."""
+        camara = servicio_captura.adquirir_camara()
+        try:
+            if not camara.isOpened():
+                messagebox.showerror("Cámara", "No se pudo abrir la cámara."); return
+            encoding, rostros_vistos = None, 0
+            for _ in range(constants.FRAMES_CAPTURA_ROSTRO_FORMULARIO):
+                ret, frame = camara.read()
+                if not ret or frame is None: continue
+                rgb = np.ascontiguousarray(frame[:, :, ::-1]) # BGR -> RGB
+                ubicaciones = face_recognition.face_locations(rgb)
+                rostros_vistos = max(rostros_vistos, len(ubicaciones))
+                if len(ubicaciones) == 1:
+                    encoding = face_recognition.face_encodings(rgb, ubicaciones)[0]; break
+        finally:
+            camara.release()
+        if encoding is None:
+            msg = "Hay más de un rostro frente a la cámara." if rostros_vistos > 1 else "No se detectó ningún rostro."
+            messagebox.showwarning("Captura Facial", msg); return
+        self.facial_encoding_para_guardar = encoding
+        self.lbl_estado_facial.config(text="Rostro capturado", foreground="green")
+        if self.usuario_a_editar_id: self.btn_agregar_muestra.config(state=tk.NORMAL)
+        print("DEBUG: Encoding facial capturado para el formulario.")
+
+    def accion_agregar_muestra_facial(self): # Usa db_manager
+        if not self.usuario_a_editar_id or self.facial_encoding_para_guardar is None:
+            messagebox.showwarning("Agregar Muestra", "Edite un usuario y capture su rostro primero."); return
+        exito, msg = db_manager.agregar_encoding_facial_bd(self.usuario_a_editar_id, self.facial_encoding_para_guardar, "captura")
+        if exito:
+            messagebox.showinfo("Éxito", msg)
+            self.facial_encoding_para_guardar = None # Ya guardada: "Guardar Cambios" no debe reemplazar las muestras con ella
+            self.lbl_estado_facial.config(text="Muestra agregada", foreground="gray"); self.btn_agregar_muestra.config(state=tk.DISABLED)
+        else: messagebox.showerror("Error", msg)
+
     def validar_formulario_usuario(self, datos, es_edicion=False): # Este método usa db_manager
         print(f"DEBUG: Validando formulario. Datos: {datos}")
         if not datos["nombre"] or not datos["dni"] or not datos["uid_rfid"]: 
@@ -292,19 +336,6 @@ class InterfazGrafica(tk.Tk):
             print("DEBUG: Arduino no conectado. Mostrando advertencia.")
             messagebox.showwarning("Desconectado", "Arduino no está conectado."); return
         
-        # Determinar qué encoding facial se debe guardar
-        encoding_a_guardar = None
-        if self.facial_encoding_para_guardar is not None:
-            # Prioridad 1: Usar el nuevo rostro recién capturado.
-            encoding_a_guardar = self.facial_encoding_para_guardar
-            print("DEBUG: Usando nuevo encoding facial capturado.")
-        elif self.usuario_a_editar_id:
-            # Prioridad 2: Si no hay rostro nuevo y estamos editando, mantener el que ya existía.
-            usuario_existente_data = db_manager.obtener_usuario_por_id_bd(self.usuario_a_editar_id)
-            if usuario_existente_data and usuario_existente_data.get('facial_encoding_array') is not None:
-                encoding_a_guardar = usuario_existente_data.get('facial_encoding_array')
-                print("DEBUG: Manteniendo encoding facial existente del usuario.")
-
         datos_f = {
             "nombre": self.entry_nombre.get().strip(), 
             "dni": self.entry_dni.get().strip(), 
@@ -312,9 +343,13 @@ class InterfazGrafica(tk.Tk):
             "area": self.entry_area.get().strip(), 
             "uid_rfid": self.uid_escaneado_para_formulario.get().strip().upper(), 
             "h_inicio": self.entry_h_inicio.get().strip() if self.combo_nivel.get() == "Trabajador" else None, 
-            "h_fin": self.entry_h_fin.get().strip() if self.combo_nivel.get() == "Trabajador" else None,
-            "facial_encoding_array": encoding_a_guardar
+            "h_fin": self.entry_h_fin.get().strip() if self.combo_nivel.get() == "Trabajador" else None
         }
+        # Solo un rostro recién capturado reemplaza las muestras faciales; al editar sin capturar,
+        # la clave no se envía y actualizar_usuario_bd conserva las muestras del usuario.
+        if self.facial_encoding_para_guardar is not None:
+            datos_f["facial_encoding_array"] = self.facial_encoding_para_guardar
+            print("DEBUG: Usando nuevo encoding facial capturado.")
         
         if self.usuario_a_editar_id: 
             print(f"DEBUG: Modo Edición. ID de usuario: {self.usuario_a_editar_id}")
@@ -339,10 +374,7 @@ class InterfazGrafica(tk.Tk):
             messagebox.showinfo("Éxito", msg)
             self.limpiar_formulario_usuario()
             self.cargar_usuarios_al_treeview()
-            # FIX: Recargar los encodings en memoria para que el reconocimiento facial funcione inmediatamente.
-            print("Refrescando encodings faciales en memoria tras guardado...")
-            if hasattr(facial_recognition_utils, 'cargar_encodings_faciales_al_inicio'):
-                facial_recognition_utils.cargar_encodings_faciales_al_inicio()
+            # La galería facial en memoria ya se actualizó (solo la fila de este usuario) desde db_manager.
         else: 
             print("DEBUG: Operación de guardado fallida. Mostrando error.")
             messagebox.showerror("Error al Guardar", msg)
@@ -355,6 +387,7 @@ class InterfazGrafica(tk.Tk):
         self.facial_encoding_para_guardar = None
         if hasattr(self, 'lbl_estado_facial'):
             self.lbl_estado_facial.config(text="No capturado", foreground="gray")
+            self.btn_agregar_muestra.config(state=tk.DISABLED)
 
     def cancelar_edicion_usuario(self): self.limpiar_formulario_usuario()
 
@@ -476,6 +509,8 @@ class InterfazGrafica(tk.Tk):
             print("Señalando a hilos para terminar por desconexión manual...")
             arduino_comms.hilo_listener_arduino_activo = False
             state_machine_logic.hilo_maquina_estados_activo = False
+            if arduino_comms.arduino_serial and hasattr(arduino_comms.arduino_serial, "cancel_read"):
+                arduino_comms.arduino_serial.cancel_read() # Despertar la lectura bloqueante del listener
             
             # Esperar a que los hilos terminen (opcional, pero buena práctica)
             if arduino_comms.hilo_listener_arduino and arduino_comms.hilo_listener_arduino.is_alive():
@@ -586,14 +621,6 @@ class InterfazGrafica(tk.Tk):
                 elif msg["type"] == "report_update":
                     self.actualizar_reportes_en_gui(msg)
 
-                elif msg["type"] == "camera_feed_update":
-                    frame = msg.get("frame")
-                    if frame is not None:
-                        self.mostrar_frame_camara(frame)
-                    else:
-                        text = msg.get("text", "Cámara OFF")
-                        self.lbl_camera_feed.config(image='', text=text)
-                
                 elif msg["type"] == "mensaje_update":
                     if 'mensaje' in msg:
                         self.actualizar_mensaje(msg['mensaje'])
@@ -608,8 +635,31 @@ class InterfazGrafica(tk.Tk):
 
         self.after(100, self.procesar_cola_ui) # Volver a verificar la cola en 100ms
 
+    def actualizar_vista_previa(self):
+        """
+        Muestra el último frame de la cámara (o el texto de cámara apagada). El frame llega ya
+        escalado y en RGB desde renderizador_vista_previa, como mucho FPS_MAX_VISTA_PREVIA
+        veces por segundo; aquí solo se pega en la PhotoImage.
+        """
+        t_inicio = time.perf_counter()
+        listo = self.renderizador_vista_previa.tomar_listo()
+        if listo is not None:
+            tipo, contenido = listo
+            if tipo == "frame":
+                try:
+                    self.mostrar_frame_camara(contenido)
+                finally:
+                    self.renderizador_vista_previa.liberar()
+                instrumentacion.registrar_tiempo("vista_previa_tk", time.perf_counter() - t_inicio)
+            else:
+                self.foto_vista_previa = None
+                self.lbl_camera_feed.config(image='', text=contenido)
+        periodo_ms = 1000.0 / max(1.0, constants.FPS_MAX_VISTA_PREVIA)
+        self.after(max(1, int(periodo_ms / 2)), self.actualizar_vista_previa) # Muestreo al doble de fps: un frame listo espera como mucho medio periodo
+
     def al_cerrar_ventana(self):
         print("Cerrando aplicación..."); 
+        self.renderizador_vista_previa.detener()
         if self.btn_conectar['text'] == 'Desconectar': self.accion_conectar_desconectar() 
         else: 
             if hasattr(arduino_comms, 'hilo_listener_arduino_activo'):
@@ -650,31 +700,16 @@ class InterfazGrafica(tk.Tk):
         else:
             messagebox.showwarning("Selección de Cámara", "Por favor, selecciona un índice de cámara válido.")
 
-    def mostrar_frame_camara(self, frame_np):
-        # Redimensionar el frame para que encaje en el Label si es necesario
-        # Obtener el tamaño actual del label para escalado dinámico
-        lbl_width = self.lbl_camera_feed.winfo_width()
-        lbl_height = self.lbl_camera_feed.winfo_height()
-
-        if lbl_width == 1 and lbl_height == 1: # Valor por defecto antes de que el widget tenga tamaño real
-            lbl_width = 640 # Tamaño por defecto
-            lbl_height = 480
-
-        # Mantener la relación de aspecto
-        (h, w) = frame_np.shape[:2]
-        if lbl_width / w < lbl_height / h:
-            scale = lbl_width / w
+    def mostrar_frame_camara(self, frame_rgb):
+        """Pega un frame RGB ya escalado (renderizador_vista_previa) en la PhotoImage del Label."""
+        img = Image.fromarray(frame_rgb)
+        if self.foto_vista_previa is None or (self.foto_vista_previa.width(), self.foto_vista_previa.height()) != img.size:
+            # Solo al empezar o si cambia el tamaño del widget: la PhotoImage se reutiliza con paste()
+            self.foto_vista_previa = ImageTk.PhotoImage(image=img)
+            self.lbl_camera_feed.imgtk = self.foto_vista_previa # Mantener una referencia para evitar que sea recolectada por el GC
+            self.lbl_camera_feed.config(image=self.foto_vista_previa)
         else:
-            scale = lbl_height / h
-        
-        new_width, new_height = int(w * scale), int(h * scale)
-        resized_frame = cv2.resize(frame_np, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-        # Convertir el frame de OpenCV a un formato compatible con Tkinter
-        img = Image.fromarray(resized_frame)
-        imgtk = ImageTk.PhotoImage(image=img)
-        self.lbl_camera_feed.imgtk = imgtk  # Mantener una referencia para evitar que sea recolectada por el GC
-        self.lbl_camera_feed.config(image=imgtk)
+            self.foto_vista_previa.paste(img)
 
     def actualizar_mensaje(self, mensaje, color=None):
         """Actualiza el mensaje en la GUI con el color especificado"""
@@ -0,0 +1,329 @@
+import time
+import numpy as np
+
+# ==============================================================================
+# ÍNDICES PARA LA BÚSQUEDA 1:N EN LA GALERÍA FACIAL
+# ==============================================================================
+# Capa de índices intercambiables usada por facial_recognition_utils.py.
+# Un índice solo propone filas candidatas de la galería; la decisión final siempre
+# se toma con la distancia euclídea exacta de esos candidatos frente a TOLERANCIA_FACIAL.
+#
+# - IndiceExacto: fuerza bruta (todas las filas son candidatas). Ideal para galerías pequeñas.
+# - IndiceIVF:    cuantizador grueso k-means (listas invertidas) en NumPy puro, con
+#                 cuantización de producto (PQ) opcional para puntuar candidatos sin leer
+#                 los vectores completos. El recall se ajusta con 'nprobe' y 'top_k'.
+#
+# Cambios incrementales: la galería avisa con marcar_fila_modificada() cada fila que se
+# añade, cambia o se mueve (con su vector nuevo). El IVF invalida su entrada en las listas y
+# la guarda como "pendiente" en una matriz aparte: cada consulta puntúa todas las pendientes
+# con un único producto y añade sus 'top_k' mejores a los candidatos, hasta que
+# necesita_reconstruccion() pide reentrenarlo.
+
+FRACCION_MAXIMA_PENDIENTES = 0.05 # Filas pendientes (sobre el total) que disparan la reconstrucción del IVF
+MIN_PENDIENTES_RECONSTRUCCION = 256
+
+TAMANO_BLOQUE_ASIGNACION = 8192 # Filas por bloque al asignar vectores a centroides (limita memoria)
+
+
+def _distancias_cuadradas(datos, centroides, normas_centroides=None):
+    """Distancias euclídeas al cuadrado (len(datos) x len(centroides)) mediante un producto matricial."""
+    if normas_centroides is None:
+        normas_centroides = np.einsum('ij,ij->i', centroides, centroides)
+    d2 = datos @ centroides.T
+    d2 *= -2.0
+    d2 += normas_centroides[None, :]
+    d2 += np.einsum('ij,ij->i', datos, datos)[:, None]
+    return d2
+
+def _asignar_a_centroides(datos, centroides):
+    """Devuelve, para cada fila de 'datos', el índice del centroide más cercano (procesado por bloques)."""
+    normas_centroides = np.einsum('ij,ij->i', centroides, centroides)
+    asignaciones = np.empty(len(datos), dtype=np.int64)
+    for inicio in range(0, len(datos), TAMANO_BLOQUE_ASIGNACION):
+        bloque = datos[inicio:inicio + TAMANO_BLOQUE_ASIGNACION]
+        asignaciones[inicio:inicio + len(bloque)] = np.argmin(_distancias_cuadradas(bloque, centroides, normas_centroides), axis=1)
+    return asignaciones
+
+def kmeans(datos, k, iteraciones=10, semilla=0):
+    """
+    K-means (Lloyd) en NumPy puro.
+
+    Args:
+        datos (np.ndarray): Matriz float32 (N x D).
+        k (int): Número de centroides (se limita a N).
+        iteraciones (int): Iteraciones de Lloyd.
+        semilla (int): Semilla para la inicialización aleatoria.
+
+    Returns:
+        np.ndarray: Centroides float32 (k x D).
+    """
+    rng = np.random.default_rng(semilla)
+    n = len(datos)
+    k = max(1, min(k, n))
+    centroides = datos[rng.choice(n, k, replace=False)].astype(np.float32, copy=True)
+    for _ in range(iteraciones):
+        asignaciones = _asignar_a_centroides(datos, centroides)
+        conteos = np.bincount(asignaciones, minlength=k)
+        orden = np.argsort(asignaciones, kind='stable')
+        no_vacios = np.flatnonzero(conteos)
+        inicios = np.concatenate(([0], np.cumsum(conteos)[:-1]))[no_vacios]
+        sumas = np.add.reduceat(datos[orden], inicios, axis=0)
+        centroides[no_vacios] = sumas / conteos[no_vacios, None]
+        vacios = np.flatnonzero(conteos == 0)
+        if len(vacios): # Re-sembrar centroides vacíos con puntos aleatorios
+            centroides[vacios] = datos[rng.choice(n, len(vacios), replace=False)]
+    return centroides
+
+
+class IndiceExacto:
+    """Índice de fuerza bruta: todas las filas de la galería son candidatas."""
+    nombre = "exacto"
+
+    def __init__(self):
+        self.num_filas = 0
+
+    def construir(self, matriz_galeria):
+        self.num_filas = len(matriz_galeria)
+
+    def marcar_fila_modificada(self, fila, num_filas, vector=None):
+        self.num_filas = num_filas
+
+    def necesita_reconstruccion(self, num_filas):
+        return False
+
+    def buscar_candidatos(self, consultas, top_k):
+        """Devuelve None para indicar que se debe comparar contra toda la galería."""
+        return None
+
+
+class IndiceIVF:
+    """
+    Índice IVF (inverted file) con cuantizador grueso k-means y PQ opcional.
+
+    Los vectores se agrupan en 'num_listas' listas según su centroide más cercano.
+    En la búsqueda solo se visitan las 'nprobe' listas más cercanas a cada consulta y
+    se devuelven las 'top_k' filas mejor puntuadas (distancia float32 directa o, con PQ,
+    distancia asimétrica aproximada) para que el llamador las re-ordene con la distancia exacta.
+    """
+    nombre = "ivf"
+
+    def __init__(self, num_listas=0, nprobe=8, subvectores_pq=0, iteraciones_kmeans=10, max_muestras_entrenamiento=50000, semilla=0):
+        self.num_listas_configuradas = num_listas # 0 = automático (~4*sqrt(N))
+        self.nprobe = max(1, nprobe)
+        self.subvectores_pq = subvectores_pq      # 0 = sin PQ
+        self.iteraciones_kmeans = iteraciones_kmeans
+        self.max_muestras_entrenamiento = max_muestras_entrenamiento
+        self.semilla = semilla
+
+        self.num_filas = 0
+        self.centroides = None
+        self.normas_centroides = None
+        self.filas_ordenadas = None   # Fila original de la galería, agrupadas por lista
+        self.inicios_listas = None    # Desplazamiento de cada lista dentro de 'filas_ordenadas' (len = num_listas + 1)
+        self.vectores_ordenados = None
+        self.normas_ordenadas = None
+        self.libros_pq = None         # (m x 256 x D/m) centroides de cada subespacio
+        self.codigos_pq = None        # (N x m) uint8, en el orden de 'filas_ordenadas'
+        self.posicion_de_fila = None  # Fila de la galería -> posición en 'filas_ordenadas' (-1 si ya no es válida)
+        self.posicion_valida = None   # False para posiciones invalidadas por cambios incrementales
+        self._vaciar_pendientes()
+
+    def _vaciar_pendientes(self):
+        # Filas añadidas/cambiadas tras construir: las primeras 'num_pendientes' posiciones de
+        # estos arrays (fila, vector y norma al cuadrado), sin orden; una baja mueve la última al hueco.
+        self.num_pendientes = 0
+        self.filas_pendientes = np.empty(0, dtype=np.int64)
+        self.vectores_pendientes = None
+        self.normas_pendientes = np.empty(0, dtype=np.float32)
+        self.hueco_pendiente_de_fila = {} # Fila de la galería -> posición en 'filas_pendientes'
+
+    def construir(self, matriz_galeria):
+        """Entrena el cuantizador (y PQ si aplica) y reparte las filas en listas invertidas."""
+        t_inicio = time.perf_counter()
+        datos = np.ascontiguousarray(matriz_galeria, dtype=np.float32)
+        self.num_filas = len(datos)
+        self._vaciar_pendientes()
+        if self.num_filas == 0:
+            self.centroides = None
+            self.posicion_de_fila = None
+            return
+
+        num_listas = self.num_listas_configuradas or int(4 * np.sqrt(self.num_filas))
+        num_listas = max(1, min(num_listas, self.num_filas))
+        rng = np.random.default_rng(self.semilla)
+        if self.num_filas > self.max_muestras_entrenamiento:
+            muestra = datos[rng.choice(self.num_filas, self.max_muestras_entrenamiento, replace=False)]
+        else:
+            muestra = datos
+        self.centroides = kmeans(muestra, num_listas, self.iteraciones_kmeans, self.semilla)
+        self.normas_centroides = np.einsum('ij,ij->i', self.centroides, self.centroides)
+
+        asignaciones = _asignar_a_centroides(datos, self.centroides)
+        self.filas_ordenadas = np.argsort(asignaciones, kind='stable')
+        conteos = np.bincount(asignaciones, minlength=len(self.centroides))
+        self.inicios_listas = np.concatenate(([0], np.cumsum(conteos))).astype(np.int64)
+        self.vectores_ordenados = datos[self.filas_ordenadas]
+        self.normas_ordenadas = np.einsum('ij,ij->i', self.vectores_ordenados, self.vectores_ordenados)
+        self.posicion_de_fila = np.empty(self.num_filas, dtype=np.int64)
+        self.posicion_de_fila[self.filas_ordenadas] = np.arange(self.num_filas)
+        self.posicion_valida = np.ones(self.num_filas, dtype=bool)
+
+        self.libros_pq = None
+        self.codigos_pq = None
+        if self.subvectores_pq:
+            self._entrenar_pq(muestra)
+        if self.libros_pq is not None:
+            # Con PQ ya no hace falta la copia completa de los vectores: se puntúa con los códigos
+            self.vectores_ordenados = None
+            self.normas_ordenadas = None
+
+        print(f"Índice IVF construido: {self.num_filas} filas, {len(self.centroides)} listas, "
+              f"PQ={'m=' + str(self.subvectores_pq) if self.libros_pq is not None else 'no'} "
+              f"({(time.perf_counter() - t_inicio) * 1000:.0f} ms).")
+
+    def _entrenar_pq(self, muestra):
+        dimension = muestra.shape[1]
+        m = self.subvectores_pq
+        if dimension % m != 0:
+            print(f"ADVERTENCIA: {dimension} no es divisible entre {m} subvectores PQ. PQ desactivado.")
+            return
+        sub_d = dimension // m
+        datos_ordenados = self.vectores_ordenados
+        self.libros_pq = np.empty((m, 256, sub_d), dtype=np.float32)
+        self.codigos_pq = np.empty((len(datos_ordenados), m), dtype=np.uint8)
+        for j in range(m):
+            sub_muestra = np.ascontiguousarray(muestra[:, j * sub_d:(j + 1) * sub_d])
+            libro = kmeans(sub_muestra, 256, self.iteraciones_kmeans, self.semilla + j)
+            if len(libro) < 256: # Muestras insuficientes: rellenar repitiendo centroides
+                libro = np.resize(libro, (256, sub_d))
+            self.libros_pq[j] = libro
+            sub_datos = np.ascontiguousarray(datos_ordenados[:, j * sub_d:(j + 1) * sub_d])
+            self.codigos_pq[:, j] = _asignar_a_centroides(sub_datos, self.libros_pq[j])
+
+    def marcar_fila_modificada(self, fila, num_filas, vector=None):
+        """
+        La fila 'fila' de la galería cambió de contenido (alta, actualización o traslado por
+        un borrado). Su entrada en las listas deja de ser válida y, si la fila sigue existiendo
+        (fila < num_filas), pasa a ser pendiente con su 'vector' actual hasta la próxima reconstrucción.
+        """
+        self.num_filas = num_filas
+        if self.posicion_de_fila is not None and fila < len(self.posicion_de_fila):
+            posicion = self.posicion_de_fila[fila]
+            if posicion >= 0:
+                self.posicion_valida[posicion] = False
+                self.posicion_de_fila[fila] = -1
+        if fila < num_filas:
+            self._guardar_pendiente(fila, np.asarray(vector, dtype=np.float32))
+        else:
+            self._quitar_pendiente(fila)
+
+    def _guardar_pendiente(self, fila, vector):
+        hueco = self.hueco_pendiente_de_fila.get(fila)
+        if hueco is None:
+            hueco = self.num_pendientes
+            if hueco == len(self.filas_pendientes):
+                self._ampliar_pendientes(len(vector))
+            self.filas_pendientes[hueco] = fila
+            self.hueco_pendiente_de_fila[fila] = hueco
+            self.num_pendientes += 1
+        self.vectores_pendientes[hueco] = vector
+        self.normas_pendientes[hueco] = np.dot(vector, vector)
+
+    def _quitar_pendiente(self, fila):
+        hueco = self.hueco_pendiente_de_fila.pop(fila, None)
+        if hueco is None:
+            return
+        ultimo = self.num_pendientes - 1
+        if hueco != ultimo:
+            fila_ultima = int(self.filas_pendientes[ultimo])
+            self.filas_pendientes[hueco] = fila_ultima
+            self.vectores_pendientes[hueco] = self.vectores_pendientes[ultimo]
+            self.normas_pendientes[hueco] = self.normas_pendientes[ultimo]
+            self.hueco_pendiente_de_fila[fila_ultima] = hueco
+        self.num_pendientes = ultimo
+
+    def _ampliar_pendientes(self, dimension):
+        """Duplica la capacidad de los arrays de pendientes (coste amortizado O(1) por fila)."""
+        capacidad = max(16, 2 * len(self.filas_pendientes))
+        filas = np.empty(capacidad, dtype=np.int64)
+        vectores = np.empty((capacidad, dimension), dtype=np.float32)
+        normas = np.empty(capacidad, dtype=np.float32)
+        n = self.num_pendientes
+        filas[:n] = self.filas_pendientes[:n]
+        normas[:n] = self.normas_pendientes[:n]
+        if n:
+            vectores[:n] = self.vectores_pendientes[:n]
+        self.filas_pendientes, self.vectores_pendientes, self.normas_pendientes = filas, vectores, normas
+
+    def necesita_reconstruccion(self, num_filas):
+        limite = max(MIN_PENDIENTES_RECONSTRUCCION, int(FRACCION_MAXIMA_PENDIENTES * num_filas))
+        return self.num_pendientes > limite
+
+    def _posiciones_de_listas(self, listas):
+        """Concatena las posiciones (en el orden interno) de las listas indicadas."""
+        tramos = [np.arange(self.inicios_listas[l], self.inicios_listas[l + 1]) for l in listas]
+        return np.concatenate(tramos) if tramos else np.empty(0, dtype=np.int64)
+
+    def buscar_candidatos(self, consultas, top_k):
+        """
+        Devuelve una matriz (M x top_k + P) con filas candidatas de la galería para cada consulta
+        (rellenada con -1 si las listas visitadas tienen menos de 'top_k' elementos). Las P
+        últimas columnas son las min(top_k, pendientes) filas pendientes más cercanas a cada consulta.
+        """
+        consultas = np.asarray(consultas, dtype=np.float32)
+        k_pendientes = min(top_k, self.num_pendientes)
+        candidatos = np.full((len(consultas), top_k + k_pendientes), -1, dtype=np.int64)
+        if k_pendientes:
+            candidatos[:, top_k:] = self._mejores_pendientes(consultas, k_pendientes)
+        if self.centroides is None:
+            return candidatos
+        nprobe = min(self.nprobe, len(self.centroides))
+        d2_gruesas = _distancias_cuadradas(consultas, self.centroides, self.normas_centroides)
+        listas_por_consulta = np.argpartition(d2_gruesas, nprobe - 1, axis=1)[:, :nprobe]
+
+        for i, consulta in enumerate(consultas):
+            posiciones = self._posiciones_de_listas(listas_por_consulta[i])
+            posiciones = posiciones[self.posicion_valida[posiciones]]
+            if len(posiciones) == 0:
+                continue
+            if self.libros_pq is not None:
+                puntuaciones = self._distancias_pq(consulta, posiciones)
+            else:
+                vectores = self.vectores_ordenados[posiciones]
+                puntuaciones = self.normas_ordenadas[posiciones] - 2.0 * (vectores @ consulta)
+            k = min(top_k, len(posiciones))
+            mejores = np.argpartition(puntuaciones, k - 1)[:k]
+            mejores = mejores[np.argsort(puntuaciones[mejores])]
+            candidatos[i, :k] = self.filas_ordenadas[posiciones[mejores]]
+        return candidatos
+
+    def _mejores_pendientes(self, consultas, k):
+        """Las 'k' filas pendientes más cercanas a cada consulta (M x k), puntuadas todas a la vez."""
+        n = self.num_pendientes
+        puntuaciones = consultas @ self.vectores_pendientes[:n].T # (M x P); ||q||^2 no cambia el orden
+        puntuaciones *= -2.0
+        puntuaciones += self.normas_pendientes[None, :n]
+        if k < n:
+            mejores = np.argpartition(puntuaciones, k - 1, axis=1)[:, :k]
+        else:
+            mejores = np.broadcast_to(np.arange(n), puntuaciones.shape)
+        return self.filas_pendientes[mejores]
+
+    def _distancias_pq(self, consulta, posiciones):
+        """Distancias asimétricas (ADC): tabla de distancias por subespacio + suma de códigos."""
+        m, _, sub_d = self.libros_pq.shape
+        sub_consultas = consulta.reshape(m, 1, sub_d)
+        tablas = np.sum((self.libros_pq - sub_consultas) ** 2, axis=2) # (m x 256)
+        return tablas[np.arange(m)[None, :], self.codigos_pq[posiciones]].sum(axis=1)
+
+
+def crear_indice_facial(tipo, **parametros):
+    """
+    Crea un índice por nombre ("exacto" o "ivf"). Parámetros desconocidos se ignoran
+    para el índice exacto. Un tipo desconocido devuelve el índice exacto con una advertencia.
+    """
+    if tipo == IndiceIVF.nombre:
+        return IndiceIVF(**parametros)
+    if tipo != IndiceExacto.nombre:
+        print(f"ADVERTENCIA: Tipo de índice facial '{tipo}' desconocido. Usando índice exacto.")
+    return IndiceExacto()
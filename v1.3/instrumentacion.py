@@ -0,0 +1,89 @@
+import time
+import threading
+import collections
+import contextlib
+import numpy as np
+
+# ==============================================================================
+# INSTRUMENTACIÓN: CONTADORES, VALORES Y TIEMPOS DEL PIPELINE DE CÁMARA
+# ==============================================================================
+# Superficie común de métricas para la máquina de estados y sus etapas (detección
+# facial, QR, cámara...). Cualquier hilo puede registrar; la GUI, los benchmarks o
+# la consola leen un resumen con obtener_resumen().
+
+MUESTRAS_MAX_POR_TIEMPO = 1000 # Se conservan solo las mediciones más recientes de cada tiempo
+
+lock_metricas = threading.Lock()
+contadores = collections.Counter()  # nombre -> entero acumulado
+valores = {}                        # nombre -> último valor registrado (escala elegida, fps, ...)
+tiempos = {}                        # nombre -> deque con las últimas duraciones en segundos
+
+
+def incrementar_contador(nombre, cantidad=1):
+    with lock_metricas:
+        contadores[nombre] += cantidad
+
+def registrar_valor(nombre, valor):
+    with lock_metricas:
+        valores[nombre] = valor
+
+def registrar_tiempo(nombre, segundos):
+    with lock_metricas:
+        if nombre not in tiempos:
+            tiempos[nombre] = collections.deque(maxlen=MUESTRAS_MAX_POR_TIEMPO)
+        tiempos[nombre].append(segundos)
+
+@contextlib.contextmanager
+def medir_etapa(nombre):
+    """
+    Registra la duración del bloque en 'nombre' y el tiempo de CPU del hilo que lo
+    ejecuta en 'nombre_cpu' (si es mucho menor que la duración, la etapa espera: E/S, sleep...).
+    """
+    t_inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        registrar_tiempo(nombre, time.perf_counter() - t_inicio)
+        registrar_tiempo(f"{nombre}_cpu", time.thread_time() - cpu_inicio)
+
+def obtener_contador(nombre):
+    with lock_metricas:
+        return contadores.get(nombre, 0)
+
+def obtener_resumen():
+    """
+    Devuelve una copia de todas las métricas:
+    {"contadores": {...}, "valores": {...},
+     "tiempos": {nombre: {"n", "media_ms", "p50_ms", "p99_ms", "max_ms"}}}
+    """
+    with lock_metricas:
+        resumen_tiempos = {}
+        for nombre, muestras in tiempos.items():
+            if not muestras:
+                continue
+            ms = np.fromiter(muestras, dtype=np.float64) * 1000.0
+            resumen_tiempos[nombre] = {
+                "n": len(ms),
+                "media_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return {"contadores": dict(contadores), "valores": dict(valores), "tiempos": resumen_tiempos}
+
+def reiniciar_metricas():
+    with lock_metricas:
+        contadores.clear()
+        valores.clear()
+        tiempos.clear()
+
+def imprimir_resumen(prefijo=""):
+    """Imprime en consola las métricas cuyo nombre empieza por 'prefijo'."""
+    resumen = obtener_resumen()
+    for nombre, valor in sorted(resumen["contadores"].items()):
+        if nombre.startswith(prefijo): print(f"  {nombre}: {valor}")
+    for nombre, valor in sorted(resumen["valores"].items()):
+        if nombre.startswith(prefijo): print(f"  {nombre}: {valor}")
+    for nombre, t in sorted(resumen["tiempos"].items()):
+        if nombre.startswith(prefijo):
+            print(f"  {nombre}: n={t['n']} media={t['media_ms']:.1f} ms p50={t['p50_ms']:.1f} ms p99={t['p99_ms']:.1f} ms")
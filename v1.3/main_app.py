@@ -4,6 +4,7 @@ import threading
 import time
 import cv2 # Para cv2.destroyAllWindows() al final
 import queue # <--- 1. Importar el módulo de colas
+import multiprocessing # Para el pool de detección facial (freeze_support en el ejecutable)
 
 # --- Importar nuestros módulos ---
 # Estos deben estar en la misma carpeta o en el PYTHONPATH
@@ -14,6 +15,8 @@ try:
     import db_manager 
     import reporting_logging 
     import facial_recognition_utils 
+    import procesamiento_facial 
+    import servicio_captura
     import constants # Si tienes constantes definidas allí
 except ImportError as e:
     print(f"Error CRÍTICO: No se pudo importar un módulo necesario: {e}")
@@ -74,6 +77,9 @@ def iniciar_aplicacion():
 # BLOQUE PRINCIPAL DE EJECUCIÓN
 # ==============================================================================
 if __name__ == "__main__":
+    # Necesario para que los procesos del pool de detección facial arranquen en el ejecutable de PyInstaller (Windows)
+    multiprocessing.freeze_support()
+
     # --- Generación de Encodings (Solo ejecutar una vez o cuando se actualizan imágenes) ---
     # Descomentar la siguiente sección si necesitas generar/regenerar 'encodings_faciales.pkl'
     # Asegúrate de que la función 'crear_encodings_de_rostros_conocidos' esté definida
@@ -142,4 +148,7 @@ if __name__ == "__main__":
             print("Esperando al hilo de máquina de estados (desde main_app)...")
             state_machine_logic.hilo_maquina_estados.join(timeout=1)
 
+        procesamiento_facial.detener_pool_deteccion()
+        servicio_captura.detener_servicio_captura()
+
         print("Programa terminado (desde main_app).")
\ No newline at end of file
@@ -0,0 +1,101 @@
+import time
+import threading
+import collections
+import cv2
+import numpy as np
+
+try:
+    import constants
+    import instrumentacion
+    import servicio_captura
+    import procesamiento_facial
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py, instrumentacion.py, servicio_captura.py o procesamiento_facial.py no encontrados en precalentamiento.py.")
+    class constants: USAR_PRECALENTAMIENTO_CAMARA = True; UMBRAL_PRECALENTAMIENTO_SP1_CM = 80.0; VELOCIDAD_ACERCAMIENTO_SP1_CM_S = 15.0; VENTANA_TENDENCIA_SP1_S = 0.6; DISTANCIA_MAX_TENDENCIA_SP1_CM = 200.0; FACTOR_REDUCCION_FRAME_FACIAL = 0.5
+    class instrumentacion: incrementar_contador = lambda n, c=1: None; registrar_tiempo = lambda n, s: None
+    class servicio_captura: camara_abierta = lambda: False; adquirir_camara = None
+    class procesamiento_facial: precalentar_deteccion = lambda f: None
+
+# ==============================================================================
+# PRECALENTAMIENTO DE CÁMARA Y MODELOS AL ACERCARSE ALGUIEN A SP1
+# ==============================================================================
+# Sin precalentamiento la cámara se abre cuando SP1 cruza UMBRAL_DETECCION_SP1_CM y el
+# detector se inicializa con el primer frame (en los procesos del pool, además, los propios
+# procesos se crean en ese momento): el primer usuario tras un rato sin uso espera más.
+# En REPOSO la FSM pasa cada lectura de SP1 a TendenciaSP1; se precalienta cuando:
+#   - SP1 está por debajo de UMBRAL_PRECALENTAMIENTO_SP1_CM (por encima del umbral de acceso), o
+#   - la distancia baja a más de VELOCIDAD_ACERCAMIENTO_SP1_CM_S (pendiente de las lecturas de
+#     los últimos VENTANA_TENDENCIA_SP1_S) y está a menos de DISTANCIA_MAX_TENDENCIA_SP1_CM.
+# El precalentamiento corre en su propio hilo (la FSM sigue sondeando sensores): adquiere la
+# cámara de servicio_captura, espera el primer frame, ejecuta una detección descartada con él
+# y libera la cámara, que sigue abierta TIEMPO_RETENCION_CAMARA_S. Al entrar en el estado QR o
+# facial la cámara y el detector ya están listos.
+# Métricas: camara_precalentamiento_primer_frame, facial_precalentamiento (instrumentacion.py).
+
+
+class TendenciaSP1:
+    """Lecturas recientes de SP1 y decisión de precalentar."""
+
+    def __init__(self):
+        self.lecturas = collections.deque() # (t, distancia_cm)
+
+    def reiniciar(self):
+        self.lecturas.clear()
+
+    def pendiente_cm_s(self):
+        """Pendiente (cm/s) de la recta ajustada a las lecturas de la ventana; None si hay pocas."""
+        if len(self.lecturas) < 3:
+            return None
+        t = np.fromiter((l[0] for l in self.lecturas), dtype=np.float64)
+        d = np.fromiter((l[1] for l in self.lecturas), dtype=np.float64)
+        t -= t.mean()
+        varianza = float(np.dot(t, t))
+        if varianza <= 0.0:
+            return None
+        return float(np.dot(t, d - d.mean()) / varianza)
+
+    def actualizar(self, distancia_cm, ahora):
+        """Añade una lectura de SP1 y devuelve True si conviene precalentar."""
+        if not (0 < distancia_cm < constants.DISTANCIA_MAX_TENDENCIA_SP1_CM):
+            self.lecturas.clear() # Fuera de rango (o lectura inválida): la tendencia empieza de nuevo
+            return False
+        self.lecturas.append((ahora, distancia_cm))
+        while self.lecturas and ahora - self.lecturas[0][0] > constants.VENTANA_TENDENCIA_SP1_S:
+            self.lecturas.popleft()
+        if distancia_cm < constants.UMBRAL_PRECALENTAMIENTO_SP1_CM:
+            return True
+        pendiente = self.pendiente_cm_s()
+        return pendiente is not None and pendiente < -constants.VELOCIDAD_ACERCAMIENTO_SP1_CM_S
+
+
+hilo_precalentamiento = None
+
+
+def iniciar_precalentamiento():
+    """Lanza el precalentamiento en segundo plano si no hay uno en curso ni la cámara está ya abierta."""
+    global hilo_precalentamiento
+    if hilo_precalentamiento is not None and hilo_precalentamiento.is_alive():
+        return False
+    if servicio_captura.camara_abierta():
+        return False
+    instrumentacion.incrementar_contador("precalentamientos")
+    hilo_precalentamiento = threading.Thread(target=_precalentar, daemon=True)
+    hilo_precalentamiento.start()
+    return True
+
+def _precalentar():
+    t_inicio = time.perf_counter()
+    camara = servicio_captura.adquirir_camara()
+    try:
+        if not camara.isOpened():
+            print("Precalentamiento: no se pudo abrir la cámara.")
+            return
+        ret, frame = camara.read()
+        if not ret:
+            return
+        instrumentacion.registrar_tiempo("camara_precalentamiento_primer_frame", time.perf_counter() - t_inicio)
+        escala = constants.FACTOR_REDUCCION_FRAME_FACIAL
+        reducido = cv2.resize(frame, (0, 0), fx=escala, fy=escala) if escala != 1.0 else frame
+        procesamiento_facial.precalentar_deteccion(np.ascontiguousarray(cv2.cvtColor(reducido, cv2.COLOR_BGR2RGB)))
+    finally:
+        camara.release()
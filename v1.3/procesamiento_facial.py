@@ -0,0 +1,312 @@
+import os
+import time
+import threading
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import face_recognition
+
+try:
+    import constants
+    import instrumentacion
+    import cascada_deteccion
+    import seguimiento_facial
+    import backends_faciales
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py, instrumentacion.py, cascada_deteccion.py, seguimiento_facial.py o backends_faciales.py no encontrados en procesamiento_facial.py.")
+    class constants: USAR_POOL_DETECCION_FACIAL = True; NUM_PROCESOS_DETECCION_FACIAL = 0; TAMANO_COLA_FRAMES_FACIAL = 2; USAR_PREFILTRO_HAAR_FACIAL = False
+    class instrumentacion: incrementar_contador = lambda n, c=1: None; registrar_tiempo = lambda n, s: None
+    class cascada_deteccion: regiones_candidatas_haar = lambda f: None
+    class seguimiento_facial: solapa_con_alguna = lambda c, cs: False
+    class backends_faciales:
+        class BackendDlib:
+            nombre = "dlib"
+            def detectar(self, f): return face_recognition.face_locations(f, model="hog")
+            def codificar(self, f, u): return face_recognition.face_encodings(f, u) if u else []
+        obtener_backend_facial = lambda: backends_faciales.BackendDlib()
+
+# ==============================================================================
+# ETAPA DE DETECCIÓN + ENCODING FACIAL EN UN POOL DE PROCESOS
+# ==============================================================================
+# face_locations (HOG) y face_encodings pueden tardar cientos de ms por frame. Si se
+# ejecutan en el hilo de la máquina de estados, se congelan el sondeo de sensores, los
+# timeouts de puerta y el switch de emergencia. Este módulo los ejecuta en un pool de
+# procesos (usa todos los núcleos y evita el GIL):
+#
+#   FSM --enviar_frame()--> [cola acotada, descarta el más antiguo] --despachador--> pool
+#   FSM <--obtener_ultimo_resultado()-- [resultados]  <--callback-- pool
+#
+# La FSM nunca espera: envía el frame más reciente y recoge el último resultado disponible.
+# Si el pool está desactivado en config.json (o no puede iniciarse), procesar_frame_facial
+# se ejecuta de forma síncrona en el hilo que llama, con el mismo formato de resultado.
+# El filtro de movimiento y el pre-detector Haar opcional están en cascada_deteccion.py;
+# el seguimiento que evita recalcular encodings de rostros ya conocidos, en seguimiento_facial.py.
+# El detector y el encoder los pone el backend de BACKEND_FACIAL (backends_faciales.py); las
+# etapas se siguen llamando "hog_*" aunque el detector configurado sea otro.
+
+# Si un proceso del pool muere (BrokenProcessPool) el pool se reconstruye; tras
+# MAX_RECONSTRUCCIONES_POOL se abandona y los frames se procesan en el hilo que los envía.
+MAX_RECONSTRUCCIONES_POOL = 3
+
+# --- Variables Globales del Módulo ---
+pool_procesos = None
+reconstrucciones_pool = 0
+hilo_despachador = None
+despachador_activo = False
+num_procesos_pool = 0
+
+condicion_pool = threading.Condition()    # Protege la cola, los resultados y los contadores
+cola_frames = collections.deque()         # Frames pendientes (acotada a TAMANO_COLA_FRAMES_FACIAL)
+ultimo_resultado = None                   # Resultado más reciente de la sesión actual
+frames_en_vuelo = 0
+secuencia_frames = 0                      # Número de secuencia del último frame enviado
+secuencia_ultimo_resultado = 0            # Evita que un resultado antiguo pise a uno más nuevo
+sesion_actual = 0                         # Los resultados de sesiones anteriores se descartan
+
+
+def procesar_frame_facial(frame_rgb, usar_prefiltro_haar=False, cajas_sin_recodificar=()):
+    """
+    Detecta rostros y calcula sus encodings de 128 dimensiones con el backend configurado (HOG de dlib por defecto).
+    Se ejecuta dentro de los procesos del pool, por lo que debe ser una función de módulo.
+
+    Args:
+        frame_rgb (np.ndarray): Frame RGB ya reducido.
+        usar_prefiltro_haar (bool): Pasar antes por el pre-detector Haar/LBP y limitar HOG a sus regiones.
+        cajas_sin_recodificar (list): Cajas de pistas confiables; las detecciones que solapan
+                                      con ellas no pasan por el encoder.
+
+    Returns:
+        dict: {"ubicaciones": [(top, right, bottom, left), ...],
+               "encodings": [np.ndarray float32 (128,) o None si se omitió, ...],
+               "etapa": "hog_completo" | "hog_regiones" | "omitido_haar",
+               "tiempo_proceso_s": float, "tiempo_cpu_s": float}
+    """
+    t_inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    backend = backends_faciales.obtener_backend_facial()
+    regiones = cascada_deteccion.regiones_candidatas_haar(frame_rgb) if usar_prefiltro_haar else None
+    if regiones is None:
+        etapa = "hog_completo"
+        ubicaciones = backend.detectar(frame_rgb)
+    elif not regiones:
+        etapa = "omitido_haar" # El pre-detector no vio ningún rostro: ni HOG ni encoder
+        ubicaciones = []
+    else:
+        etapa = "hog_regiones"
+        ubicaciones = cascada_deteccion.localizar_rostros_en_regiones(frame_rgb, regiones, backend.detectar)
+    codificar = [not (cajas_sin_recodificar and seguimiento_facial.solapa_con_alguna(u, cajas_sin_recodificar)) for u in ubicaciones]
+    ubicaciones_a_codificar = [u for u, c in zip(ubicaciones, codificar) if c]
+    calculados = iter(backend.codificar(frame_rgb, ubicaciones_a_codificar))
+    return {
+        "ubicaciones": ubicaciones,
+        "encodings": [np.asarray(next(calculados), dtype=np.float32) if c else None for c in codificar],
+        "etapa": etapa,
+        "tiempo_proceso_s": time.perf_counter() - t_inicio,
+        "tiempo_cpu_s": time.thread_time() - cpu_inicio,
+    }
+
+def iniciar_pool_deteccion():
+    """
+    Inicia el pool de procesos y el hilo despachador si está habilitado en config.json.
+    Es seguro llamarla varias veces. Devuelve True si el pool queda activo.
+    """
+    global pool_procesos, hilo_despachador, despachador_activo, num_procesos_pool, reconstrucciones_pool
+    if not constants.USAR_POOL_DETECCION_FACIAL:
+        return False
+    if pool_procesos is not None:
+        return True
+    num_procesos_pool = constants.NUM_PROCESOS_DETECCION_FACIAL or max(1, (os.cpu_count() or 2) - 1)
+    try:
+        pool_procesos = concurrent.futures.ProcessPoolExecutor(max_workers=num_procesos_pool)
+    except Exception as e:
+        print(f"ERROR: No se pudo iniciar el pool de detección facial ({e}). Se procesará en el hilo de la FSM.")
+        pool_procesos = None
+        return False
+    reconstrucciones_pool = 0
+    despachador_activo = True
+    hilo_despachador = threading.Thread(target=_bucle_despachador, daemon=True)
+    hilo_despachador.start()
+    print(f"Pool de detección facial iniciado con {num_procesos_pool} procesos.")
+    return True
+
+def detener_pool_deteccion():
+    """Detiene el despachador y el pool de procesos (al cerrar la aplicación)."""
+    global pool_procesos, hilo_despachador, despachador_activo
+    with condicion_pool:
+        despachador_activo = False
+        cola_frames.clear()
+        condicion_pool.notify_all()
+    if hilo_despachador is not None and hilo_despachador.is_alive():
+        hilo_despachador.join(timeout=1)
+    hilo_despachador = None
+    if pool_procesos is not None:
+        pool_procesos.shutdown(wait=False, cancel_futures=True)
+        pool_procesos = None
+        print("Pool de detección facial detenido.")
+
+def _reconstruir_pool(pool_roto):
+    """
+    Sustituye un pool roto (algún proceso murió) por uno nuevo, o lo desactiva si ya se
+    reconstruyó MAX_RECONSTRUCCIONES_POOL veces o no se puede crear. Varios hilos pueden
+    detectar el mismo pool roto: solo el primero lo reconstruye.
+    """
+    global pool_procesos, reconstrucciones_pool
+    with condicion_pool:
+        if pool_procesos is not pool_roto or pool_roto is None:
+            return
+        pool_roto.shutdown(wait=False, cancel_futures=True)
+        instrumentacion.incrementar_contador("facial_pool_roto")
+        if reconstrucciones_pool < MAX_RECONSTRUCCIONES_POOL:
+            reconstrucciones_pool += 1
+            try:
+                pool_procesos = concurrent.futures.ProcessPoolExecutor(max_workers=num_procesos_pool)
+                print(f"ADVERTENCIA: Un proceso de detección facial terminó inesperadamente. Pool reconstruido ({reconstrucciones_pool}/{MAX_RECONSTRUCCIONES_POOL}).")
+                return
+            except Exception as e:
+                print(f"ERROR: No se pudo reconstruir el pool de detección facial ({e}).")
+        pool_procesos = None
+        print("ERROR: Pool de detección facial desactivado. Se procesará en el hilo de la FSM.")
+
+def pool_activo():
+    return pool_procesos is not None
+
+def precalentar_deteccion(frame_rgb):
+    """
+    Ejecuta detecciones descartadas con 'frame_rgb' (una por proceso del pool, o aquí si
+    no hay pool) para que los procesos existan y el backend esté inicializado antes del
+    primer frame real. Se llama desde precalentamiento.py, fuera del hilo de la FSM.
+    """
+    t_inicio = time.perf_counter()
+    try:
+        if pool_procesos is not None:
+            futuros = [pool_procesos.submit(procesar_frame_facial, frame_rgb) for _ in range(num_procesos_pool)]
+            concurrent.futures.wait(futuros, timeout=30)
+        else:
+            procesar_frame_facial(frame_rgb)
+    except Exception as e:
+        print(f"Error al precalentar la detección facial: {e}")
+        return
+    instrumentacion.registrar_tiempo("facial_precalentamiento", time.perf_counter() - t_inicio)
+
+def iniciar_sesion():
+    """
+    Comienza una nueva sesión de validación facial: vacía la cola y descarta
+    cualquier resultado (pendiente o futuro) de frames enviados antes.
+    """
+    global sesion_actual, ultimo_resultado
+    with condicion_pool:
+        sesion_actual += 1
+        cola_frames.clear()
+        ultimo_resultado = None
+
+def enviar_frame(frame_rgb, cajas_sin_recodificar=(), contexto=None):
+    """
+    Entrega el frame más reciente a la etapa de detección sin bloquear.
+    Con el pool activo se encola (si la cola está llena se descarta el frame más antiguo);
+    sin pool se procesa aquí mismo y el resultado queda disponible de inmediato.
+    'cajas_sin_recodificar' viene de SeguidorRostros.cajas_sin_recodificar().
+    'contexto' no se envía al proceso: se devuelve tal cual en resultado["contexto"]
+    (la FSM lo usa para la TransformacionFrame de escalado_adaptativo.py).
+    """
+    global secuencia_frames
+    usar_prefiltro_haar = constants.USAR_PREFILTRO_HAAR_FACIAL
+    with condicion_pool:
+        secuencia_frames += 1
+        secuencia = secuencia_frames
+        sesion = sesion_actual
+        if pool_procesos is not None:
+            if len(cola_frames) >= max(1, constants.TAMANO_COLA_FRAMES_FACIAL):
+                cola_frames.popleft()
+                instrumentacion.incrementar_contador("facial_descartados_cola")
+            cola_frames.append((sesion, secuencia, time.time(), frame_rgb, usar_prefiltro_haar, list(cajas_sin_recodificar), contexto))
+            condicion_pool.notify()
+            return
+    resultado = procesar_frame_facial(frame_rgb, usar_prefiltro_haar, cajas_sin_recodificar)
+    _registrar_metricas(resultado)
+    _publicar_resultado(sesion, secuencia, time.time(), resultado, contexto)
+
+def obtener_ultimo_resultado():
+    """
+    Devuelve (y consume) el resultado más reciente de la sesión actual, o None si
+    todavía no hay uno nuevo desde la última llamada.
+    """
+    global ultimo_resultado
+    with condicion_pool:
+        resultado = ultimo_resultado
+        ultimo_resultado = None
+    return resultado
+
+def _bucle_despachador():
+    """Mueve frames de la cola al pool, sin superar un frame en vuelo por proceso."""
+    global frames_en_vuelo
+    while True:
+        with condicion_pool:
+            while despachador_activo and (not cola_frames or frames_en_vuelo >= num_procesos_pool):
+                condicion_pool.wait(timeout=0.5)
+            if not despachador_activo:
+                return
+            sesion, secuencia, t_envio, frame_rgb, usar_prefiltro_haar, cajas_sin_recodificar, contexto = cola_frames.popleft()
+            frames_en_vuelo += 1
+        futuro = None
+        for _ in range(2): # Un segundo intento si el pool estaba roto y se reconstruyó
+            pool = pool_procesos
+            if pool is None:
+                break
+            try:
+                futuro = pool.submit(procesar_frame_facial, frame_rgb, usar_prefiltro_haar, cajas_sin_recodificar)
+                break
+            except BrokenProcessPool:
+                _reconstruir_pool(pool)
+            except Exception as e:
+                print(f"Error al enviar frame al pool de detección facial: {e}")
+                break
+        if futuro is None:
+            with condicion_pool:
+                frames_en_vuelo -= 1
+            if pool_procesos is None:
+                # Pool desactivado: procesar aquí los frames que ya estaban en la cola
+                resultado = procesar_frame_facial(frame_rgb, usar_prefiltro_haar, cajas_sin_recodificar)
+                _registrar_metricas(resultado)
+                _publicar_resultado(sesion, secuencia, t_envio, resultado, contexto)
+            continue
+        futuro.add_done_callback(lambda f, s=sesion, q=secuencia, t=t_envio, c=contexto, p=pool: _al_terminar_frame(f, s, q, t, c, p))
+
+def _al_terminar_frame(futuro, sesion, secuencia, t_envio, contexto, pool=None):
+    global frames_en_vuelo
+    with condicion_pool:
+        frames_en_vuelo -= 1
+        condicion_pool.notify()
+    if futuro.cancelled():
+        return
+    try:
+        resultado = futuro.result()
+    except BrokenProcessPool as e:
+        print(f"Error en el proceso de detección facial: {e}")
+        _reconstruir_pool(pool) # El frame se pierde; los siguientes van al pool nuevo
+        return
+    except Exception as e:
+        print(f"Error en el proceso de detección facial: {e}")
+        return
+    _registrar_metricas(resultado)
+    _publicar_resultado(sesion, secuencia, t_envio, resultado, contexto)
+
+def _registrar_metricas(resultado):
+    """Contadores por etapa de la cascada (cuántos frames llegaron a HOG y cuántos se omitieron)."""
+    instrumentacion.incrementar_contador(f"facial_{resultado['etapa']}")
+    if resultado["ubicaciones"]:
+        instrumentacion.incrementar_contador("facial_frames_con_rostro")
+        instrumentacion.incrementar_contador("facial_encodings_calculados", sum(e is not None for e in resultado["encodings"]))
+    instrumentacion.registrar_tiempo(f"facial_{resultado['etapa']}", resultado["tiempo_proceso_s"])
+    instrumentacion.registrar_tiempo(f"facial_{resultado['etapa']}_cpu", resultado["tiempo_cpu_s"])
+
+def _publicar_resultado(sesion, secuencia, t_envio, resultado, contexto=None):
+    global ultimo_resultado, secuencia_ultimo_resultado
+    with condicion_pool:
+        if sesion != sesion_actual or secuencia <= secuencia_ultimo_resultado:
+            return # Resultado de una sesión anterior o más antiguo que el ya publicado
+        secuencia_ultimo_resultado = secuencia
+        resultado["secuencia"] = secuencia
+        resultado["latencia_s"] = time.time() - t_envio
+        resultado["contexto"] = contexto
+        ultimo_resultado = resultado
+    instrumentacion.registrar_tiempo("facial_latencia_resultado", resultado["latencia_s"])
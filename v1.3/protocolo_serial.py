@@ -0,0 +1,159 @@
+import struct
+
+# ==============================================================================
+# PROTOCOLO SERIE CON EL ARDUINO: LÍNEAS DE TEXTO O TRAMAS BINARIAS
+# ==============================================================================
+# Texto (protocolo original, siempre disponible):
+#   DATOS;SP1:12.3;SP2:999.0;S1:1;S2:0;E:1;RFID:NADA\n
+# Binario (se negocia tras ARDUINO_LISTO con COMANDO:PROTOCOLO_BINARIO; el Arduino responde
+# PROTOCOLO_BINARIO_OK y desde entonces envía los datos así):
+#
+#   0xA5 | tipo | longitud | carga (longitud bytes) | CRC-8
+#
+#   tipo 0x01 (DATOS), carga de 16 bytes little-endian:
+#     sp1, sp2     uint16  distancia en décimas de cm (9990 = sin eco, 999.0 cm)
+#     interruptores uint8  bit0 = S1, bit1 = S2, bit2 = E (1 = HIGH, como en el texto)
+#     largo_uid    uint8   0 = sin tarjeta ("NADA")
+#     uid          10 bytes UID de la tarjeta (se convierte al mismo hexadecimal en mayúsculas del texto)
+#   CRC-8 (polinomio 0x07, valor inicial 0) de tipo, longitud y carga.
+#
+# Los mensajes de texto que el Arduino siga enviando en modo binario (INFO: ...) no
+# contienen el byte 0xA5 (son ASCII) y el parser binario los salta.
+# Los dos parsers tienen la misma interfaz: alimentar(bytes o memoryview) devuelve la lista de
+# lecturas completas (sp1, sp2, s1, s2, e, uid) y guarda los bytes de una trama a medias (no
+# conservan referencias al bloque recibido, que el listener reutiliza).
+
+BYTE_SINCRONISMO = 0xA5
+TIPO_DATOS = 0x01
+ESTRUCTURA_DATOS = struct.Struct("<HHBB10s")
+LARGO_CABECERA = 3 # sincronismo, tipo, longitud
+LARGO_TRAMA_DATOS = LARGO_CABECERA + ESTRUCTURA_DATOS.size + 1
+LECTURA_VACIA_UID = "NADA"
+CAPACIDAD_BUFFER_BINARIO = 4096
+
+COMANDO_PROTOCOLO_BINARIO = "PROTOCOLO_BINARIO"
+RESPUESTA_PROTOCOLO_BINARIO = "PROTOCOLO_BINARIO_OK"
+
+
+def _tabla_crc8(polinomio=0x07):
+    tabla = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polinomio) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        tabla.append(crc)
+    return bytes(tabla)
+
+TABLA_CRC8 = _tabla_crc8()
+# Dos bytes por consulta: índice = palabra little-endian (b0 | b1 << 8) XOR crc -> crc tras b0 y b1.
+TABLA_CRC8_PALABRAS = bytes(TABLA_CRC8[TABLA_CRC8[x] ^ b1] for b1 in range(256) for x in range(256))
+# Tipo, longitud y carga de una trama de DATOS (18 bytes) leídos como palabras en una sola llamada
+ESTRUCTURA_CRC_DATOS = struct.Struct(f"<{(2 + ESTRUCTURA_DATOS.size) // 2}H")
+
+def crc8(datos, inicio=0, fin=None):
+    """CRC-8 (polinomio 0x07) de datos[inicio:fin] sin copiar el fragmento."""
+    crc = 0
+    tabla = TABLA_CRC8
+    for i in range(inicio, len(datos) if fin is None else fin):
+        crc = tabla[crc ^ datos[i]]
+    return crc
+
+def _crc8_trama_datos(buffer, inicio):
+    """crc8() de tipo, longitud y carga de la trama de DATOS que empieza en 'inicio' (ruta rápida del parser)."""
+    crc = 0
+    tabla = TABLA_CRC8_PALABRAS
+    for palabra in ESTRUCTURA_CRC_DATOS.unpack_from(buffer, inicio + 1):
+        crc = tabla[palabra ^ crc]
+    return crc
+
+def codificar_trama_datos(sp1, sp2, s1, s2, e, uid=LECTURA_VACIA_UID):
+    """Trama binaria de DATOS tal como la envía el Arduino (para pruebas y benchmarks)."""
+    uid_bytes = b"" if uid == LECTURA_VACIA_UID else bytes.fromhex(uid)
+    carga = ESTRUCTURA_DATOS.pack(min(int(round(sp1 * 10)), 0xFFFF), min(int(round(sp2 * 10)), 0xFFFF),
+                                  (s1 & 1) | (s2 & 1) << 1 | (e & 1) << 2, len(uid_bytes), uid_bytes)
+    cuerpo = bytes((TIPO_DATOS, len(carga))) + carga
+    return bytes((BYTE_SINCRONISMO,)) + cuerpo + bytes((crc8(cuerpo),))
+
+def codificar_linea_datos(sp1, sp2, s1, s2, e, uid=LECTURA_VACIA_UID):
+    """Línea de texto DATOS equivalente a codificar_trama_datos()."""
+    return f"DATOS;SP1:{sp1:.1f};SP2:{sp2:.1f};S1:{s1};S2:{s2};E:{e};RFID:{uid}\n".encode("ascii")
+
+
+class ParserTexto:
+    """Protocolo original: líneas DATOS;SP1:..;SP2:..;S1:..;S2:..;E:..;RFID:.."""
+
+    def __init__(self):
+        self.buffer_parcial = "" # Línea incompleta del último bloque
+        self.errores = 0
+
+    def alimentar(self, datos):
+        lecturas = []
+        lineas = (self.buffer_parcial + str(datos, "utf-8", errors="replace")).split("\n")
+        self.buffer_parcial = lineas.pop() # Vacío si el bloque terminaba en '\n'
+        for linea in lineas:
+            linea = linea.strip() # Quitar \r si existe
+            if not linea.startswith("DATOS;"):
+                continue
+            partes = linea.split(";")
+            if len(partes) != 7:
+                continue
+            try:
+                lecturas.append((float(partes[1].split(":")[1]), float(partes[2].split(":")[1]),
+                                 int(partes[3].split(":")[1]), int(partes[4].split(":")[1]),
+                                 int(partes[5].split(":")[1]), partes[6].split(":")[1]))
+            except (ValueError, IndexError) as e:
+                self.errores += 1
+                print(f"Error de parseo en datos de Arduino: {e} -> Línea: {linea}")
+        return lecturas
+
+
+class ParserBinario:
+    """Tramas binarias de DATOS sobre un bytearray reutilizado (sin decodificar texto)."""
+
+    def __init__(self, capacidad=CAPACIDAD_BUFFER_BINARIO):
+        self.buffer = bytearray(capacidad)
+        self.vista = memoryview(self.buffer)
+        self.fin = 0       # Bytes válidos en buffer
+        self.errores = 0   # Tramas descartadas por CRC o longitud
+
+    def alimentar(self, datos):
+        n = len(datos)
+        if self.fin + n > len(self.buffer):
+            self.fin = 0 # Un bloque mayor que el buffer solo puede ser basura acumulada
+            if n > len(self.buffer):
+                datos = datos[-len(self.buffer):]
+                n = len(datos)
+        self.vista[self.fin:self.fin + n] = datos
+        self.fin += n
+        return self._extraer_tramas()
+
+    def _extraer_tramas(self):
+        lecturas = []
+        buffer, fin, i = self.buffer, self.fin, 0
+        while True:
+            i = buffer.find(BYTE_SINCRONISMO, i, fin)
+            if i < 0:
+                i = fin
+                break
+            if fin - i < LARGO_CABECERA:
+                break
+            tipo, longitud = buffer[i + 1], buffer[i + 2]
+            if tipo != TIPO_DATOS or longitud != ESTRUCTURA_DATOS.size:
+                self.errores += 1
+                i += 1 # No era un inicio de trama: buscar el siguiente sincronismo
+                continue
+            if fin - i < LARGO_TRAMA_DATOS:
+                break
+            if _crc8_trama_datos(buffer, i) != buffer[i + LARGO_TRAMA_DATOS - 1]:
+                self.errores += 1
+                i += 1
+                continue
+            sp1, sp2, interruptores, largo_uid, uid = ESTRUCTURA_DATOS.unpack_from(buffer, i + LARGO_CABECERA)
+            lecturas.append((sp1 / 10.0, sp2 / 10.0, interruptores & 1, (interruptores >> 1) & 1, (interruptores >> 2) & 1,
+                             uid[:largo_uid].hex().upper() if largo_uid else LECTURA_VACIA_UID))
+            i += LARGO_TRAMA_DATOS
+        resto = fin - i
+        if resto and i:
+            self.vista[:resto] = self.vista[i:fin] # Trama a medias al principio del buffer
+        self.fin = resto
+        return lecturas
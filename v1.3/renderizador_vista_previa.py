@@ -0,0 +1,135 @@
+import time
+import threading
+import cv2
+import numpy as np
+
+try:
+    import constants
+    import instrumentacion
+    import canal_vista_previa
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py, instrumentacion.py o canal_vista_previa.py no encontrados en renderizador_vista_previa.py.")
+    class constants: FPS_MAX_VISTA_PREVIA = 15.0
+    class instrumentacion: registrar_tiempo = lambda n, s: None
+    class canal_vista_previa: tomar_ultimo = lambda: None
+
+# ==============================================================================
+# RENDERIZADOR DE LA VISTA PREVIA (FUERA DEL HILO DE TKINTER)
+# ==============================================================================
+# mostrar_frame_camara hacía en el hilo de Tk, por cada frame: consulta de geometría del
+# widget, cálculo de escala, cv2.resize, conversión a PIL y un ImageTk.PhotoImage nuevo (y
+# sin pasar de BGR a RGB). Ahora un hilo propio toma el último frame de canal_vista_previa,
+# lo escala al tamaño del widget (que la GUI comunica con ajustar_tamano() en <Configure>)
+# y lo convierte a RGB directamente en un buffer preasignado. El hilo de Tk solo recoge el
+# buffer listo y hace PhotoImage.paste() sobre la misma imagen.
+# Hay tres buffers: el listo para Tk, el que Tk está pegando y el que escribe el hilo; así
+# nunca se escribe sobre un buffer que Tk esté leyendo.
+
+NUM_BUFFERS = 3
+TAMANO_POR_DEFECTO = (640, 480) # (ancho, alto) hasta que el widget tenga tamaño real
+
+
+class RenderizadorVistaPrevia:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tamano_widget = TAMANO_POR_DEFECTO
+        self.clave_escala = None   # (forma del frame, tamaño del widget) de la escala cacheada
+        self.tamano_salida = None  # (ancho, alto) del frame escalado
+        self.buffers = []
+        self.indice_listo = None   # Buffer escalado pendiente de mostrar
+        self.indice_en_uso = None  # Buffer que Tk está pegando
+        self.texto_listo = None    # Texto de cámara apagada pendiente de mostrar
+        self.activo = False
+        self.hilo = None
+
+    def ajustar_tamano(self, ancho, alto):
+        """Tamaño disponible en el widget (se llama desde el evento <Configure> de Tk)."""
+        if ancho > 1 and alto > 1:
+            with self.lock:
+                self.tamano_widget = (ancho, alto)
+
+    def iniciar(self):
+        if self.hilo is not None and self.hilo.is_alive():
+            return
+        self.activo = True
+        self.hilo = threading.Thread(target=self._bucle, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.activo = False
+        if self.hilo is not None:
+            self.hilo.join(timeout=1)
+            self.hilo = None
+
+    def tomar_listo(self):
+        """
+        Para el hilo de Tk. Devuelve ("frame", buffer_rgb), ("texto", texto) o None.
+        El buffer queda reservado hasta liberar(); no debe modificarse.
+        """
+        with self.lock:
+            if self.texto_listo is not None:
+                texto, self.texto_listo = self.texto_listo, None
+                return "texto", texto
+            if self.indice_listo is None:
+                return None
+            self.indice_en_uso, self.indice_listo = self.indice_listo, None
+            return "frame", self.buffers[self.indice_en_uso]
+
+    def liberar(self):
+        """Tk terminó de pegar el buffer devuelto por tomar_listo()."""
+        with self.lock:
+            self.indice_en_uso = None
+
+    def _calcular_tamano_salida(self, forma_frame):
+        """Tamaño que cabe en el widget con la misma relación de aspecto (se recalcula solo si algo cambia)."""
+        with self.lock:
+            tamano_widget = self.tamano_widget
+        clave = (forma_frame[:2], tamano_widget)
+        if clave != self.clave_escala:
+            alto, ancho = forma_frame[:2]
+            escala = min(tamano_widget[0] / ancho, tamano_widget[1] / alto)
+            nuevo = (max(1, int(ancho * escala)), max(1, int(alto * escala)))
+            with self.lock:
+                if nuevo != self.tamano_salida:
+                    # Buffers nuevos: los anteriores siguen vivos mientras Tk los referencie
+                    self.buffers = [np.empty((nuevo[1], nuevo[0], 3), dtype=np.uint8) for _ in range(NUM_BUFFERS)]
+                    self.indice_listo = None
+                    self.indice_en_uso = None
+                self.tamano_salida = nuevo
+            self.clave_escala = clave
+        return self.tamano_salida
+
+    def _escalar(self, frame_bgr):
+        t_inicio = time.perf_counter()
+        ancho, alto = self._calcular_tamano_salida(frame_bgr.shape)
+        with self.lock:
+            indice = next(i for i in range(NUM_BUFFERS) if i != self.indice_listo and i != self.indice_en_uso)
+            destino = self.buffers[indice]
+        if (ancho, alto) != (frame_bgr.shape[1], frame_bgr.shape[0]):
+            cv2.resize(frame_bgr, (ancho, alto), dst=destino, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(destino, cv2.COLOR_BGR2RGB, dst=destino)
+        else:
+            cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=destino)
+        with self.lock:
+            if destino is self.buffers[indice]: # Si el tamaño cambió mientras tanto, se descarta
+                self.indice_listo = indice
+                self.texto_listo = None
+        instrumentacion.registrar_tiempo("vista_previa_escalado", time.perf_counter() - t_inicio)
+
+    def _bucle(self):
+        while self.activo:
+            t_inicio = time.perf_counter()
+            ultimo = canal_vista_previa.tomar_ultimo()
+            if ultimo is not None:
+                frame, texto = ultimo
+                if frame is not None:
+                    try:
+                        self._escalar(frame)
+                    except Exception as e:
+                        print(f"Error al escalar el frame de la vista previa: {e}")
+                else:
+                    with self.lock:
+                        self.texto_listo = texto
+                        self.indice_listo = None
+            periodo_s = 1.0 / max(1.0, constants.FPS_MAX_VISTA_PREVIA)
+            time.sleep(max(0.001, periodo_s - (time.perf_counter() - t_inicio)))
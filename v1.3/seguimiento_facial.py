@@ -0,0 +1,174 @@
+import time
+import itertools
+import collections
+
+try:
+    import constants
+    import instrumentacion
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py o instrumentacion.py no encontrados en seguimiento_facial.py.")
+    class constants: TOLERANCIA_FACIAL = 0.6; IOU_MINIMO_SEGUIMIENTO = 0.4; MARGEN_CONFIANZA_SEGUIMIENTO = 0.08; MAX_SEGUNDOS_SIN_RECODIFICAR = 2.0; DERIVA_MAXIMA_SEGUIMIENTO = 0.35; MAX_SEGUNDOS_PISTA_SIN_VER = 1.0; MODO_FUSION_FACIAL = "k_de_n"; VENTANA_FUSION_FACIAL = 5
+    class instrumentacion: incrementar_contador = lambda n, c=1: None
+
+# ==============================================================================
+# SEGUIMIENTO DE ROSTROS ENTRE FRAMES (IoU)
+# ==============================================================================
+# Durante la ventana de validación la misma persona aparece en decenas de frames.
+# Este seguidor asocia las cajas de face_locations de un frame con las del anterior
+# por solapamiento (IoU) y conserva el encoding de cada pista. El encoder de 128-d
+# solo se vuelve a ejecutar cuando la pista:
+#   - es nueva,
+#   - es de baja confianza (su distancia está a menos de MARGEN_CONFIANZA_SEGUIMIENTO
+#     de TOLERANCIA_FACIAL, o aún no tiene distancia),
+#   - lleva más de MAX_SEGUNDOS_SIN_RECODIFICAR con el mismo encoding, o
+#   - se ha desplazado/escalado más de DERIVA_MAXIMA_SEGUIMIENTO desde que se codificó.
+#
+# La FSM envía cajas_sin_recodificar() junto con cada frame; el proceso de detección
+# omite el encoder para las detecciones que solapan con ellas y devuelve None en su lugar.
+# Cada pista guarda además la ventana de observaciones que usa fusion_temporal.py.
+
+
+def iou_cajas(caja_a, caja_b):
+    """IoU de dos cajas (top, right, bottom, left)."""
+    top, bottom = max(caja_a[0], caja_b[0]), min(caja_a[2], caja_b[2])
+    left, right = max(caja_a[3], caja_b[3]), min(caja_a[1], caja_b[1])
+    interseccion = max(0, bottom - top) * max(0, right - left)
+    if interseccion == 0:
+        return 0.0
+    area_a = (caja_a[2] - caja_a[0]) * (caja_a[1] - caja_a[3])
+    area_b = (caja_b[2] - caja_b[0]) * (caja_b[1] - caja_b[3])
+    return interseccion / float(area_a + area_b - interseccion)
+
+def solapa_con_alguna(caja, cajas, iou_minimo=None):
+    iou_minimo = constants.IOU_MINIMO_SEGUIMIENTO if iou_minimo is None else iou_minimo
+    return any(iou_cajas(caja, otra) >= iou_minimo for otra in cajas)
+
+def _deriva(caja_actual, caja_referencia):
+    """Desplazamiento del centro (relativo al tamaño) o cambio de escala entre dos cajas."""
+    alto_ref = max(1, caja_referencia[2] - caja_referencia[0])
+    ancho_ref = max(1, caja_referencia[1] - caja_referencia[3])
+    dy = abs((caja_actual[0] + caja_actual[2]) - (caja_referencia[0] + caja_referencia[2])) / 2.0 / alto_ref
+    dx = abs((caja_actual[1] + caja_actual[3]) - (caja_referencia[1] + caja_referencia[3])) / 2.0 / ancho_ref
+    escala = (caja_actual[2] - caja_actual[0]) / float(alto_ref)
+    return max(dx, dy, abs(escala - 1.0))
+
+
+class PistaRostro:
+    """Un rostro seguido entre frames, con el último encoding calculado para él."""
+
+    def __init__(self, id_pista, caja, encoding, ahora):
+        self.id_pista = id_pista
+        self.caja = caja
+        self.t_ultima_vista = ahora
+        self.distancia = None # Distancia de la última comparación (1:1 o 1:N) con este encoding
+        self.observaciones = collections.deque(maxlen=max(1, constants.VENTANA_FUSION_FACIAL)) # (id, distancia, usuario)
+        self.usuario_aceptado = None # Lo fija fusion_temporal.usuario_aceptado()
+        self._asignar_encoding(encoding, ahora)
+
+    def _asignar_encoding(self, encoding, ahora):
+        self.encoding = encoding
+        self.encoding_nuevo = True # La próxima distancia registrada cuenta como observación
+        self.caja_al_codificar = self.caja
+        self.t_codificacion = ahora
+        self.distancia = None
+
+
+class SeguidorRostros:
+    def __init__(self):
+        self.pistas = []
+        self._ids = itertools.count(1)
+
+    def reiniciar(self):
+        self.pistas = []
+
+    def actualizar(self, ubicaciones, encodings, ahora=None):
+        """
+        Asocia las detecciones de un frame con las pistas existentes.
+
+        Args:
+            ubicaciones (list): Cajas (top, right, bottom, left) del frame.
+            encodings (list): Encoding de cada caja, o None si el proceso de detección
+                              lo omitió porque la caja pertenece a una pista confiable.
+
+        Returns:
+            list: PistaRostro (o None si una detección sin encoding ya no tiene pista) por cada caja.
+        """
+        ahora = time.time() if ahora is None else ahora
+        self.pistas = [p for p in self.pistas if ahora - p.t_ultima_vista <= constants.MAX_SEGUNDOS_PISTA_SIN_VER]
+
+        # Asociación voraz por IoU descendente
+        pares = sorted(((iou_cajas(caja, pista.caja), i, j)
+                        for i, caja in enumerate(ubicaciones) for j, pista in enumerate(self.pistas)), reverse=True)
+        pista_de_deteccion, pistas_usadas = {}, set()
+        for iou, i, j in pares:
+            if iou < constants.IOU_MINIMO_SEGUIMIENTO:
+                break
+            if i in pista_de_deteccion or j in pistas_usadas:
+                continue
+            pista_de_deteccion[i] = self.pistas[j]
+            pistas_usadas.add(j)
+
+        resultado = []
+        for i, caja in enumerate(ubicaciones):
+            encoding = encodings[i]
+            pista = pista_de_deteccion.get(i)
+            if pista is not None:
+                pista.caja = caja
+                pista.t_ultima_vista = ahora
+                if encoding is not None:
+                    pista._asignar_encoding(encoding, ahora)
+                else:
+                    instrumentacion.incrementar_contador("facial_encodings_reutilizados")
+            elif encoding is not None:
+                pista = PistaRostro(next(self._ids), caja, encoding, ahora)
+                self.pistas.append(pista)
+            else:
+                instrumentacion.incrementar_contador("facial_rostros_sin_pista")
+            resultado.append(pista)
+        return resultado
+
+    def registrar_distancia(self, pista, distancia, id_identidad=None, usuario=None):
+        """
+        Guarda la distancia obtenida con el encoding de la pista (define su confianza).
+        Si el encoding es nuevo, la añade a la ventana de observaciones de la pista.
+        """
+        if pista is None:
+            return
+        pista.distancia = float(distancia)
+        if pista.encoding_nuevo:
+            pista.observaciones.append((id_identidad, pista.distancia, usuario))
+            pista.encoding_nuevo = False
+
+    def apartar_encodings_nuevos(self, pistas):
+        """
+        Devuelve [(pista, encoding)] de las pistas con un encoding aún no comparado y los da por
+        usados. Sirve cuando todavía no se sabe contra qué usuario comparar (QR + Facial simultáneo):
+        se comparan después con registrar_distancia_diferida().
+        """
+        apartados = []
+        for pista in pistas:
+            if pista is not None and pista.encoding_nuevo:
+                apartados.append((pista, pista.encoding))
+                pista.encoding_nuevo = False
+        return apartados
+
+    def registrar_distancia_diferida(self, pista, encoding, distancia, id_identidad=None, usuario=None):
+        """Añade a la ventana de la pista la distancia de un encoding apartado con apartar_encodings_nuevos()."""
+        pista.observaciones.append((id_identidad, float(distancia), usuario))
+        if encoding is pista.encoding:
+            pista.distancia = float(distancia)
+
+    def es_confiable(self, pista, ahora=None):
+        ahora = time.time() if ahora is None else ahora
+        if (constants.MODO_FUSION_FACIAL != "frame_unico" and pista.usuario_aceptado is None and
+                pista.distancia is not None and pista.distancia <= constants.TOLERANCIA_FACIAL):
+            return False # La fusión necesita más encodings nuevos para decidir
+        return (pista.distancia is not None and
+                abs(pista.distancia - constants.TOLERANCIA_FACIAL) >= constants.MARGEN_CONFIANZA_SEGUIMIENTO and
+                ahora - pista.t_codificacion <= constants.MAX_SEGUNDOS_SIN_RECODIFICAR and
+                _deriva(pista.caja, pista.caja_al_codificar) <= constants.DERIVA_MAXIMA_SEGUIMIENTO)
+
+    def cajas_sin_recodificar(self, ahora=None):
+        """Cajas de las pistas cuyo encoding se puede reutilizar en el próximo frame."""
+        ahora = time.time() if ahora is None else ahora
+        return [p.caja for p in self.pistas if self.es_confiable(p, ahora)]
@@ -0,0 +1,196 @@
+import time
+import threading
+
+try:
+    import constants
+    import instrumentacion
+    import fuentes_frames
+except ImportError:
+    print("ADVERTENCIA CRÍTICA: constants.py, instrumentacion.py o fuentes_frames.py no encontrados en servicio_captura.py.")
+    class constants: TIEMPO_RETENCION_CAMARA_S = 30.0
+    class instrumentacion: incrementar_contador = lambda n, c=1: None; registrar_tiempo = lambda n, s: None
+    class fuentes_frames: abrir_fuente_camara = None
+
+# ==============================================================================
+# SERVICIO DE CAPTURA: CÁMARA COMPARTIDA CON EL ÚLTIMO FRAME EN MEMORIA
+# ==============================================================================
+# Abrir la cámara (cv2.VideoCapture + 0.5 s de estabilización) en cada estado QR/facial/
+# emergencia y cerrarla en cada transición añadía casi un segundo a cada validación.
+# Este módulo mantiene la fuente abierta (fuentes_frames.py) con un hilo capturador que
+# deja siempre el frame más reciente en un único hueco (sin cola: un frame no leído se
+# sustituye por el siguiente).
+#
+#   camara = adquirir_camara()   # +1 referencia; abre la fuente solo si estaba cerrada
+#   ret, frame = camara.read()   # espera un frame más nuevo que el último que leyó 'camara'
+#   camara.release()             # -1 referencia
+#
+# El objeto devuelto tiene la interfaz de cv2.VideoCapture (isOpened, read, get, release),
+# así que la FSM lo usa igual que antes. Con 0 referencias la cámara sigue capturando
+# TIEMPO_RETENCION_CAMARA_S segundos más: pasar de QR a facial, repetir una validación o
+# volver a entrar en un estado de cámara no la reabre. Después se cierra.
+# Cada frame es un array nuevo que comparten todos los consumidores que lo leen.
+# Las reproducciones a velocidad "maxima" no pierden frames: el capturador espera a que
+# se lea el frame anterior antes de leer el siguiente.
+
+TIMEOUT_NUEVO_FRAME_S = 0.5 # Espera máxima de read() por un frame nuevo
+
+# --- Variables Globales del Módulo ---
+condicion_captura = threading.Condition() # Protege todo lo de abajo
+fuente_captura = None                     # Fuente abierta (None = cámara cerrada)
+abriendo_camara = False                   # Un hilo está abriendo la fuente (fuera del lock)
+hilo_captura = None
+generacion_captura = 0                    # Cambia al detener el servicio: invalida las referencias viejas
+referencias_camara = 0
+t_ultima_liberacion_s = 0.0
+frame_actual = None                       # Último frame capturado (BGR)
+secuencia_frame_actual = 0
+timestamp_frame_actual = None
+secuencia_consumida = 0                   # Último frame leído por algún consumidor
+
+
+class ConsumidorCamara:
+    """Referencia a la cámara compartida con la interfaz de cv2.VideoCapture."""
+
+    def __init__(self, generacion, secuencia_vista, abierto=True):
+        self.generacion = generacion
+        self.secuencia_vista = secuencia_vista # Último frame que leyó este consumidor
+        self.abierto = abierto
+        self.timestamp_s = None
+
+    def isOpened(self):
+        with condicion_captura:
+            return self.abierto and self.generacion == generacion_captura and fuente_captura is not None
+
+    def read(self):
+        global secuencia_consumida
+        with condicion_captura:
+            limite = time.perf_counter() + TIMEOUT_NUEVO_FRAME_S
+            while secuencia_frame_actual <= self.secuencia_vista:
+                restante = limite - time.perf_counter()
+                if restante <= 0 or not self.abierto or self.generacion != generacion_captura or fuente_captura is None:
+                    return False, None
+                condicion_captura.wait(restante)
+            self.secuencia_vista = secuencia_frame_actual
+            self.timestamp_s = timestamp_frame_actual
+            if secuencia_frame_actual > secuencia_consumida:
+                secuencia_consumida = secuencia_frame_actual
+                condicion_captura.notify_all()
+            return True, frame_actual
+
+    def get(self, propiedad):
+        with condicion_captura:
+            fuente = fuente_captura
+        return fuente.get(propiedad) if fuente is not None else 0.0
+
+    def release(self):
+        global referencias_camara, t_ultima_liberacion_s
+        with condicion_captura:
+            if not self.abierto:
+                return
+            self.abierto = False
+            if self.generacion != generacion_captura:
+                return # El servicio se detuvo y reinició las referencias
+            referencias_camara -= 1
+            if referencias_camara == 0:
+                t_ultima_liberacion_s = time.time()
+            condicion_captura.notify_all()
+
+
+def adquirir_camara():
+    """
+    Devuelve una referencia a la cámara compartida. La abre (con su tiempo de
+    estabilización) solo si estaba cerrada; si no puede abrirse, la referencia
+    devuelta tiene isOpened() == False y no cuenta.
+    La apertura (que puede tardar segundos) se hace sin el lock para no bloquear read() ni
+    camara_abierta() en otros hilos; si otro hilo ya la está abriendo, se espera a esa apertura.
+    """
+    global fuente_captura, hilo_captura, referencias_camara, abriendo_camara
+    with condicion_captura:
+        while abriendo_camara:
+            condicion_captura.wait()
+        if fuente_captura is not None:
+            referencias_camara += 1
+            instrumentacion.incrementar_contador("camara_reutilizaciones")
+            return ConsumidorCamara(generacion_captura, secuencia_frame_actual - 1)
+        abriendo_camara = True
+        generacion = generacion_captura
+    t_inicio = time.perf_counter()
+    fuente, abierta = None, False
+    try:
+        fuente = fuentes_frames.abrir_fuente_camara()
+        abierta = fuente.isOpened()
+    finally:
+        with condicion_captura:
+            abriendo_camara = False
+            condicion_captura.notify_all()
+            if fuente is not None and abierta and generacion == generacion_captura:
+                instalada = True
+                fuente_captura = fuente
+                referencias_camara += 1
+                hilo_captura = threading.Thread(target=_bucle_captura, args=(fuente, t_inicio), daemon=True)
+                hilo = hilo_captura
+            else:
+                instalada = False
+            secuencia = secuencia_frame_actual
+    if not instalada:
+        if fuente is not None:
+            fuente.release() # No se pudo abrir, o el servicio se detuvo mientras se abría
+        return ConsumidorCamara(generacion, secuencia, abierto=False)
+    instrumentacion.incrementar_contador("camara_aperturas")
+    instrumentacion.registrar_tiempo("camara_apertura", time.perf_counter() - t_inicio)
+    hilo.start()
+    return ConsumidorCamara(generacion, secuencia)
+
+def camara_abierta():
+    with condicion_captura:
+        return fuente_captura is not None
+
+def detener_servicio_captura():
+    """Cierra la cámara aunque tenga referencias (al cerrar la aplicación o entre benchmarks)."""
+    global fuente_captura, hilo_captura, referencias_camara, generacion_captura, frame_actual
+    with condicion_captura:
+        fuente_captura = None
+        referencias_camara = 0
+        generacion_captura += 1
+        frame_actual = None
+        condicion_captura.notify_all()
+        hilo = hilo_captura
+        hilo_captura = None
+    if hilo is not None and hilo.is_alive():
+        hilo.join(timeout=2)
+
+def _bucle_captura(fuente, t_apertura):
+    """Lee frames de 'fuente' y deja el último en frame_actual hasta que el servicio la cierre."""
+    global fuente_captura, frame_actual, secuencia_frame_actual, timestamp_frame_actual
+    sin_perdidas = getattr(fuente, "velocidad", "real") == "maxima"
+    primer_frame = True
+    while True:
+        with condicion_captura:
+            while True:
+                if fuente_captura is not fuente:
+                    fuente.release()
+                    return
+                if referencias_camara == 0 and time.time() - t_ultima_liberacion_s > constants.TIEMPO_RETENCION_CAMARA_S:
+                    print(f"Cámara cerrada tras {constants.TIEMPO_RETENCION_CAMARA_S:.0f} s sin uso.")
+                    fuente_captura = None
+                    fuente.release()
+                    return
+                if not (sin_perdidas and secuencia_consumida < secuencia_frame_actual):
+                    break
+                condicion_captura.wait(0.1)
+        ret, frame = fuente.read()
+        if not ret:
+            instrumentacion.incrementar_contador("camara_lecturas_fallidas")
+            time.sleep(0.1 if getattr(fuente, "agotada", False) else 0.02)
+            continue
+        with condicion_captura:
+            if fuente_captura is not fuente:
+                continue
+            frame_actual = frame
+            secuencia_frame_actual += 1
+            timestamp_frame_actual = fuente.timestamp_s
+            condicion_captura.notify_all()
+        instrumentacion.incrementar_contador("camara_frames_capturados")
+        if primer_frame:
+            instrumentacion.registrar_tiempo("camara_primer_frame", time.perf_counter() - t_apertura) # Apertura + estabilización + primera lectura
+            primer_frame = False
@@ -1,13 +1,12 @@
 import time
 import datetime
 import cv2    
-import face_recognition 
 from pyzbar.pyzbar import decode as decode_qr # Para QR
 import os   
 import threading # Para el lock si es necesario para variables de este módulo
+import contextlib
 
 from enum import Enum
-import numpy as np # Necesario para convexHull si se usa
 
 class EstadoSistema(Enum):
     REPOSO = "REPOSO"
@@ -30,17 +29,66 @@ try:
     import validation_logic 
     import reporting_logging 
     import facial_recognition_utils 
+    import procesamiento_facial # Detección + encoding facial en un pool de procesos
+    import cascada_deteccion # Filtro de movimiento antes de enviar frames a la detección
+    import seguimiento_facial # Seguimiento de rostros para no recalcular encodings
+    import fusion_temporal # Decisión facial sobre varios frames de la misma pista
+    import escalado_adaptativo # Escala y región de interés de cada frame según latencia y tamaño del rostro
+    import servicio_captura # Cámara compartida (en vivo o reproducción, ver fuentes_frames.py) con el último frame en memoria
+    import instrumentacion # Tiempos por etapa (lectura de cámara, QR, búsqueda facial)
+    import precalentamiento # Abre la cámara y prepara el detector cuando alguien se acerca a SP1
+    import canal_vista_previa # Último frame para la vista previa de la GUI (sin pasar por ui_queue)
+    import escaner_qr # Decodificación QR en gris por etapas (ROI, reducida, completa) en segundo plano
+    import credenciales_qr # Verificación local de credenciales QR firmadas (HMAC, caché LRU, anti-repetición)
     import global_state # FIX: Importar el estado global
 except ImportError as e:
     print(f"Error CRÍTICO al importar módulos en state_machine_logic.py: {e}")
     # Definir stubs muy básicos para que el linter no falle catastróficamente si faltan
     class EstadoSistema: REPOSO="S_REPOSO"; ESPERANDO_VALIDACION_RFID="S_RFID"; ESPERANDO_VALIDACION_QR_REAL="S_QR"; ESPERANDO_VALIDACION_FACIAL="S_FACIAL"; ABRIENDO_PUERTA="S_ABRIENDO"; PERSONA_CRUZANDO="S_CRUZANDO"; CERRANDO_PUERTA="S_CERRANDO"; ALERTA_ERROR_CRUCE="S_ALERTA"; ACCESO_DENEGADO_TEMPORAL="S_DENEGADO"; SISTEMA_BLOQUEADO_UID="S_BLOQUEADO_UID"; EMERGENCIA_ACTIVA="S_EMERGENCIA"
-    class constants: UMBRAL_DETECCION_SP1_CM=30; TIMEOUT_PRESENTACION_RFID_S=10; TIMEOUT_RECONOCIMIENTO_FACIAL_S=15;TIMEOUT_SIMULACION_QR_S=3; INDICE_CAMARA=0; FACTOR_REDUCCION_FRAME_FACIAL=0.5;TOLERANCIA_FACIAL=0.6;TIEMPO_ESPERA_APERTURA_PUERTA_S=2;TIEMPO_MAX_SP2_ACTIVO_S=5;TIEMPO_MAX_PUERTA_ABIERTA_TOTAL_S=10;TIEMPO_CIERRE_PUERTA_S=1; CARPETA_REPORTES="."; TIEMPO_COOLDOWN_ACCESO_S=30; MAX_INTENTOS_FALLIDOS_UID=3; TIEMPO_BLOQUEO_UID_NIVEL={1:300, 2:600, 3:86400}
+    class constants: UMBRAL_DETECCION_SP1_CM=30; TIMEOUT_PRESENTACION_RFID_S=10; TIMEOUT_RECONOCIMIENTO_FACIAL_S=15;TIMEOUT_SIMULACION_QR_S=3; INDICE_CAMARA=0; FACTOR_REDUCCION_FRAME_FACIAL=0.5;TOLERANCIA_FACIAL=0.6;TIEMPO_ESPERA_APERTURA_PUERTA_S=2;TIEMPO_MAX_SP2_ACTIVO_S=5;TIEMPO_MAX_PUERTA_ABIERTA_TOTAL_S=10;TIEMPO_CIERRE_PUERTA_S=1; CARPETA_REPORTES="."; TIEMPO_COOLDOWN_ACCESO_S=30; MAX_INTENTOS_FALLIDOS_UID=3; TIEMPO_BLOQUEO_UID_NIVEL={1:300, 2:600, 3:86400}; USAR_FILTRO_MOVIMIENTO_FACIAL=True; USAR_SEGUIMIENTO_FACIAL=True; USAR_PRECALENTAMIENTO_CAMARA=False
     class arduino_comms: datos_hardware={"sp1_distancia":999,"e_estado":1,"s1_estado":1,"s2_estado":1,"rfid_uid":"NADA","ultimo_rfid_procesado_para_acceso":"NADA"}; lock_datos_hardware=threading.Lock(); enviar_comando_a_arduino=print; is_arduino_conectado=lambda: False; get_datos_hardware_copia=lambda:arduino_comms.datos_hardware
     class db_manager: obtener_usuario_por_rfid_bd=lambda x:None; obtener_usuario_por_nombre_bd=lambda x:None; inicializar_bd=print
     class validation_logic: verificar_horario_trabajador=lambda x,y:False; verificar_horario_visitante=lambda:False
     class reporting_logging: registrar_intento_fallido=lambda a,b,c,d=True:False; registrar_evento_acceso_exitoso=print; cargar_estado_diario=print; verificar_y_resetear_por_cambio_de_dia=lambda:False; intentos_fallidos_por_uid={}; accesos_recientes_uid={}
-    class facial_recognition_utils: encodings_faciales_cargados_global=[]; cargar_encodings_faciales_al_inicio=print
+    class facial_recognition_utils: identificar_rostros_en_galeria=lambda x:(None, None); crear_verificador_usuario=lambda u: None; cargar_encodings_faciales_al_inicio=print; asegurar_galeria_cargada=print
+    class procesamiento_facial: iniciar_pool_deteccion=lambda:False; iniciar_sesion=lambda:None; enviar_frame=lambda f, c=(), ctx=None: None; obtener_ultimo_resultado=lambda:None
+    class cascada_deteccion:
+        class DetectorMovimiento:
+            def reiniciar(self): pass
+            def hay_movimiento(self, f): return True
+    class seguimiento_facial:
+        class SeguidorRostros:
+            def reiniciar(self): pass
+            def actualizar(self, u, e): return [None] * len(u)
+            def registrar_distancia(self, p, d, i=None, u=None): pass
+            def cajas_sin_recodificar(self): return []
+            def apartar_encodings_nuevos(self, p): return []
+            def registrar_distancia_diferida(self, p, e, d, i=None, u=None): pass
+    class fusion_temporal: usuario_aceptado=lambda p: None
+    class escalado_adaptativo:
+        class TransformacionFrame:
+            def __init__(self, e): self.escala = e
+            def a_frame_completo(self, c): return tuple(int(v / self.escala) for v in c)
+            def a_frame_procesado(self, c): return tuple(int(v * self.escala) for v in c)
+        class EscaladorAdaptativo:
+            def reiniciar(self): pass
+            def preparar(self, f, t): return cv2.cvtColor(cv2.resize(f, (0, 0), fx=0.5, fy=0.5), cv2.COLOR_BGR2RGB), escalado_adaptativo.TransformacionFrame(0.5)
+            def actualizar(self, u, s, t, h=True): pass
+    class servicio_captura: adquirir_camara = lambda: cv2.VideoCapture(constants.INDICE_CAMARA, cv2.CAP_DSHOW)
+    class instrumentacion: medir_etapa = lambda n: contextlib.nullcontext(); registrar_tiempo = lambda n, s: None
+    class precalentamiento:
+        class TendenciaSP1:
+            def actualizar(self, d, t): return False
+        iniciar_precalentamiento = lambda: False
+    class canal_vista_previa: publicar_frame = lambda f: None; publicar_camara_apagada = lambda t="Cámara OFF": None
+    class escaner_qr:
+        class EscanerQR:
+            def reiniciar(self): self.frame = None
+            def enviar_frame(self, f): self.frame = f; return True
+            def obtener_resultado(self):
+                frame, self.frame = getattr(self, "frame", None), None
+                return None if frame is None else [{"datos": o.data.decode("utf-8"), "caja": tuple(o.rect), "etapa": "completa"} for o in decode_qr(frame)]
+    class credenciales_qr: MOTIVO_SIN_FORMATO = "QR sin formato de credencial"; verificar_credencial_qr = lambda c, consumir=True, ahora=None: (None, "Módulo de credenciales QR no disponible")
 
 # --- Variables Globales Específicas de este Módulo (Lógica de Estados) ---
 estado_actual_sistema = EstadoSistema.REPOSO
@@ -53,10 +101,20 @@ cap_camara = None
 protocolo_seleccionado_actual = {"rfid": True, "qr": False, "facial": False, "descripcion": "Solo RFID (Predeterminado)"}
 estado_validacion_secuencial = {} # Ej: {"rfid_ok": True, "usuario_validado_info": {datos_del_usuario_rfid}}
 
-cap_camara = None 
+cap_camara = None # Referencia a la cámara de servicio_captura (liberarla no cierra la cámara)
 hilo_maquina_estados = None # Referencia al hilo que ejecuta logica_maquina_estados
 hilo_maquina_estados_activo = False 
 frame_procesados_sin_deteccion = 0 # Para no saturar la consola con "no rostros/no QR"
+sesion_facial_inicio_estado_s = None # tiempo_inicio_estado_actual_s de la sesión facial en curso (para el pool)
+detector_movimiento_facial = cascada_deteccion.DetectorMovimiento() # Omite frames sin cambios antes de HOG
+seguidor_rostros_facial = seguimiento_facial.SeguidorRostros() # Reutiliza encodings de rostros ya seguidos
+escalador_facial = escalado_adaptativo.EscaladorAdaptativo() # Escala/ROI de cada frame enviado a la detección
+verificador_1_a_1 = None # Muestras del usuario del paso previo (RFID/QR), preparadas al entrar al estado facial
+tendencia_sp1 = precalentamiento.TendenciaSP1() # Lecturas de SP1 en REPOSO para precalentar la cámara
+latencias_registradas_en_entrada = {} # métrica -> tiempo_inicio_estado_actual_s en que ya se registró
+escaner_qr_fsm = escaner_qr.EscanerQR() # Decodifica los frames del estado QR sin bloquear la FSM
+sesion_qr_inicio_estado_s = None # tiempo_inicio_estado_actual_s de la sesión QR en curso
+encodings_previos_al_qr = [] # (pista, encoding) vistos en QR + Facial simultáneo antes de validar el QR
 
 
 # Variables para el modo emergencia
@@ -129,6 +187,66 @@ def cambiar_estado(nuevo_estado, mensaje_gui=None):
             "mensaje": mensaje_gui
         })
 
+def registrar_latencia_desde_entrada(nombre_metrica):
+    """Registra (una vez por entrada al estado) el tiempo desde que se entró al estado actual."""
+    if latencias_registradas_en_entrada.get(nombre_metrica) != tiempo_inicio_estado_actual_s:
+        latencias_registradas_en_entrada[nombre_metrica] = tiempo_inicio_estado_actual_s
+        instrumentacion.registrar_tiempo(nombre_metrica, time.time() - tiempo_inicio_estado_actual_s)
+
+def cambiar_a_validacion_qr():
+    """
+    Entra en la validación QR. En "QR + Facial" con USAR_QR_FACIAL_SIMULTANEO se pasa directamente
+    al estado facial con el QR pendiente: cada frame va a la vez al escáner QR y a la detección
+    facial, y los rostros vistos antes de leer el QR se comparan con su usuario en cuanto se valida.
+    """
+    if protocolo_seleccionado_actual["facial"] and constants.USAR_QR_FACIAL_SIMULTANEO:
+        estado_validacion_secuencial["qr_pendiente"] = True
+        cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_FACIAL, "Muestre su código QR y mire a la cámara...")
+    else:
+        cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_QR_REAL, "Prepare su código QR...")
+
+def verificar_qr_leido(datos_qr):
+    """
+    Valida el texto de un QR como credencial del paso actual (credenciales_qr.py).
+    Devuelve (usuario, motivo_rechazo); motivo_rechazo es None si se acepta y
+    credenciales_qr.MOTIVO_SIN_FORMATO si el QR no es una credencial (se ignora).
+    La credencial no se gasta aquí: un rechazo posterior (otro usuario, horario, rostro,
+    timeout) no debe inutilizarla. Se gasta al conceder el acceso (consumir_qr_validado).
+    """
+    u_previo = estado_validacion_secuencial.get("usuario_validado_info")
+    u_actual, motivo_rechazo = credenciales_qr.verificar_credencial_qr(datos_qr, consumir=False)
+    if u_actual and u_previo and u_previo.get("id_usuario") != u_actual.get("id_usuario"):
+        motivo_rechazo = "QR de otro usuario"
+    elif u_actual and u_actual.get("nivel") == "Trabajador" and not validation_logic.verificar_horario_trabajador(u_actual.get("h_inicio"), u_actual.get("h_fin")):
+        motivo_rechazo = "Fuera de horario laboral"
+    return u_actual, motivo_rechazo
+
+def consumir_qr_validado():
+    """
+    Gasta la credencial QR aceptada en este intento justo antes de conceder el acceso.
+    Devuelve None si no hay credencial o se gastó, o el motivo si ya no vale (expiró
+    mientras se validaba el rostro o se usó en otro intento).
+    """
+    credencial = estado_validacion_secuencial.get("credencial_qr")
+    if credencial is None:
+        return None
+    _, motivo_rechazo = credenciales_qr.verificar_credencial_qr(credencial, consumir=True)
+    return motivo_rechazo
+
+def denegar_por_qr(u_actual, motivo_rechazo):
+    """Registra el QR rechazado, deniega el acceso y libera la cámara."""
+    global cap_camara
+    u_log = u_actual or estado_validacion_secuencial.get("usuario_validado_info")
+    print(f"QR rechazado: {motivo_rechazo}")
+    reporting_logging.registrar_intento_fallido(u_log.get("uid_rfid") if u_log else None, u_log, f"QR rechazado: {motivo_rechazo}", False)
+    arduino_comms.enviar_comando_a_arduino("LED_ROJO_ON")
+    cambiar_estado(EstadoSistema.ACCESO_DENEGADO_TEMPORAL, f"Acceso Denegado: {motivo_rechazo}.")
+    if cap_camara is not None and cap_camara.isOpened():
+        cap_camara.release()
+    cap_camara = None
+    canal_vista_previa.publicar_camara_apagada()
+    estado_validacion_secuencial.clear()
+
 # ==============================================================================
 # FUNCIÓN PRINCIPAL DE LA MÁQUINA DE ESTADOS
 # ==============================================================================
@@ -137,11 +255,13 @@ def logica_maquina_estados():
     global estado_validacion_secuencial, cap_camara, frame_procesados_sin_deteccion_facial
     global estado_previo_a_emergencia, puerta_estaba_abierta_logicamente_antes_emergencia
     global video_writer_emergencia, grabando_video_emergencia, nombre_archivo_video_emergencia
+    global sesion_facial_inicio_estado_s, verificador_1_a_1, sesion_qr_inicio_estado_s
     
     print("Hilo de Máquina de Estados iniciado.")
     db_manager.inicializar_bd() 
     reporting_logging.cargar_estado_diario() 
-    facial_recognition_utils.cargar_encodings_faciales_al_inicio() 
+    facial_recognition_utils.asegurar_galeria_cargada() # Solo la primera vez; luego se actualiza de forma incremental
+    procesamiento_facial.iniciar_pool_deteccion()
     
     with arduino_comms.lock_datos_hardware: 
         s1_prev = arduino_comms.datos_hardware["s1_estado"]
@@ -166,7 +286,7 @@ def logica_maquina_estados():
                 cambiar_estado(EstadoSistema.REPOSO, "Arduino desconectado. Sistema en reposo.")
             if cap_camara and cap_camara.isOpened():
                 cap_camara.release(); cap_camara = None; 
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                canal_vista_previa.publicar_camara_apagada()
             time.sleep(0.5); continue 
         
         tiempo_actual_s = time.time()
@@ -182,7 +302,7 @@ def logica_maquina_estados():
             print("¡MODO EMERGENCIA ACTIVADO POR SWITCH!")
             if cap_camara and cap_camara.isOpened(): 
                 cap_camara.release(); cap_camara = None; 
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                canal_vista_previa.publicar_camara_apagada()
             estado_previo_a_emergencia = estado_actual_sistema 
             puerta_estaba_abierta_logicamente_antes_emergencia = puerta_logicamente_abierta
             cambiar_estado(EstadoSistema.EMERGENCIA_ACTIVA, "¡¡MODO EMERGENCIA ACTIVADO!!")
@@ -196,8 +316,7 @@ def logica_maquina_estados():
                 puerta_logicamente_abierta = True 
             try:
                 if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None
-                cap_camara = cv2.VideoCapture(constants.INDICE_CAMARA, cv2.CAP_DSHOW)
-                time.sleep(0.5); 
+                cap_camara = servicio_captura.adquirir_camara()
                 if cap_camara.isOpened():
                     fw = int(cap_camara.get(cv2.CAP_PROP_FRAME_WIDTH)); fh = int(cap_camara.get(cv2.CAP_PROP_FRAME_HEIGHT))
                     fps_c = cap_camara.get(cv2.CAP_PROP_FPS); fps_g = int(fps_c) if fps_c and fps_c > 0 else 20 
@@ -215,7 +334,7 @@ def logica_maquina_estados():
                 video_writer_emergencia.release(); print(f"Grabación de emergencia finalizada: {nombre_archivo_video_emergencia}")
             grabando_video_emergencia = False; video_writer_emergencia = None; nombre_archivo_video_emergencia = "" 
             if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+            canal_vista_previa.publicar_camara_apagada()
             arduino_comms.enviar_comando_a_arduino("LED_ROJO_PARPADEAR_EMERGENCIA_DETENER") 
             cambiar_estado(EstadoSistema.CERRANDO_PUERTA, "Emergencia finalizada. Cerrando puerta..."); continue 
         
@@ -226,7 +345,7 @@ def logica_maquina_estados():
                     ts_e = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
                     cv2.putText(frame_e, ts_e, (10, frame_e.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
                     video_writer_emergencia.write(frame_e)
-                    if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": frame_e})
+                    canal_vista_previa.publicar_frame(frame_e)
                 else: print("Error leyendo frame durante grabación de emergencia.")
             time.sleep(0.05); continue 
         
@@ -239,7 +358,7 @@ def logica_maquina_estados():
         
         if estado_actual_sistema == EstadoSistema.REPOSO:
             if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+            canal_vista_previa.publicar_camara_apagada()
             arduino_comms.enviar_comando_a_arduino("LED_VERDE_OFF"); arduino_comms.enviar_comando_a_arduino("LED_ROJO_OFF")
             if ultimo_rfid_procesado_acceso != "NADA": 
                 with arduino_comms.lock_datos_hardware: arduino_comms.datos_hardware["ultimo_rfid_procesado_para_acceso"] = "NADA" 
@@ -248,11 +367,13 @@ def logica_maquina_estados():
                  if time.time() - tiempo_inicio_estado_actual_s > 3: 
                      if ui_queue: ui_queue.put({"type": "mensaje_update", "mensaje": ""})
             if puerta_logicamente_abierta: cambiar_estado(EstadoSistema.CERRANDO_PUERTA, "Error: Puerta abierta, cerrando."); continue
+            if constants.USAR_PRECALENTAMIENTO_CAMARA and (protocolo_seleccionado_actual["qr"] or protocolo_seleccionado_actual["facial"]):
+                if tendencia_sp1.actualizar(dist_sp1, tiempo_actual_s): precalentamiento.iniciar_precalentamiento()
             if 0 < dist_sp1 < constants.UMBRAL_DETECCION_SP1_CM:
                 print(f"SP1 detectó. Protocolo: {protocolo_seleccionado_actual['descripcion']}")
                 estado_validacion_secuencial.clear() 
                 if protocolo_seleccionado_actual["rfid"]: arduino_comms.enviar_comando_a_arduino("SOLICITAR_LECTURA_RFID"); cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_RFID, "Presente su tarjeta RFID...")
-                elif protocolo_seleccionado_actual["qr"]: cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_QR_REAL, "Prepare su código QR...")
+                elif protocolo_seleccionado_actual["qr"]: cambiar_a_validacion_qr()
                 elif protocolo_seleccionado_actual["facial"]: cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_FACIAL, "Mire a la cámara...")
                 else: cambiar_estado(EstadoSistema.ABRIENDO_PUERTA, "Acceso directo (prot. sin validación).") 
         
@@ -312,8 +433,7 @@ def logica_maquina_estados():
             if cap_camara is None or not cap_camara.isOpened():
                 try:
                     print("Iniciando cámara para escaneo QR...")
-                    cap_camara = cv2.VideoCapture(constants.INDICE_CAMARA, cv2.CAP_DSHOW)
-                    time.sleep(0.5)
+                    cap_camara = servicio_captura.adquirir_camara()
                     if not cap_camara.isOpened():
                         raise IOError("No se pudo abrir la cámara para QR.")
                 except Exception as e:
@@ -329,67 +449,79 @@ def logica_maquina_estados():
                 if cap_camara is not None and cap_camara.isOpened():
                     cap_camara.release()
                 cap_camara = None
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                canal_vista_previa.publicar_camara_apagada()
                 continue
 
-            ret, frame = cap_camara.read()
+            if sesion_qr_inicio_estado_s != tiempo_inicio_estado_actual_s:
+                escaner_qr_fsm.reiniciar() # Nueva entrada al estado: sin caja previa ni frames de la validación anterior
+                sesion_qr_inicio_estado_s = tiempo_inicio_estado_actual_s
+
+            with instrumentacion.medir_etapa("camara_lectura"):
+                ret, frame = cap_camara.read()
             if not ret:
                 print("No se pudo leer frame QR.")
                 time.sleep(0.1)
                 continue
+            registrar_latencia_desde_entrada("qr_latencia_primer_frame")
 
             # Mostrar frame en la GUI
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": frame})
+            canal_vista_previa.publicar_frame(frame)
 
-            decoded_objects = decode_qr(frame)
+            # Se recoge el resultado del frame anterior y se entrega este (se omite si aún hay uno en curso)
+            decoded_objects = escaner_qr_fsm.obtener_resultado() or []
+            escaner_qr_fsm.enviar_frame(frame)
+            if decoded_objects:
+                registrar_latencia_desde_entrada("qr_latencia_primer_codigo")
             for obj in decoded_objects:
-                data = obj.data.decode("utf-8")
+                data = obj["datos"]
                 print(f"QR detectado: {data}")
-                # Validar cualquier contenido de QR
-                if data and len(data) > 0:  # Solo verificamos que haya contenido
-                    u_actual = estado_validacion_secuencial.get("usuario_validado_info")
-                    if protocolo_seleccionado_actual["facial"]:
-                        cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_FACIAL, "QR OK. Mire a la cámara...")
-                    else:
-                        if not u_actual:
-                            u_actual = {
-                                "nombre": "Usuario QR",
-                                "dni": "N/A_QR",
-                                "nivel": "Visitante",
-                                "area": "N/A",
-                                "uid_rfid": "QR_VALIDO",
-                                "facial_encoding_array": None
-                            }
-                        reporting_logging.registrar_evento_acceso_exitoso(u_actual)
-                        arduino_comms.enviar_comando_a_arduino("LED_VERDE_ON")
-                        cambiar_estado(EstadoSistema.ABRIENDO_PUERTA, f"Acceso Concedido: {u_actual['nombre']} (QR OK)")
-                        if cap_camara is not None and cap_camara.isOpened():
-                            cap_camara.release()
-                        cap_camara = None
-                        if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
-                        cv2.destroyAllWindows()
-                        estado_validacion_secuencial["qr_ok"] = True
-                        break
+                # Solo valen credenciales firmadas por esta instalación (credenciales_qr.py)
+                u_actual, motivo_rechazo = verificar_qr_leido(data)
+                if motivo_rechazo == credenciales_qr.MOTIVO_SIN_FORMATO:
+                    continue # Otro QR a la vista (no es una credencial): se sigue escaneando
+                if motivo_rechazo:
+                    denegar_por_qr(u_actual, motivo_rechazo)
+                    break
+                estado_validacion_secuencial["usuario_validado_info"] = u_actual
+                estado_validacion_secuencial["qr_ok"] = True
+                estado_validacion_secuencial["credencial_qr"] = data
+                if not protocolo_seleccionado_actual["facial"]:
+                    motivo_rechazo = consumir_qr_validado() # Último factor: se gasta la credencial al conceder
+                if motivo_rechazo:
+                    denegar_por_qr(u_actual, motivo_rechazo)
+                elif protocolo_seleccionado_actual["facial"]:
+                    cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_FACIAL, f"QR OK ({u_actual['nombre']}). Mire a la cámara...")
+                else:
+                    reporting_logging.registrar_evento_acceso_exitoso(u_actual)
+                    arduino_comms.enviar_comando_a_arduino("LED_VERDE_ON")
+                    cambiar_estado(EstadoSistema.ABRIENDO_PUERTA, f"Acceso Concedido: {u_actual['nombre']} (QR OK)")
+                    if cap_camara is not None and cap_camara.isOpened():
+                        cap_camara.release()
+                    cap_camara = None
+                    canal_vista_previa.publicar_camara_apagada()
+                break
 
         elif estado_actual_sistema == EstadoSistema.ESPERANDO_VALIDACION_FACIAL:
             # --- LÓGICA FACIAL REAL REFINADA ---
             if not (0 < dist_sp1 < constants.UMBRAL_DETECCION_SP1_CM): 
                 if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                canal_vista_previa.publicar_camara_apagada()
                 cambiar_estado(EstadoSistema.REPOSO, "Usuario se retiró (esperando Facial)."); estado_validacion_secuencial.clear(); continue
             
-            if tiempo_actual_s - tiempo_inicio_estado_actual_s > constants.TIMEOUT_RECONOCIMIENTO_FACIAL_S: 
+            qr_pendiente = estado_validacion_secuencial.get("qr_pendiente", False) # QR + Facial simultáneo sin QR válido aún
+            modo_qr_simultaneo = "qr_pendiente" in estado_validacion_secuencial # Los dos factores comparten la ventana de tiempo
+            timeout_facial_s = max(constants.TIMEOUT_SIMULACION_QR_S, constants.TIMEOUT_RECONOCIMIENTO_FACIAL_S) if modo_qr_simultaneo else constants.TIMEOUT_RECONOCIMIENTO_FACIAL_S
+            if tiempo_actual_s - tiempo_inicio_estado_actual_s > timeout_facial_s: 
                 if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                canal_vista_previa.publicar_camara_apagada()
                 u_prev = estado_validacion_secuencial.get("usuario_validado_info")
-                reporting_logging.registrar_intento_fallido(u_prev.get("uid_rfid") if u_prev and u_prev.get("uid_rfid") else None, u_prev, "Timeout Reconocimiento Facial", False)
-                cambiar_estado(EstadoSistema.ACCESO_DENEGADO_TEMPORAL, "Tiempo agotado para Facial."); estado_validacion_secuencial.clear(); continue
+                reporting_logging.registrar_intento_fallido(u_prev.get("uid_rfid") if u_prev and u_prev.get("uid_rfid") else None, u_prev, "Timeout QR" if qr_pendiente else "Timeout Reconocimiento Facial", False)
+                cambiar_estado(EstadoSistema.ACCESO_DENEGADO_TEMPORAL, "Tiempo agotado para QR." if qr_pendiente else "Tiempo agotado para Facial."); estado_validacion_secuencial.clear(); continue
 
             if cap_camara is None or not cap_camara.isOpened(): 
                 try:
                     print(f"Intentando abrir cámara con índice: {constants.INDICE_CAMARA}")
-                    cap_camara = cv2.VideoCapture(constants.INDICE_CAMARA, cv2.CAP_DSHOW)
-                    time.sleep(0.5); 
+                    cap_camara = servicio_captura.adquirir_camara()
                     if not cap_camara.isOpened(): raise IOError(f"No se pudo abrir cámara {constants.INDICE_CAMARA}")
                     print("Cámara activada para reconocimiento facial.")
                     frame_procesados_sin_deteccion_facial = 0 
@@ -398,28 +530,99 @@ def logica_maquina_estados():
                     reporting_logging.registrar_intento_fallido(None, None, f"Error Cámara Facial: {e_cam}", False)
                     cambiar_estado(EstadoSistema.ACCESO_DENEGADO_TEMPORAL, "Error al iniciar cámara."); estado_validacion_secuencial.clear(); continue
             
-            ret, frame = cap_camara.read()
+            if sesion_facial_inicio_estado_s != tiempo_inicio_estado_actual_s:
+                # Nueva entrada al estado: descartar resultados de frames de una validación anterior
+                procesamiento_facial.iniciar_sesion()
+                detector_movimiento_facial.reiniciar()
+                seguidor_rostros_facial.reiniciar()
+                escalador_facial.reiniciar()
+                verificador_1_a_1 = facial_recognition_utils.crear_verificador_usuario(estado_validacion_secuencial.get("usuario_validado_info"))
+                sesion_facial_inicio_estado_s = tiempo_inicio_estado_actual_s
+                if qr_pendiente:
+                    escaner_qr_fsm.reiniciar()
+                    sesion_qr_inicio_estado_s = tiempo_inicio_estado_actual_s
+                encodings_previos_al_qr.clear()
+
+            with instrumentacion.medir_etapa("camara_lectura"):
+                ret, frame = cap_camara.read()
             if not ret: print("Facial: Error al leer frame."); time.sleep(0.1); continue
+            registrar_latencia_desde_entrada("facial_latencia_primer_frame")
+
+            usuario_aceptado_con_rostros_previos = None
+            if qr_pendiente:
+                # QR + Facial simultáneo: el mismo frame va al escáner QR (su hilo) y a la detección facial (el pool)
+                codigos_qr = escaner_qr_fsm.obtener_resultado() or []
+                escaner_qr_fsm.enviar_frame(frame)
+                frame = frame.copy() # Lo que se dibuja abajo no debe llegar al escáner QR
+                if codigos_qr:
+                    registrar_latencia_desde_entrada("qr_latencia_primer_codigo")
+                for codigo_qr in codigos_qr:
+                    u_qr, motivo_rechazo = verificar_qr_leido(codigo_qr["datos"])
+                    if motivo_rechazo == credenciales_qr.MOTIVO_SIN_FORMATO:
+                        continue
+                    if motivo_rechazo:
+                        denegar_por_qr(u_qr, motivo_rechazo)
+                        break
+                    print(f"QR válido de {u_qr['nombre']} (QR + Facial simultáneo).")
+                    registrar_latencia_desde_entrada("qr_latencia_validacion")
+                    estado_validacion_secuencial.update({"usuario_validado_info": u_qr, "qr_ok": True, "qr_pendiente": False, "credencial_qr": codigo_qr["datos"]})
+                    qr_pendiente = False
+                    verificador_1_a_1 = facial_recognition_utils.crear_verificador_usuario(u_qr)
+                    # Los rostros vistos mientras se esperaba el QR cuentan como observaciones 1 a 1
+                    if encodings_previos_al_qr and verificador_1_a_1 is not None:
+                        distancias_previas = verificador_1_a_1.distancias([e for _, e in encodings_previos_al_qr])
+                        for (pista_previa, encoding_previo), distancia_previa in zip(encodings_previos_al_qr, distancias_previas):
+                            seguidor_rostros_facial.registrar_distancia_diferida(pista_previa, encoding_previo, distancia_previa, "1a1", u_qr)
+                        if any(fusion_temporal.usuario_aceptado(p) is not None for p, _ in encodings_previos_al_qr):
+                            usuario_aceptado_con_rostros_previos = u_qr # El rostro ya estaba confirmado: no se espera otro frame
+                    encodings_previos_al_qr.clear()
+                    if ui_queue: ui_queue.put({"type": "mensaje_update", "mensaje": f"QR OK ({u_qr['nombre']}). Mire a la cámara..."})
+                    break
+                if estado_actual_sistema != EstadoSistema.ESPERANDO_VALIDACION_FACIAL:
+                    continue
 
-            rgb_frame_pequeno = cv2.resize(frame, (0, 0), fx=constants.FACTOR_REDUCCION_FRAME_FACIAL, fy=constants.FACTOR_REDUCCION_FRAME_FACIAL)
-            rgb_frame_pequeno_convertido = cv2.cvtColor(rgb_frame_pequeno, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame_pequeno_convertido, model="hog")
+            # La detección y los encodings corren en el pool; la FSM solo recoge el último resultado listo.
+            # Los frames sin cambios respecto al último enviado no llegan a HOG (cascada_deteccion.py).
+            # Escala y recorte de cada frame los decide escalador_facial; las cajas del resultado se
+            # devuelven a coordenadas del frame de cámara con la transformación que viajó con el frame.
+            if not constants.USAR_FILTRO_MOVIMIENTO_FACIAL or detector_movimiento_facial.hay_movimiento(frame):
+                with instrumentacion.medir_etapa("facial_preparacion"):
+                    rgb_frame_pequeno_convertido, transformacion_frame = escalador_facial.preparar(frame, tiempo_actual_s)
+                cajas_sin_recodificar = [transformacion_frame.a_frame_procesado(c) for c in seguidor_rostros_facial.cajas_sin_recodificar()] if constants.USAR_SEGUIMIENTO_FACIAL else []
+                procesamiento_facial.enviar_frame(rgb_frame_pequeno_convertido, cajas_sin_recodificar, transformacion_frame)
+            resultado_facial = procesamiento_facial.obtener_ultimo_resultado()
+            face_locations = [resultado_facial["contexto"].a_frame_completo(c) for c in resultado_facial["ubicaciones"]] if resultado_facial else []
+            if resultado_facial:
+                registrar_latencia_desde_entrada("facial_latencia_primer_resultado")
+                escalador_facial.actualizar(face_locations, resultado_facial["tiempo_proceso_s"], tiempo_actual_s, resultado_facial["etapa"] != "omitido_haar")
+            # Las detecciones sin encoding (omitido por pertenecer a una pista confiable) reutilizan el de su pista
+            pistas_rostros = seguidor_rostros_facial.actualizar(face_locations, resultado_facial["encodings"]) if resultado_facial else []
             
             # Inicializar variables para este frame
             rostro_finalmente_validado_ok = False
             info_usuario_para_acceso_final = None
             motivo_fallo_del_frame = "Rostro no reconocido"
             mensajes_cooldown_repetidos = 0
+            if usuario_aceptado_con_rostros_previos is not None:
+                rostro_finalmente_validado_ok = True
+                info_usuario_para_acceso_final = usuario_aceptado_con_rostros_previos
 
             # Dibujar información en el frame ANTES de procesar
-            tiempo_restante = int(constants.TIMEOUT_RECONOCIMIENTO_FACIAL_S - (tiempo_actual_s - tiempo_inicio_estado_actual_s))
+            tiempo_restante = int(timeout_facial_s - (tiempo_actual_s - tiempo_inicio_estado_actual_s))
             cv2.putText(frame, f"Tiempo: {tiempo_restante}s", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
             
-            if not face_locations:
+            if resultado_facial is None:
+                pass # Aún no hay un resultado nuevo del pool; se sigue mostrando el video
+            elif not face_locations:
                 frame_procesados_sin_deteccion_facial += 1
                 if frame_procesados_sin_deteccion_facial % 30 == 0:
                     print("Facial: No se detectaron rostros...")
                     cv2.putText(frame, "No se detectan rostros", (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            elif qr_pendiente:
+                # Sin QR aún no se sabe contra quién comparar: los encodings esperan (los últimos VENTANA_FUSION_FACIAL)
+                frame_procesados_sin_deteccion_facial = 0
+                encodings_previos_al_qr.extend(seguidor_rostros_facial.apartar_encodings_nuevos(pistas_rostros))
+                del encodings_previos_al_qr[:-max(1, constants.VENTANA_FUSION_FACIAL)]
             else:
                 frame_procesados_sin_deteccion_facial = 0
                 usuario_identificado_paso_previo = estado_validacion_secuencial.get("usuario_validado_info")
@@ -432,8 +635,8 @@ def logica_maquina_estados():
                         print(msg_denial)
                         reporting_logging.registrar_intento_fallido(usuario_identificado_paso_previo.get("uid_rfid"), usuario_identificado_paso_previo, "Rostro no registrado", False)
                         
-                        if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; cv2.destroyAllWindows()
-                        if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                        if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None
+                        canal_vista_previa.publicar_camara_apagada()
                         cambiar_estado(EstadoSistema.ACCESO_DENEGADO_TEMPORAL, "Acceso Denegado: Rostro no registrado.")
                         estado_validacion_secuencial.clear()
                         continue # Salta el resto del procesamiento facial para este ciclo
@@ -445,72 +648,89 @@ def logica_maquina_estados():
                     usuario_identificado_paso_previo.get("facial_encoding_array") is not None 
                 )
 
-                current_face_encodings_in_frame = face_recognition.face_encodings(rgb_frame_pequeno_convertido, face_locations)
+                pistas_con_encoding = [p for p in pistas_rostros if p is not None]
+                current_face_encodings_in_frame = [p.encoding for p in pistas_con_encoding]
+
+                # Búsqueda 1 a N de todos los rostros del frame en un solo producto matricial.
+                # La galería ya trae los datos del usuario de cada fila: sin consultas a la BD.
+                usuarios_1_a_n, distancias_1_a_n = None, None
+                with instrumentacion.medir_etapa("facial_busqueda"):
+                    if realizar_comparacion_1_a_1:
+                        if verificador_1_a_1 is None or verificador_1_a_1.id_usuario != usuario_identificado_paso_previo.get("id_usuario"):
+                            verificador_1_a_1 = facial_recognition_utils.crear_verificador_usuario(usuario_identificado_paso_previo)
+                        # Todos los rostros del frame contra las muestras del usuario en una sola llamada
+                        distancias_1_a_1 = verificador_1_a_1.distancias(current_face_encodings_in_frame)
+                    else:
+                        usuarios_1_a_n, distancias_1_a_n = facial_recognition_utils.identificar_rostros_en_galeria(current_face_encodings_in_frame)
                 
-                for face_encoding_detectado in current_face_encodings_in_frame:
+                # Cada distancia se añade a la ventana de su pista; la decisión de aceptar la toma
+                # fusion_temporal según MODO_FUSION_FACIAL (un frame, k de n, o distancia media).
+                for idx_rostro, face_encoding_detectado in enumerate(current_face_encodings_in_frame):
+                    pista_rostro = pistas_con_encoding[idx_rostro]
                     if realizar_comparacion_1_a_1:
-                        distancia = face_recognition.face_distance([usuario_identificado_paso_previo["facial_encoding_array"]], face_encoding_detectado)[0]
-                        if distancia <= constants.TOLERANCIA_FACIAL:
+                        distancia = distancias_1_a_1[idx_rostro] # Menor distancia a cualquiera de sus muestras
+                        seguidor_rostros_facial.registrar_distancia(pista_rostro, distancia, "1a1", usuario_identificado_paso_previo)
+                        if fusion_temporal.usuario_aceptado(pista_rostro) is not None:
                             if usuario_identificado_paso_previo.get("nivel_usuario") == "Trabajador" and not validation_logic.verificar_horario_trabajador(usuario_identificado_paso_previo.get("hora_inicio"), usuario_identificado_paso_previo.get("hora_fin")):
                                 motivo_fallo_del_frame = "Fuera de horario laboral permitido"
                             else:
                                 rostro_finalmente_validado_ok = True
                                 info_usuario_para_acceso_final = usuario_identificado_paso_previo
                                 break
-                        else:
+                        elif distancia > constants.TOLERANCIA_FACIAL:
                             motivo_fallo_del_frame = "Rostro no coincide con UID"
                     else: # Búsqueda 1 a N
-                        if facial_recognition_utils.encodings_faciales_cargados_global:
-                            distancias = face_recognition.face_distance(facial_recognition_utils.encodings_faciales_cargados_global, face_encoding_detectado)
-                            best_match_index = np.argmin(distancias)
-                            if distancias[best_match_index] <= constants.TOLERANCIA_FACIAL:
-                                nombre_usuario_encontrado = facial_recognition_utils.nombres_usuarios_cargados_global[best_match_index]
-                                el_usuario_info = db_manager.obtener_usuario_por_nombre_bd(nombre_usuario_encontrado)
-                                if el_usuario_info:
-                                    if el_usuario_info.get("nivel_usuario") == "Trabajador" and not validation_logic.verificar_horario_trabajador(el_usuario_info.get("hora_inicio"), el_usuario_info.get("hora_fin")):
-                                        motivo_fallo_del_frame = "Fuera de horario laboral permitido"
-                                    else:
-                                        rostro_finalmente_validado_ok = True
-                                        info_usuario_para_acceso_final = el_usuario_info
-                                        break
+                        if usuarios_1_a_n is not None and usuarios_1_a_n[idx_rostro]:
+                            candidato = usuarios_1_a_n[idx_rostro]
+                            seguidor_rostros_facial.registrar_distancia(pista_rostro, distancias_1_a_n[idx_rostro], candidato.get("id_usuario"), candidato)
+                            el_usuario_info = fusion_temporal.usuario_aceptado(pista_rostro)
+                            if el_usuario_info:
+                                if el_usuario_info.get("nivel_usuario") == "Trabajador" and not validation_logic.verificar_horario_trabajador(el_usuario_info.get("hora_inicio"), el_usuario_info.get("hora_fin")):
+                                    motivo_fallo_del_frame = "Fuera de horario laboral permitido"
+                                else:
+                                    rostro_finalmente_validado_ok = True
+                                    info_usuario_para_acceso_final = el_usuario_info
+                                    break
                     if rostro_finalmente_validado_ok:
                         break
 
             # Decisión final después de procesar el frame
             if rostro_finalmente_validado_ok and info_usuario_para_acceso_final:
-                if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; cv2.destroyAllWindows()
-                if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+                motivo_rechazo = consumir_qr_validado() # QR + Facial: la credencial se gasta solo al conceder
+                if motivo_rechazo:
+                    denegar_por_qr(info_usuario_para_acceso_final, motivo_rechazo)
+                    continue
+                if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None
+                canal_vista_previa.publicar_camara_apagada()
                 cambiar_estado(EstadoSistema.ABRIENDO_PUERTA, f"Acceso Concedido: {info_usuario_para_acceso_final['nombre']}")
                 reporting_logging.registrar_evento_acceso_exitoso(info_usuario_para_acceso_final)
                 estado_validacion_secuencial.clear()
-            elif face_locations and not rostro_finalmente_validado_ok and estado_actual_sistema == EstadoSistema.ESPERANDO_VALIDACION_FACIAL:
+            elif face_locations and not rostro_finalmente_validado_ok and not qr_pendiente and estado_actual_sistema == EstadoSistema.ESPERANDO_VALIDACION_FACIAL:
                 mensajes_cooldown_repetidos += 1
                 if mensajes_cooldown_repetidos < 2:
                     u_prev = estado_validacion_secuencial.get("usuario_validado_info")
                     reporting_logging.registrar_intento_fallido(u_prev.get("uid_rfid") if u_prev else None, u_prev, motivo_fallo_del_frame, False)
 
             # Mostrar el frame con toda la información
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": frame})
-
-            if cv2.waitKey(1) & 0xFF == ord('q'): continue
+            canal_vista_previa.publicar_frame(frame)
 
         elif estado_actual_sistema == EstadoSistema.SISTEMA_BLOQUEADO_UID:
             if not (0 < dist_sp1 < constants.UMBRAL_DETECCION_SP1_CM): cambiar_estado(EstadoSistema.REPOSO, "Usuario se retiró durante bloqueo."); 
             if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+            canal_vista_previa.publicar_camara_apagada()
             if tiempo_actual_s - tiempo_inicio_estado_actual_s > 60: cambiar_estado(EstadoSistema.REPOSO, "Timeout UID_BLOQUEADO."); 
             if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+            canal_vista_previa.publicar_camara_apagada()
         
         elif estado_actual_sistema == EstadoSistema.ACCESO_DENEGADO_TEMPORAL:
             if cap_camara and cap_camara.isOpened(): cap_camara.release(); cap_camara = None; 
-            if ui_queue: ui_queue.put({"type": "camera_feed_update", "frame": None, "text": "Cámara OFF"})
+            canal_vista_previa.publicar_camara_apagada()
             if tiempo_actual_s - tiempo_inicio_estado_actual_s > 2.5: 
                 arduino_comms.enviar_comando_a_arduino("LED_ROJO_OFF")
                 if 0 < dist_sp1 < constants.UMBRAL_DETECCION_SP1_CM: 
                      estado_validacion_secuencial.clear() 
                      if protocolo_seleccionado_actual["rfid"]: arduino_comms.enviar_comando_a_arduino("SOLICITAR_LECTURA_RFID"); cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_RFID, "Presente su tarjeta RFID...")
-                     elif protocolo_seleccionado_actual["qr"]: cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_QR_REAL, "Prepare su código QR...")
+                     elif protocolo_seleccionado_actual["qr"]: cambiar_a_validacion_qr()
                      elif protocolo_seleccionado_actual["facial"]: cambiar_estado(EstadoSistema.ESPERANDO_VALIDACION_FACIAL, "Mire a la cámara...")
                      else: cambiar_estado(EstadoSistema.REPOSO)
                 else: cambiar_estado(EstadoSistema.REPOSO, "Sistema en reposo.")
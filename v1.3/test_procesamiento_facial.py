@@ -0,0 +1,72 @@
+import os
+import time
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import constants
+import procesamiento_facial
+
+# ==============================================================================
+# PRUEBA: EL POOL DE DETECCIÓN FACIAL SE RECUPERA SI MUERE UN PROCESO
+# ==============================================================================
+# Uso:  python -m pytest test_procesamiento_facial.py
+
+
+def esperar_resultado(frame, timeout_s=30):
+    """Envía frames hasta recibir un resultado o agotar el tiempo."""
+    limite = time.time() + timeout_s
+    while time.time() < limite:
+        procesamiento_facial.enviar_frame(frame)
+        resultado = procesamiento_facial.obtener_ultimo_resultado()
+        if resultado is not None:
+            return resultado
+        time.sleep(0.05)
+    return None
+
+def matar_procesos_del_pool():
+    """Un proceso del pool termina de golpe (como si se cayera) y el pool queda roto."""
+    futuro = procesamiento_facial.pool_procesos.submit(os._exit, 1)
+    concurrent.futures.wait([futuro], timeout=30)
+    assert isinstance(futuro.exception(), BrokenProcessPool)
+
+def configurar_pool(monkeypatch):
+    monkeypatch.setattr(constants, "USAR_POOL_DETECCION_FACIAL", True)
+    monkeypatch.setattr(constants, "NUM_PROCESOS_DETECCION_FACIAL", 1)
+    monkeypatch.setattr(constants, "USAR_PREFILTRO_HAAR_FACIAL", False)
+
+def test_resultados_tras_matar_un_proceso_del_pool(monkeypatch):
+    configurar_pool(monkeypatch)
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    assert procesamiento_facial.iniciar_pool_deteccion()
+    try:
+        procesamiento_facial.iniciar_sesion()
+        assert esperar_resultado(frame) is not None
+
+        pool_original = procesamiento_facial.pool_procesos
+        matar_procesos_del_pool()
+
+        resultado = esperar_resultado(frame)
+        assert resultado is not None
+        assert resultado["etapa"] == "hog_completo"
+        assert procesamiento_facial.pool_activo()
+        assert procesamiento_facial.pool_procesos is not pool_original
+    finally:
+        procesamiento_facial.detener_pool_deteccion()
+
+def test_sin_reconstrucciones_se_procesa_en_el_hilo(monkeypatch):
+    configurar_pool(monkeypatch)
+    monkeypatch.setattr(procesamiento_facial, "MAX_RECONSTRUCCIONES_POOL", 0)
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    assert procesamiento_facial.iniciar_pool_deteccion()
+    try:
+        procesamiento_facial.iniciar_sesion()
+        assert esperar_resultado(frame) is not None
+
+        matar_procesos_del_pool()
+
+        assert esperar_resultado(frame) is not None
+        assert not procesamiento_facial.pool_activo()
+    finally:
+        procesamiento_facial.detener_pool_deteccion()